@@ -0,0 +1,167 @@
+"""Timing of commands in deployed versions, for comparing their performance"""
+
+from __future__ import annotations
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+
+from karsk.config import BenchmarkConfig, BenchmarksConfig
+from karsk.console import console
+from karsk.paths import Paths
+
+
+class Measurement:
+    """Resource usage of a single run"""
+
+    def __init__(self, wall: float, user: float, maxrss: int) -> None:
+        # Seconds
+        self.wall: float = wall
+        self.user: float = user
+        # Bytes
+        self.maxrss: int = maxrss
+
+
+class Result:
+    """Measurements of a benchmark in a version"""
+
+    def __init__(self, benchmark: str, version: str) -> None:
+        self.benchmark: str = benchmark
+        self.version: str = version
+        self.runs: list[Measurement] = []
+
+    @property
+    def wall(self) -> float:
+        return statistics.median(x.wall for x in self.runs)
+
+    @property
+    def wall_stdev(self) -> float:
+        return (
+            statistics.stdev(x.wall for x in self.runs) if len(self.runs) > 1 else 0.0
+        )
+
+    @property
+    def user(self) -> float:
+        return statistics.median(x.user for x in self.runs)
+
+    @property
+    def maxrss(self) -> int:
+        return max(x.maxrss for x in self.runs)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "benchmark": self.benchmark,
+            "version": self.version,
+            "wall": self.wall,
+            "wall_stdev": self.wall_stdev,
+            "user": self.user,
+            "maxrss": self.maxrss,
+            "runs": [vars(x) for x in self.runs],
+        }
+
+
+def parse_cpus(spec: str) -> set[int]:
+    """Parse a list of CPU ranges, eg. '0-3,8'"""
+    cpus: set[int] = set()
+    for part in spec.split(","):
+        first, _, last = part.strip().partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def measure(command: list[str | Path], cwd: Path, log: Path) -> Measurement:
+    """Run a command to completion and measure its resource usage
+
+    Raises:
+        subprocess.CalledProcessError: If the command fails
+    """
+    with open(log, "wb") as f:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            command, cwd=cwd, stdin=subprocess.DEVNULL, stdout=f, stderr=f
+        )
+        # Unlike getrusage, wait4 gives the usage of this command alone
+        _, status, rusage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, command)
+    return Measurement(wall, rusage.ru_utime, rusage.ru_maxrss * 1024)
+
+
+def _run(paths: Paths, bench: BenchmarkConfig, version: str, tmp: Path) -> Measurement:
+    program, *args = bench.command
+    workdir = tmp / "work"
+    shutil.rmtree(workdir, ignore_errors=True)
+    if bench.inputs is not None:
+        _ = shutil.copytree(bench.inputs, workdir, symlinks=True)
+    else:
+        workdir.mkdir()
+
+    try:
+        return measure(
+            [paths.bin / program, "--version", version, *args], workdir, tmp / "log"
+        )
+    except subprocess.CalledProcessError as exc:
+        output = (tmp / "log").read_text(errors="replace")
+        sys.exit(
+            f"Benchmark '{bench.name}' failed in version {version} with exit code "
+            f"{exc.returncode}:\n{output[-4000:]}"
+        )
+
+
+def run_benchmarks(
+    paths: Paths,
+    config: BenchmarksConfig,
+    versions: list[str],
+    *,
+    repeat: int | None = None,
+) -> list[Result]:
+    """Time every benchmark in each version
+
+    The versions take turns for every repetition, so that changes in the load
+    of the machine over time affect all of them alike.
+    """
+    for version in versions:
+        if not (paths.versions / version).exists():
+            sys.exit(f"No such version: {version}")
+
+    if config.cpus is not None:
+        # Inherited by the benchmarks
+        os.sched_setaffinity(0, parse_cpus(config.cpus))
+
+    results: list[Result] = []
+    with TemporaryDirectory(prefix="karsk-bench-") as tmp:
+        for bench in config.commands:
+            console.log(f"Benchmarking [blue]{bench.name}")
+            for version in versions:
+                for _ in range(config.warmup):
+                    _ = _run(paths, bench, version, Path(tmp))
+
+            bench_results = [Result(bench.name, version) for version in versions]
+            for _ in range(repeat or config.repeat):
+                for result in bench_results:
+                    result.runs.append(_run(paths, bench, result.version, Path(tmp)))
+            results.extend(bench_results)
+    return results
+
+
+def regressions(results: list[Result], threshold: float) -> list[str]:
+    """Benchmarks whose median wall time increased by more than 'threshold'
+    relative to the first version they were run in"""
+    baselines: dict[str, Result] = {}
+    found: list[str] = []
+    for result in results:
+        baseline = baselines.setdefault(result.benchmark, result)
+        change = result.wall / baseline.wall - 1
+        if change > threshold:
+            found.append(
+                f"{result.benchmark} is {change:.1%} slower in {result.version} "
+                f"than in {baseline.version}"
+            )
+    return found
@@ -10,21 +10,26 @@ from pathlib import Path
 import shutil
 import sys
 from tempfile import NamedTemporaryFile, TemporaryDirectory
+from typing import NoReturn
 
+from karsk.checksums import write_checksums
 from karsk.console import console
 from karsk.context import Context
+from karsk.elf import LibrarySearch, PinPlan, split_debug_script
 from karsk.engine import VolumeBind
 from karsk.fetchers import fetch_single
 from karsk.links import make_links
 from karsk.package import Package
 from karsk.paths import Paths
-from karsk.utils import redirect_output
+from karsk.stage import ImageFormat, make_image
+from karsk.utils import directory_size, redirect_output
 from karsk.wrapper import install_wrapper
 
 
 async def _async_build(
     ctx: Context,
     pkg: Package,
+    script: str,
     env: dict[str, str],
     buildlog: io.TextIOWrapper,
     volumes: list[VolumeBind],
@@ -37,13 +42,13 @@ async def _async_build(
             'echo "src: $src"\n',
             'echo "out: $out"\n',
             "set -eux -o pipefail\n",
-            pkg.config.build,
+            script,
         ]
     )
     os.chmod(tmpfile.name, 0o777)
     tmpfile.close()
 
-    volumes.append((tmpfile.name, tmpfile.name, "ro"))
+    volumes = [*volumes, (tmpfile.name, tmpfile.name, "ro")]
 
     proc = await ctx.engine(
         pkg.build_image,
@@ -100,22 +105,24 @@ async def _build(ctx: Context, pkg: Package, tmp: str) -> None:
         )
         return
 
-    print(f"Building {pkg.fullname}...")
+    variant = "" if pkg.variant is None else f" for {pkg.variant}"
+    print(f"Building {pkg.fullname}{variant}...")
     try:
         await fetch_single(ctx, pkg)
     except BaseException:
         if src is not None:
-            shutil.rmtree(src)
+            shutil.rmtree(src, ignore_errors=True)
         shutil.rmtree(out)
         raise
 
+    optflags = "-O3" if pkg.variant is None else f"-O3 -march={pkg.variant}"
     env = {
         **{x.config.name: str(ctx.target_paths.out(x)) for x in pkg.depends},
         "tmp": tmp,
         "out": str(ctx.target_paths.out(pkg)),
-        "CFLAGS": "-O3",
-        "CXXFLAGS": "-O3",
-        "FOPTFLAGS": "-O3",
+        "CFLAGS": optflags,
+        "CXXFLAGS": optflags,
+        "FOPTFLAGS": optflags,
         "MAKEFLAGS": "-j10",
     }
 
@@ -146,38 +153,278 @@ async def _build(ctx: Context, pkg: Package, tmp: str) -> None:
         print(pkg.config.model_dump_json(), file=buildlog)
         print("------ BUILD  LOG ------", file=buildlog)
 
-        if not await _async_build(ctx, pkg, env, buildlog, volumes, cwd):
-            for i in range(1000):
-                fail_path = ctx.staging_paths.store / f"fail-{pkg.fullname}-{i}"
-                if not fail_path.exists():
-                    break
-            else:
-                sys.exit(f"Could not move failed build at {out}")
+        if pkg.config.pgo is not None:
+            profile = await _train_profile(ctx, pkg, env, buildlog, volumes, cwd)
+            env = _with_flags(env, pkg.config.pgo.use_flags.format(profile=profile))
+            volumes = [*volumes, (profile, profile, "ro")]
+            print("------ OPTIMISED BUILD LOG ------", file=buildlog)
+
+        if not await _async_build(
+            ctx, pkg, pkg.config.build, env, buildlog, volumes, cwd
+        ):
+            _fail(ctx, pkg, "Building")
+
+        for step in pkg.config.post_build:
+            print(f"------ {step.upper()} ------", file=buildlog)
+            if step == "pin-libraries":
+                await _pin_libraries(ctx, pkg, env, buildlog, volumes, cwd)
+            elif step == "split-debug":
+                await _split_debug(ctx, pkg, env, buildlog, volumes, cwd)
+
+    write_checksums(out)
+    if (debug := ctx.staging_paths.debug(pkg)).is_dir():
+        write_checksums(debug)
+
+
+def _with_flags(env: dict[str, str], flags: str) -> dict[str, str]:
+    return {
+        **env,
+        **{
+            name: f"{env[name]} {flags}" if name in env else flags
+            for name in ("CFLAGS", "CXXFLAGS", "FOPTFLAGS", "LDFLAGS")
+        },
+    }
 
-            _ = out.rename(fail_path)
-            sys.exit(
-                f"Building {pkg.fullname} failed. Inspect the build at: {fail_path}"
-            )
+
+async def _train_profile(
+    ctx: Context,
+    pkg: Package,
+    env: dict[str, str],
+    buildlog: io.TextIOWrapper,
+    volumes: list[VolumeBind],
+    cwd: Path,
+) -> Path:
+    """Build 'pkg' with instrumentation and run its training script
+
+    Profiles are cached by the package's profile hash, so that they are reused
+    when only its dependencies or the build image change.
+
+    Returns:
+        Path to the profile directory
+    """
+    assert pkg.config.pgo is not None
+    out = ctx.staging_paths.out(pkg)
+    profile = ctx.staging_paths.cache / "pgo" / f"{pkg.profile_hash}-{pkg.fullname}"
+    if (profile / ".complete").is_file():
+        console.log(f"Reusing PGO profile {profile.name}")
+        print(f"Reusing PGO profile {profile}", file=buildlog)
+        return profile
+
+    shutil.rmtree(profile, ignore_errors=True)
+    profile.mkdir(parents=True)
+
+    # The instrumented build must happen in the same source directory as the
+    # optimised one, as GCC names profile data after the object files' paths.
+    # Keep a pristine copy to restore afterwards.
+    src = ctx.staging_paths.src(pkg)
+    pristine = Path(env["tmp"]) / "pgo-pristine"
+    if src is not None and src.is_dir():
+        _ = shutil.copytree(src, pristine, symlinks=True)
+
+    print("------ INSTRUMENTED BUILD LOG ------", file=buildlog)
+    if not await _async_build(
+        ctx,
+        pkg,
+        pkg.config.build,
+        _with_flags(env, pkg.config.pgo.generate_flags.format(profile=profile)),
+        buildlog,
+        [*volumes, (profile, profile, "rw")],
+        cwd,
+    ):
+        _fail(ctx, pkg, "Building instrumented")
+
+    print("------ TRAINING LOG ------", file=buildlog)
+    proc = await ctx.run(
+        "bash",
+        "-c",
+        f"set -eux -o pipefail\n{pkg.config.pgo.train}",
+        package=[],
+        volumes=[*volumes, (profile, profile, "rw")],
+        env=env,
+        cwd=cwd,
+        stdout=PIPE,
+        stderr=PIPE,
+    )
+    returncode, _, _ = await asyncio.gather(
+        proc.wait(),
+        redirect_output(pkg.config.name, proc.stdout, sys.stdout, buildlog),
+        redirect_output(pkg.config.name, proc.stderr, sys.stderr, buildlog),
+    )
+    if returncode != 0:
+        _fail(ctx, pkg, "Training")
+
+    for path in out.iterdir():
+        if path.name == "build.log":
+            continue
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+    if src is not None and pristine.is_dir():
+        shutil.rmtree(src)
+        _ = shutil.move(pristine, src)
+
+    _ = (profile / ".complete").write_text(f"{pkg.buildhash}\n")
+    console.log(f"Recorded PGO profile {profile.name}")
+    return profile
+
+
+async def _pin_libraries(
+    ctx: Context,
+    pkg: Package,
+    env: dict[str, str],
+    buildlog: io.TextIOWrapper,
+    volumes: list[VolumeBind],
+    cwd: Path,
+) -> None:
+    plan = await _plan_rpaths(ctx, pkg, buildlog, volumes, cwd)
+    for path, libs in plan.unresolved.items():
+        message = f"{path}: Unresolved libraries: {', '.join(libs)}"
+        console.log(f"[yellow]{message}[/yellow]")
+        print(message, file=buildlog)
+    if plan.rpaths and not await _async_build(
+        ctx, pkg, plan.script(), env, buildlog, volumes, cwd
+    ):
+        _fail(ctx, pkg, "Pinning libraries of")
+
+
+async def _split_debug(
+    ctx: Context,
+    pkg: Package,
+    env: dict[str, str],
+    buildlog: io.TextIOWrapper,
+    volumes: list[VolumeBind],
+    cwd: Path,
+) -> None:
+    """Strip the binaries of 'pkg' and move their debug info to its debug entry"""
+    out = ctx.staging_paths.out(pkg)
+    debug = ctx.staging_paths.debug(pkg)
+    shutil.rmtree(debug, ignore_errors=True)
+    debug.mkdir()
+
+    script, count = split_debug_script(
+        out, ctx.target_paths.out(pkg), ctx.target_paths.debug(pkg)
+    )
+    if count == 0:
+        debug.rmdir()
+        print("No binaries to strip", file=buildlog)
+        return
+
+    before = directory_size(out)
+    volumes = [*volumes, (debug, ctx.target_paths.debug(pkg), "rw")]
+    if not await _async_build(ctx, pkg, script, env, buildlog, volumes, cwd):
+        _fail(ctx, pkg, "Stripping")
+
+    after = directory_size(out)
+    message = (
+        f"Stripped {count} binaries of {pkg.fullname}: "
+        f"{before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB "
+        f"(saved {(before - after) / 2**20:.1f} MiB), "
+        f"debug info is in {debug.name}"
+    )
+    console.log(message)
+    print(message, file=buildlog)
+
+
+def _fail(ctx: Context, pkg: Package, action: str) -> NoReturn:
+    out = ctx.staging_paths.out(pkg)
+    shutil.rmtree(ctx.staging_paths.debug(pkg), ignore_errors=True)
+    for i in range(1000):
+        fail_path = ctx.staging_paths.store / f"fail-{pkg.fullname}-{i}"
+        if not fail_path.exists():
+            break
+    else:
+        sys.exit(f"Could not move failed build at {out}")
+
+    _ = out.rename(fail_path)
+    sys.exit(f"{action} {pkg.fullname} failed. Inspect the build at: {fail_path}")
+
+
+async def _plan_rpaths(
+    ctx: Context,
+    pkg: Package,
+    buildlog: io.TextIOWrapper,
+    volumes: list[VolumeBind],
+    cwd: Path,
+) -> PinPlan:
+    """Plan the RPATH of every ELF file of 'pkg', given the libraries of its
+    dependencies and of the build image
+
+    The candidate libraries are looked up in the build environment, which is
+    where the store and the system library directories are as in deployment.
+    """
+    library_dirs = [
+        ctx.target_paths.out(x) / libdir
+        for x in [pkg, *pkg.depends]
+        for libdir in ("lib", "lib64")
+    ]
+    search = LibrarySearch(
+        ctx.staging_paths.out(pkg), ctx.target_paths.out(pkg), library_dirs
+    )
+    if not (script := search.probe_script()):
+        return search.plan(set())
+
+    buildlog.flush()
+    proc = await ctx.engine(
+        pkg.build_image,
+        "bash",
+        "-s",
+        cwd=cwd,
+        volumes=volumes,
+        input=script,
+        stdout=PIPE,
+        stderr=buildlog,
+    )
+    stdout, _ = await proc.communicate()
+    if proc.returncode != 0:
+        _fail(ctx, pkg, "Finding the libraries of")
+    return search.plan(set(stdout.decode().splitlines()))
 
 
 async def _build_packages(ctx: Context, stop_after: Package | None = None) -> None:
+    if ctx.variants and ctx.engine.arch != "amd64":
+        sys.exit(f"Variants {', '.join(ctx.variants)} can only be built for amd64")
+
     for pkg in ctx.plist.packages.values():
         with TemporaryDirectory() as tmp:
             await _build(ctx, pkg, tmp)
         if pkg is stop_after:
             console.log(f"Stopping after {pkg.config.name} as requested")
-            break
+            return
+
+    for plist in ctx.variants.values():
+        for pkg in plist.packages.values():
+            with TemporaryDirectory() as tmp:
+                await _build(ctx, pkg, tmp)
 
 
 async def _build_envs(
     ctx: Context,
     paths: Paths,
+    *,
+    image: ImageFormat | None = None,
 ) -> None:
     pkg = ctx.plist.packages[ctx.config.main_package]
     env_path = _get_versions_path(paths, pkg)
-    if env_path is not None:
+    if not env_path.is_dir():
         _build_env_for_package(paths, env_path, pkg)
 
+    # Variants mirror the name of the generic environment, so that the wrapper
+    # can look them up after resolving a version
+    variant_paths: list[Path] = []
+    for variant, plist in ctx.variants.items():
+        variant_path = paths.versions / variant / env_path.name
+        if not variant_path.is_dir():
+            variant_path.parent.mkdir(parents=True, exist_ok=True)
+            _build_env_for_package(
+                paths, variant_path, plist.packages[ctx.config.main_package]
+            )
+        variant_paths.append(variant_path)
+
+    if image is not None:
+        for path in [env_path, *variant_paths]:
+            _ = make_image(paths, path, image)
+
     default_links: dict[str, str] = {"latest": "^", "stable": "latest"}
     make_links(
         links={**default_links, **ctx.config.links},
@@ -202,7 +449,7 @@ def _build_env_for_package(paths: Paths, env_path: Path, main_package: Package)
     _ = (env_path / "manifest").write_text(main_package.manifest)
 
 
-def _get_versions_path(paths: Paths, finalpkg: Package) -> Path | None:
+def _get_versions_path(paths: Paths, finalpkg: Package) -> Path:
     for i in range(1, 1000):
         path = paths.versions / f"{finalpkg.config.version}+{i}"
         if not path.is_dir():
@@ -215,26 +462,36 @@ def _get_versions_path(paths: Paths, finalpkg: Package) -> Path | None:
 
         if finalpkg.manifest == manifest:
             print(f"Environment already exists at {path}", file=sys.stderr)
-            return None
+            return path
 
     sys.exit(
         f"Out of range while trying to find a build number for {finalpkg.config.version}"
     )
 
 
-async def build_all(ctx: Context, stop_after: Package | None = None) -> None:
+async def build_all(
+    ctx: Context,
+    stop_after: Package | None = None,
+    *,
+    image: ImageFormat | None = None,
+) -> None:
     await _build_packages(ctx, stop_after)
     if stop_after is not None:
         return
 
-    await _build_envs(ctx, ctx.staging_paths)
+    await _build_envs(ctx, ctx.staging_paths, image=image)
 
 
-async def install_all(ctx: Context, *, target_paths: Paths | None = None) -> None:
+async def install_all(
+    ctx: Context,
+    *,
+    target_paths: Paths | None = None,
+    image: ImageFormat | None = None,
+) -> None:
     if target_paths is None:
         target_paths = ctx.target_paths
 
-    for pkg in ctx.plist.packages.values():
+    for pkg in ctx.all_packages:
         from_path = ctx.staging_paths.out(pkg)
         to_path = target_paths.out(pkg)
 
@@ -249,4 +506,7 @@ async def install_all(ctx: Context, *, target_paths: Paths | None = None) -> Non
         _ = shutil.copytree(from_path, to_path)
         print(f"Installed {pkg.fullname} to {to_path}")
 
-    await _build_envs(ctx, target_paths)
+        if (debug := ctx.staging_paths.debug(pkg)).is_dir():
+            _ = shutil.copytree(debug, target_paths.debug(pkg))
+
+    await _build_envs(ctx, target_paths, image=image)
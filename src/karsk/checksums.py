@@ -0,0 +1,63 @@
+"""Checksum manifests for store entries
+
+Every store entry contains a manifest of the SHA-256 checksums of its regular
+files, in the format used by 'sha256sum'. The hash of the manifest itself is a
+recursive digest of the entry, which allows remote hosts to verify an entry
+using only coreutils.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+
+
+CHECKSUMS = ".karsk-checksums"
+
+
+def file_hash(path: str | Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(2**20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_checksums(path: Path) -> None:
+    """Write the checksum manifest of a store entry"""
+    files: list[bytes] = []
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            if os.path.islink(full) or not os.path.isfile(full):
+                continue
+            relpath = os.path.join(".", os.path.relpath(full, path))
+            if relpath != f"./{CHECKSUMS}":
+                files.append(os.fsencode(relpath))
+
+    # Sort bytewise to match 'LC_ALL=C sort'
+    with open(path / CHECKSUMS, "wb") as f:
+        for entry in sorted(files):
+            digest = file_hash(os.path.join(path, os.fsdecode(entry)))
+            _ = f.write(digest.encode() + b"  " + entry + b"\n")
+
+
+def read_digest(path: Path) -> str | None:
+    """Recursive digest of a store entry, or None if it has no manifest"""
+    try:
+        return hashlib.sha256((path / CHECKSUMS).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def read_checksums(path: Path) -> dict[str, str]:
+    """Checksums of a store entry, keyed by path relative to the entry"""
+    try:
+        lines = (path / CHECKSUMS).read_text().splitlines()
+    except FileNotFoundError:
+        return {}
+    return {
+        relpath.removeprefix("./"): digest
+        for digest, relpath in (line.split("  ", 1) for line in lines)
+    }
@@ -2,14 +2,18 @@ from __future__ import annotations
 
 import click
 
+from karsk.commands.bench import subcommand_bench
 from karsk.commands.build import subcommand_build
 from karsk.commands.build_wrapper import subcommand_build_wrapper
 from karsk.commands.enter import subcommand_enter
 from karsk.commands.init import subcommand_init
 from karsk.commands.install import subcommand_install
 from karsk.commands.schema import subcommand_schema
+from karsk.commands.stage_local import subcommand_stage_local
+from karsk.commands.status import subcommand_status
 from karsk.commands.sync import subcommand_sync
 from karsk.commands.test import subcommand_test
+from karsk.commands.verify import subcommand_verify
 
 
 @click.group()
@@ -17,14 +21,18 @@ def cli() -> None:
     pass
 
 
+cli.add_command(subcommand_bench)
 cli.add_command(subcommand_build)
 cli.add_command(subcommand_build_wrapper)
 cli.add_command(subcommand_enter)
 cli.add_command(subcommand_init)
 cli.add_command(subcommand_install)
 cli.add_command(subcommand_schema)
+cli.add_command(subcommand_stage_local)
+cli.add_command(subcommand_status)
 cli.add_command(subcommand_sync)
 cli.add_command(subcommand_test)
+cli.add_command(subcommand_verify)
 
 
 if __name__ == "__main__":
@@ -4,6 +4,7 @@ from typing import get_args
 import click
 
 from karsk.engine import CpuArchNameNative, EngineNameNative
+from karsk.stage import ImageFormat
 
 
 argument_config_file = click.argument("config-file", type=Path)
@@ -19,6 +20,12 @@ option_engine = click.option(
     default=None,
     envvar=["KARSK_ENGINE"],
 )
+option_image = click.option(
+    "--image",
+    help="Also pack the environment into a read-only image in images/",
+    type=click.Choice(get_args(ImageFormat)),
+    default=None,
+)
 option_prefix = click.option("--prefix", type=Path)
 option_staging = click.option(
     "--staging", help="Path to staging area", default="./staging", type=Path
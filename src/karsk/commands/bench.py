@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import click
+from rich.table import Table
+
+from karsk.bench import Result, regressions, run_benchmarks
+from karsk.commands._common import argument_config_file, option_prefix
+from karsk.config import load_config
+from karsk.console import console
+from karsk.paths import Paths
+
+
+def bench_table(results: list[Result]) -> Table:
+    """Results of each benchmark, relative to the first version it was run in"""
+    table = Table(
+        "Benchmark",
+        "Version",
+        "Wall",
+        "User",
+        "Max RSS",
+        "Change",
+        title="Benchmarks",
+    )
+    baselines: dict[str, Result] = {}
+    for result in results:
+        baseline = baselines.setdefault(result.benchmark, result)
+        change = result.wall / baseline.wall - 1
+        table.add_row(
+            result.benchmark,
+            result.version,
+            f"{result.wall:.3f}s ± {result.wall_stdev:.3f}",
+            f"{result.user:.3f}s",
+            f"{result.maxrss / 2**20:.1f} MiB",
+            "-"
+            if result is baseline
+            else f"[{'red' if change > 0 else 'green'}]{change:+.1%}",
+        )
+    return table
+
+
+@click.command("bench", help="Compare the performance of versions")
+@argument_config_file
+@click.argument("versions", nargs=-1, required=True)
+@option_prefix
+@click.option(
+    "--repeat",
+    help="Number of timed runs, instead of 'repeat' in the config",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--threshold",
+    help="Largest allowed slowdown relative to the first version, as a fraction",
+    type=click.FloatRange(min=0),
+)
+@click.option("--json", "json_path", help="Write the results to a file", type=Path)
+def subcommand_bench(
+    config_file: Path,
+    versions: tuple[str, ...],
+    prefix: Path | None,
+    repeat: int | None,
+    threshold: float | None,
+    json_path: Path | None,
+) -> None:
+    config = load_config(config_file)
+    if config.benchmarks is None:
+        sys.exit(f"Config file '{config_file}' doesn't have a 'benchmarks' field")
+    if threshold is None:
+        threshold = config.benchmarks.threshold
+
+    paths = Paths(prefix or config.destination)
+    results = run_benchmarks(paths, config.benchmarks, list(versions), repeat=repeat)
+    console.print(bench_table(results))
+
+    found = regressions(results, threshold)
+    if json_path is not None:
+        _ = json_path.write_text(
+            json.dumps(
+                {
+                    "versions": versions,
+                    "threshold": threshold,
+                    "results": [x.to_json() for x in results],
+                    "regressions": found,
+                },
+                indent=2,
+            )
+        )
+
+    if found:
+        sys.exit("Performance regressions:\n" + "\n".join(found))
@@ -10,11 +10,13 @@ from karsk.commands._common import (
     argument_config_file,
     option_arch,
     option_engine,
+    option_image,
     option_staging,
 )
 from karsk.context import Context
 from karsk.engine import CpuArchNameNative, EngineNameNative
 from karsk.package import Package
+from karsk.stage import ImageFormat
 
 
 @click.command("build", help="Build selected package and dependencies")
@@ -22,6 +24,7 @@ from karsk.package import Package
 @option_staging
 @option_arch
 @option_engine
+@option_image
 @click.option("--package", help="Build until a given package and then stop")
 def subcommand_build(
     config_file: Path,
@@ -29,6 +32,7 @@ def subcommand_build(
     engine: EngineNameNative | None,
     package: str | None,
     arch: CpuArchNameNative,
+    image: ImageFormat | None,
 ) -> None:
     context = Context.from_config_file(
         config_file, staging=staging, engine=engine, arch=arch
@@ -38,4 +42,4 @@ def subcommand_build(
     if package is not None:
         stop_after = context[package]
 
-    asyncio.run(build_all(context, stop_after))
+    asyncio.run(build_all(context, stop_after, image=image))
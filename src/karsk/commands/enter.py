@@ -69,14 +69,13 @@ async def _main(ctx: Context, *args: str, volumes: tuple[VolumeBind, ...]) -> No
         *args,
         volumes=[
             (KARSK_BASHRC, "/etc/karsk.bashrc", "ro"),
-            (ctx.staging_paths.bin, ctx.target_paths.bin, "ro"),
-            (ctx.staging_paths.versions, ctx.target_paths.versions, "ro"),
             (home, home, "rw"),
             *volumes,
         ],
         env={"KARSK_PATH": str(ctx.target_paths.bin)},
         cwd=cwd,
         terminal=True,
+        whole_store=True,
     )
     sys.exit(await proc.wait())
 
@@ -9,20 +9,24 @@ from karsk.builder import install_all
 from karsk.commands._common import (
     argument_config_file,
     option_engine,
+    option_image,
     option_staging,
 )
 from karsk.context import Context
 from karsk.engine import EngineName
+from karsk.stage import ImageFormat
 
 
 @click.command("install", help="Install built packages to the destination path")
 @argument_config_file
 @option_staging
 @option_engine
+@option_image
 def subcommand_install(
     config_file: Path,
     staging: Path,
     engine: EngineName | None,
+    image: ImageFormat | None,
 ) -> None:
     context = Context.from_config_file(config_file, staging=staging, engine=engine)
-    asyncio.run(install_all(context))
+    asyncio.run(install_all(context, image=image))
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import click
+
+from karsk.commands._common import argument_config_file
+from karsk.config import load_config
+from karsk.console import console
+from karsk.paths import Paths
+from karsk.stage import stage_local
+
+
+@click.command("stage-local", help="Copy a version onto node-local storage")
+@argument_config_file
+@click.argument("version")
+@click.option(
+    "--to",
+    help="Directory to stage the version in (eg: /dev/shm/karsk)",
+    type=Path,
+    required=True,
+)
+@click.option(
+    "--variant",
+    help="Stage the build for this variant (eg: x86-64-v3)",
+    default=None,
+)
+@click.option(
+    "--squashfs",
+    help="Pack the staged version into a SquashFS image",
+    is_flag=True,
+    default=False,
+)
+def subcommand_stage_local(
+    config_file: Path, version: str, to: Path, variant: str | None, squashfs: bool
+) -> None:
+    config = load_config(config_file)
+    path = stage_local(
+        Paths(config.destination), version, to, variant=variant, squashfs=squashfs
+    )
+    console.log(f"Staged to {path}")
+    if not squashfs:
+        console.log(f"Set [blue]KARSK_LOCAL_VERSIONS={to.absolute()}[/blue] to use it")
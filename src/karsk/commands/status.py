@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+import hashlib
+from pathlib import Path
+import shlex
+
+import click
+from rich.table import Table
+
+from karsk.commands._common import (
+    argument_areas_file,
+    argument_config_file,
+    option_staging,
+)
+from karsk.commands.sync import Sync
+from karsk.config import AreaConfig, load_areas
+from karsk.console import console
+from karsk.context import Context
+from karsk.paths import Paths
+
+
+def _inventory_script(paths: Paths) -> str:
+    base = shlex.quote(str(paths.store.parent))
+    return f"""\
+cd {base} 2>/dev/null || exit 0
+for entry in store/*; do
+    [ -e "$entry" ] && echo "store ${{entry#store/}}"
+done
+for path in versions/*; do
+    name=${{path#versions/}}
+    if [ -L "$path" ]; then
+        echo "link $name $(readlink "$path")"
+    elif [ -f "$path/manifest" ]; then
+        echo "version $name $(sha256sum < "$path/manifest" | cut -d' ' -f1)"
+    fi
+done
+"""
+
+
+class Inventory:
+    """Store entries, environments and version links present at a location"""
+
+    def __init__(self, output: str) -> None:
+        self.store: set[str] = set()
+        self.versions: dict[str, str] = {}
+        self.links: dict[str, str] = {}
+
+        for line in output.splitlines():
+            kind, name, *rest = line.split(" ", 2)
+            if kind == "store":
+                self.store.add(name)
+            elif kind == "version":
+                self.versions[name] = rest[0]
+            elif kind == "link":
+                self.links[name] = rest[0]
+
+
+async def _query_local(script: str) -> str:
+    proc = await asyncio.create_subprocess_exec(
+        "bash",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    stdout, _ = await proc.communicate(script.encode())
+    return stdout.decode(errors="replace")
+
+
+async def gather_status(
+    ctx: Context, areas: list[AreaConfig]
+) -> dict[str, Inventory | BaseException]:
+    """Gather the inventory of staging, destination and every area concurrently"""
+    async with Sync(ctx) as syncer:
+        script = _inventory_script(ctx.target_paths)
+        results = await asyncio.gather(
+            _query_local(_inventory_script(ctx.staging_paths)),
+            _query_local(script),
+            *(syncer.query(area, script) for area in areas),
+            return_exceptions=True,
+        )
+
+    names = ["staging", "destination", *(area.name for area in areas)]
+    return {
+        name: Inventory(result) if isinstance(result, str) else result
+        for name, result in zip(names, results)
+    }
+
+
+def status_table(
+    ctx: Context, inventories: dict[str, Inventory | BaseException]
+) -> Table:
+    """Compare every location against the config and destination
+
+    Cells are '✓' if present and up-to-date, '✗' if missing and '~' if a
+    version link points somewhere else than in destination.
+    """
+    table = Table("Item", *inventories, title="Deployment status")
+    reference = inventories["destination"]
+    columns = list(inventories.values())
+
+    def row(item: str, cell: Callable[[Inventory], str]) -> None:
+        table.add_row(
+            item,
+            *(
+                "[red]error" if isinstance(inv, BaseException) else cell(inv)
+                for inv in columns
+            ),
+        )
+
+    for pkg in ctx.packages.values():
+        entry = ctx.target_paths.out(pkg).name
+
+        def stored(inv: Inventory, entry: str = entry) -> str:
+            return "✓" if entry in inv.store else "[red]✗"
+
+        row(f"store {pkg.fullname}", stored)
+
+    manifest = ctx.packages[ctx.config.main_package].manifest
+    digest = hashlib.sha256(manifest.encode()).hexdigest()
+    row(
+        "environment",
+        lambda inv: next(
+            (name for name, value in inv.versions.items() if value == digest),
+            "[red]✗",
+        ),
+    )
+
+    if isinstance(reference, Inventory):
+        for link, target in sorted(reference.links.items()):
+
+            def linked(inv: Inventory, link: str = link, target: str = target) -> str:
+                if link not in inv.links:
+                    return "[red]✗"
+                if inv.links[link] == target:
+                    return "✓"
+                return f"[yellow]~ {inv.links[link]}"
+
+            row(f"link {link}", linked)
+
+        def extra(inv: Inventory) -> str:
+            count = len(inv.store - reference.store) + len(
+                inv.versions.keys() - reference.versions.keys()
+            )
+            return f"[yellow]{count}" if count else "0"
+
+        row("extra", extra)
+
+    return table
+
+
+@click.command("status", help="Show what is deployed where")
+@argument_config_file
+@argument_areas_file
+@option_staging
+def subcommand_status(config_file: Path, areas_file: Path, staging: Path) -> None:
+    ctx = Context.from_config_file(config_file, staging=staging, engine="native")
+    areas = load_areas(areas_file)
+    console.print(status_table(ctx, asyncio.run(gather_status(ctx, areas))))
@@ -1,24 +1,89 @@
 from __future__ import annotations
 
+import heapq
 import io
+import json
+from itertools import cycle
 import os
 import shlex
 import subprocess
 import sys
+import time
 import asyncio
+from collections.abc import Iterator
 from pathlib import Path
+from stat import S_ISREG
+from tempfile import TemporaryDirectory
+from typing import Self
 
 import click
+from rich.table import Table
 
+from karsk.checksums import CHECKSUMS, read_digest
 from karsk.commands._common import (
     argument_areas_file,
     argument_config_file,
     option_staging,
 )
 from karsk.config import AreaConfig, load_areas
+from karsk.console import console
 from karsk.context import Context
 from karsk.paths import Paths
-from karsk.utils import redirect_output
+from karsk.utils import directory_size, redirect_output
+
+
+class SyncJournal:
+    """Record of the phases that have completed for each area
+
+    If 'path' is set, the journal is persisted so that a later sync can resume
+    where this one failed. A persisted journal is only resumed if it was
+    written for the same environment.
+    """
+
+    def __init__(
+        self, manifest: str, path: Path | None = None, *, resume: bool = False
+    ) -> None:
+        self._manifest: str = manifest
+        self._path: Path | None = path
+        self._areas: dict[str, list[str]] = {}
+        # Whether this continues a previous sync that failed
+        self.resumed: bool = False
+
+        if resume and path is not None and path.is_file():
+            data = json.loads(path.read_text())
+            if data["manifest"] == manifest:
+                self._areas = data["areas"]
+                self.resumed = True
+
+    def is_done(self, area: AreaConfig, phase: str) -> bool:
+        return phase in self._areas.get(area.name, [])
+
+    def mark_done(self, area: AreaConfig, phase: str) -> None:
+        self._areas.setdefault(area.name, []).append(phase)
+        if self._path is None:
+            return
+
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        _ = self._path.write_text(
+            json.dumps({"manifest": self._manifest, "areas": self._areas}, indent=2)
+        )
+
+
+class TransferPlan:
+    """Estimate of what a sync would transfer to an area"""
+
+    def __init__(
+        self, entries: int, files: int, nbytes: int, throughput: float
+    ) -> None:
+        self.entries: int = entries
+        self.files: int = files
+        self.nbytes: int = nbytes
+        self.throughput: float = throughput
+
+    @property
+    def eta(self) -> float:
+        """Estimated transfer time in seconds"""
+        return self.nbytes / self.throughput if self.throughput else 0.0
 
 
 class Sync:
@@ -31,21 +96,47 @@ class Sync:
         "-oConnectTimeout=20",
     ]
 
+    # Share a single SSH connection per host for the lifetime of a sync
+    MULTIPLEX: bool = True
+
+    # Number of bytes to send when measuring the throughput to an area
+    PROBE_BYTES: int = 8 * 2**20
+
     def __init__(
         self,
         ctx: Context,
         *,
-        dry_run: bool = False,
         from_staging: bool = False,
+        journal: SyncJournal | None = None,
+        debug: bool = False,
     ) -> None:
-        self._dry_run: bool = dry_run
+        self.journal: SyncJournal = journal or SyncJournal(
+            ctx.packages[ctx.config.main_package].manifest
+        )
+        self._control_dir: TemporaryDirectory[str] | None = None
+        self._hosts: set[str] = set()
+        # Probes run one at a time so that they don't share the bandwidth of
+        # this host and underestimate the throughput to each area
+        self._probe_lock: asyncio.Lock = asyncio.Lock()
 
         self.from_paths: Paths = ctx.staging_paths if from_staging else ctx.target_paths
         self.to_paths: Paths = ctx.target_paths
 
         self._store_paths: list[Path] = [
-            ctx.target_paths.out(pkg) for pkg in ctx.packages.values()
+            ctx.target_paths.out(pkg) for pkg in ctx.all_packages
         ]
+        self._package_names: dict[str, str] = {
+            path.name: pkg.config.name
+            for path, pkg in zip(self._store_paths, ctx.all_packages)
+        }
+        self._variants: list[str] = list(ctx.variants)
+        if debug:
+            # Debug info split off at build time is only transferred on request
+            self._store_paths.extend(
+                ctx.target_paths.debug(pkg)
+                for pkg in ctx.packages.values()
+                if self.from_paths.debug(pkg).is_dir()
+            )
 
         self._env_paths: list[Path] = [
             path.parent
@@ -53,56 +144,400 @@ class Sync:
             if not path.parent.is_symlink()
             if ctx.packages[ctx.config.main_package].manifest == path.read_text()
         ]
+        # Variant environments are in subdirectories (eg. versions/x86-64-v3)
+        self._env_paths.extend(
+            path
+            for variant in ctx.variants
+            if (path := self.from_paths.versions / variant).is_dir()
+        )
+        self._image_paths: list[Path] = [
+            image
+            for path in self._env_paths
+            for image in self.from_paths.images.glob(f"{path.name}.*")
+        ]
+        # As are the images of variants (eg. images/x86-64-v3/1.0.2+2.squashfs)
+        self._image_paths.extend(
+            path
+            for variant in ctx.variants
+            if (path := self.from_paths.images / variant).is_dir()
+        )
 
         # Create preliminary script
         self._pre_script: io.StringIO = io.StringIO()
         _ = self._pre_script.write("set -euxo pipefail\n")
-        _ = self._pre_script.write(f"mkdir -p {self.to_paths.store}\n")
+        _ = self._pre_script.write(f"mkdir -p {self._partial_store}\n")
         _ = self._pre_script.write(f"mkdir -p {self.to_paths.versions}\n")
+        if self._image_paths:
+            _ = self._pre_script.write(f"mkdir -p {self.to_paths.images}\n")
+        _ = self._pre_script.write(f"ls -1t {self.to_paths.store}\n")
 
         # Create symlinking script
         self._post_script: io.StringIO = io.StringIO()
         _ = self._post_script.write("set -euxo pipefail\n")
+        # Swap links atomically, so that they always exist for running jobs
         self._post_script.writelines(
-            f"ln -sfn {os.readlink(path)} {path} \n"
+            f"ln -sfn {os.readlink(path)} {path.with_name(f'.{path.name}.tmp')}\n"
+            f"mv -Tf {path.with_name(f'.{path.name}.tmp')} {path}\n"
             for path in self.from_paths.versions.glob("*")
             if path.is_symlink()
             if (path / "manifest").is_file()
         )
 
-    async def sync_to(self, area: AreaConfig) -> None:
-        # Ensure directories are created
-        await self._bash(area, self._pre_script.getvalue(), context="prescript")
+    @property
+    def _partial_store(self) -> Path:
+        """Hidden directory on areas that store entries are transferred to with
+        rsync before being moved into place. Partially transferred entries are
+        kept here so that a later sync can resume them."""
+        return self.to_paths.store / ".partial"
 
-        # 2. Sync store/
-        await self._rsync(
-            area,
-            self._store_paths,
-            self.from_paths.store,
-            context="store",
+    async def __aenter__(self) -> Self:
+        if self.MULTIPLEX:
+            self._control_dir = TemporaryDirectory(prefix="karsk-ssh-")
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        if self._control_dir is None:
+            return
+
+        # Stop the master connections before removing their sockets
+        for host in self._hosts:
+            proc = await asyncio.create_subprocess_exec(
+                *self.rsh,
+                "-Oexit",
+                host,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            _ = await proc.wait()
+
+        self._control_dir.cleanup()
+        self._control_dir = None
+        self._hosts.clear()
+
+    @property
+    def rsh(self) -> list[str]:
+        """SSH command to connect to areas from this host"""
+        if self._control_dir is None:
+            return self.RSH
+        return [
+            *self.RSH,
+            "-oControlMaster=auto",
+            f"-oControlPath={self._control_dir.name}/%C",
+            "-oControlPersist=60",
+        ]
+
+    async def sync_to(
+        self, area: AreaConfig, relay: AreaConfig | None = None, *, retry: bool = False
+    ) -> None:
+        """Synchronise a single area
+
+        Args:
+            area: Area to synchronise
+            relay: Already synchronised area to transfer the data from. If
+                None, the data is transferred from this host.
+            retry: Whether a previous attempt failed. Store entries are then
+                transferred with rsync even if the area uses tar, so that
+                partially transferred files are resumed.
+        """
+        # 1. Ensure directories are created and list the remote store
+        listing = await self._bash(
+            area, self._pre_script.getvalue(), context="prescript", capture=True
         )
 
+        # 2. Sync store/. Entries are immutable and named by their buildhash, so
+        # we only need to transfer those that are missing on the area.
+        present = set(listing.splitlines())
+        store_paths = [path for path in self._store_paths if path.name not in present]
+        if not self.journal.is_done(area, "store"):
+            if not store_paths:
+                print(f"{area.name} 'store'> Nothing to transfer")
+            # Unlike rsync --partial, tar starts over after a failure
+            elif area.transport == "tar" and not (retry or self.journal.resumed):
+                await self._tar(area, store_paths, relay=relay, context="store")
+            else:
+                # Hardlink unchanged files from the newest build of the same package
+                bases = self._find_bases(store_paths, listing.splitlines())
+                if fresh := [path for path in store_paths if path not in bases]:
+                    await self._rsync(
+                        area,
+                        fresh,
+                        self.from_paths.store,
+                        dest=self._partial_store,
+                        relay=relay,
+                        context="store",
+                    )
+                if bases:
+                    await self._rsync_linked(area, bases, relay=relay)
+                store = shlex.quote(str(self.to_paths.store))
+                partial = shlex.quote(str(self._partial_store))
+                await self._bash(
+                    area,
+                    "set -euxo pipefail\n"
+                    + "".join(
+                        f"[ -e {store}/{name} ] || mv -T {partial}/{name} {store}/{name}\n"
+                        for name in (shlex.quote(path.name) for path in store_paths)
+                    ),
+                    context="store",
+                )
+            self.journal.mark_done(area, "store")
+
         # 3. Sync environments (eg. versions/1.0.2+2)
-        await self._rsync(
+        if not self.journal.is_done(area, "versions"):
+            await self._rsync(
+                area,
+                self._env_paths,
+                self.from_paths.versions,
+                relay=relay,
+                context="versions",
+            )
+            self.journal.mark_done(area, "versions")
+
+        # 4. Sync environment images (eg. images/1.0.2+2.squashfs)
+        if self._image_paths and not self.journal.is_done(area, "images"):
+            await self._rsync(
+                area,
+                self._image_paths,
+                self.from_paths.images,
+                relay=relay,
+                context="images",
+            )
+            self.journal.mark_done(area, "images")
+
+        # 5. Sync all symlinks
+        await self._bash(area, self._post_script.getvalue(), context="symlinks")
+        self.journal.mark_done(area, "symlinks")
+
+    async def plan(
+        self, area: AreaConfig, relay: AreaConfig | None = None
+    ) -> TransferPlan:
+        """Compute what 'sync_to' would transfer, without modifying the area
+
+        Only regular files are counted, as directories and symlinks carry no
+        data. Files of a store entry that rsync would hardlink from its
+        link-dest basis on the area aren't counted either.
+        """
+        store = shlex.quote(str(self.to_paths.store))
+        listing = await self._bash(
             area,
-            self._env_paths,
-            self.from_paths.versions,
-            context="versions",
+            f"ls -1t {store} 2>/dev/null | sed 's|^|store/|'\n"
+            + "".join(
+                f"(cd {shlex.quote(str(parent))} && find . -mindepth 1 -maxdepth 2) "
+                f"2>/dev/null | sed 's|^\\./|{parent.name}/|'\n"
+                for parent in (self.to_paths.versions, self.to_paths.images)
+            ),
+            context="plan",
+            capture=True,
         )
+        present = set(listing.splitlines())
 
-        # 4. Sync all symlinks
-        await self._bash(area, self._post_script.getvalue(), context="symlinks")
+        store_paths = [
+            path for path in self._store_paths if f"store/{path.name}" not in present
+        ]
+        bases: dict[Path, str] = {}
+        if area.transport != "tar" or self.journal.resumed:
+            bases = self._find_bases(
+                store_paths,
+                [
+                    line.removeprefix("store/")
+                    for line in listing.splitlines()
+                    if line.startswith("store/")
+                ],
+            )
+        linked = await self._list_bases(area, set(bases.values()))
+
+        # Variants are transferred as a directory of environments or images,
+        # of which only those missing on the area count
+        def entries(paths: list[Path], parent: str) -> list[Path]:
+            return [
+                entry
+                for path in paths
+                for entry in (
+                    sorted(path.iterdir()) if path.name in self._variants else [path]
+                )
+                if f"{parent}/{entry.relative_to(path.parent)}" not in present
+            ]
+
+        transfers: list[tuple[Path, dict[str, tuple[int, int]]]] = [
+            *(
+                (self.from_paths.store / path.name, linked.get(bases.get(path, ""), {}))
+                for path in store_paths
+            ),
+            *((path, {}) for path in entries(self._env_paths, "versions")),
+            *((path, {}) for path in entries(self._image_paths, "images")),
+        ]
+
+        files = 0
+        nbytes = 0
+        for path, unchanged in transfers:
+            for relpath, stat in _regular_files(path):
+                if unchanged.get(relpath) == (stat.st_size, int(stat.st_mtime)):
+                    continue
+                files += 1
+                nbytes += stat.st_size
+
+        return TransferPlan(
+            entries=len(transfers),
+            files=files,
+            nbytes=nbytes,
+            throughput=await self._probe(area, relay) if transfers else 0.0,
+        )
+
+    async def _list_bases(
+        self, area: AreaConfig, bases: set[str]
+    ) -> dict[str, dict[str, tuple[int, int]]]:
+        """List the size and modification time of the files of store entries
+
+        rsync hardlinks a file from its link-dest basis when both of these
+        match, unless told to compare checksums.
+
+        Returns:
+            The size and modification time in whole seconds of every regular
+            file of each entry, by its path relative to the entry
+        """
+        linked: dict[str, dict[str, tuple[int, int]]] = {basis: {} for basis in bases}
+        if not bases:
+            return linked
+
+        output = await self._bash(
+            area,
+            shlex.join(
+                [
+                    "find",
+                    *(str(self.to_paths.store / basis) for basis in sorted(bases)),
+                    "-type",
+                    "f",
+                    "-printf",
+                    "%H\\t%P\\t%s\\t%T@\\n",
+                ]
+            ),
+            context="plan",
+            capture=True,
+        )
+        for line in output.splitlines():
+            root, relpath, size, mtime = line.split("\t")
+            linked[Path(root).name][relpath] = (int(size), int(float(mtime)))
+        return linked
+
+    async def _probe(self, area: AreaConfig, relay: AreaConfig | None) -> float:
+        """Measure the throughput to an area in bytes per second
+
+        Only one probe runs at a time, even when planning several areas at once.
+        """
+        script = (
+            f"head -c {self.PROBE_BYTES} /dev/zero | "
+            f"{shlex.join([*(self.RSH if relay else self.rsh), area.host, 'cat > /dev/null'])}\n"
+        )
+
+        async with self._probe_lock:
+            start = time.monotonic()
+            if relay is None:
+                self._hosts.add(area.host)
+                await self._check_call(area, "bash", input=script, context="probe")
+            else:
+                await self._bash(
+                    area, script, host=relay.host, context=f"probe via {relay.name}"
+                )
+            return self.PROBE_BYTES / max(time.monotonic() - start, 1e-3)
+
+    async def query(self, area: AreaConfig, script: str) -> str:
+        """Run a read-only bash script on an area and return its output"""
+        return await self._bash(area, script, context="query", capture=True)
+
+    async def verify(self, area: AreaConfig) -> list[str]:
+        """Verify the store entries on an area against their checksum manifests
+
+        Entries are hashed concurrently on the area, as many at a time as it
+        has CPUs. Only entries whose recursive digest doesn't match are checked
+        file by file. Entries that were built without a checksum manifest
+        can't be verified, and are reported in a warning.
+
+        Returns:
+            A list of problems found. Empty if every entry is intact.
+        """
+        script = io.StringIO()
+        _ = script.write(f"""\
+check() {{
+    cd "$1" 2>/dev/null || {{ echo "$2: missing"; return; }}
+    actual=$(find . -type f ! -path ./{CHECKSUMS} -print0 | LC_ALL=C sort -z | xargs -0 -r sha256sum | sha256sum)
+    [ "${{actual%% *}}" = "$3" ] && return
+    echo "$2: corrupt"
+    sha256sum -c --quiet {CHECKSUMS} 2>&1 | sed "s|^|$2: |"
+}}
+export -f check
+printf '%s\\0' \\
+""")
+        unverified: list[str] = []
+        for path in self._store_paths:
+            digest = read_digest(self.from_paths.store / path.name)
+            if digest is None:
+                unverified.append(path.name)
+                continue
+            _ = script.write(f"  {shlex.join([str(path), path.name, digest])} \\\n")
+        _ = script.write(
+            """  | xargs -0 -r -n 3 -P "$(nproc)" bash -c 'check "$@"' check\n"""
+        )
+
+        if unverified:
+            console.log(
+                f"[yellow]{area.name}: {len(unverified)} store entries have no "
+                f"checksums and are unverified: {', '.join(unverified)}"
+            )
+        if len(unverified) == len(self._store_paths):
+            return []
+
+        output = await self._bash(
+            area, script.getvalue(), context="verify", capture=True
+        )
+        return output.splitlines()
+
+    def _find_bases(self, paths: list[Path], listing: list[str]) -> dict[Path, str]:
+        """Find the newest existing store entry of the same package as each path
+
+        Args:
+            paths: Store entries to be transferred
+            listing: Store entries present on the area, newest first
+        """
+        names = set(self._package_names.values())
+
+        def package_of(entry: str) -> str | None:
+            # Store entries are named '<buildhash>-<name>-<version>'. Pick the
+            # longest match in case package names are prefixes of each other.
+            if entry.endswith(".debug"):
+                return None
+            _, _, fullname = entry.partition("-")
+            matches = [name for name in names if fullname.startswith(f"{name}-")]
+            return max(matches, key=len, default=None)
+
+        newest: dict[str, str] = {}
+        for entry in listing:
+            if (name := package_of(entry)) is not None:
+                _ = newest.setdefault(name, entry)
+
+        return {
+            path: newest[name]
+            for path in paths
+            if (name := self._package_names.get(path.name)) in newest
+        }
 
     async def _bash(
-        self, area: AreaConfig, script: str, *, context: str | None = None
-    ) -> None:
-        await self._check_call(
+        self,
+        area: AreaConfig,
+        script: str,
+        *,
+        host: str | None = None,
+        context: str | None = None,
+        capture: bool = False,
+    ) -> str:
+        host = host or area.host
+        self._hosts.add(host)
+        return await self._check_call(
             area,
-            *self.RSH,
-            area.host,
+            *self.rsh,
+            host,
             "bash",
             input=script,
             context=context,
+            capture=capture,
         )
 
     async def _rsync(
@@ -111,20 +546,184 @@ class Sync:
         paths: list[Path],
         parent: Path,
         *,
+        dest: Path | None = None,
+        relay: AreaConfig | None = None,
         context: str | None = None,
     ) -> None:
-        await self._check_call(
-            area,
+        if area.streams == 1 or len(paths) == 1:
+            await self._rsync_stream(
+                area, paths, parent, dest=dest, relay=relay, context=context
+            )
+            return
+
+        sizes = {path: directory_size(parent / path.name) for path in paths}
+        await asyncio.gather(
+            *(
+                self._rsync_stream(
+                    area,
+                    shard,
+                    parent,
+                    dest=dest,
+                    relay=relay,
+                    context=f"{context}[{index}]",
+                    nbytes=sum(sizes[path] for path in shard),
+                )
+                for index, shard in enumerate(_balance(sizes, area.streams))
+            )
+        )
+
+    async def _rsync_linked(
+        self,
+        area: AreaConfig,
+        bases: dict[Path, str],
+        *,
+        relay: AreaConfig | None = None,
+    ) -> None:
+        """Transfer store entries, hardlinking unchanged files from their basis
+
+        rsync takes a single --link-dest for all of its sources, so every entry
+        is transferred by its own rsync, up to 'area.streams' at a time.
+        """
+        streams = asyncio.Semaphore(area.streams)
+
+        async def transfer(path: Path, basis: str) -> None:
+            async with streams:
+                await self._rsync_stream(
+                    area,
+                    [path],
+                    self.from_paths.store,
+                    dest=self._partial_store,
+                    link_dest=self.to_paths.store / basis,
+                    relay=relay,
+                    context=f"store {path.name}",
+                )
+
+        await asyncio.gather(*(transfer(path, basis) for path, basis in bases.items()))
+
+    async def _rsync_stream(
+        self,
+        area: AreaConfig,
+        paths: list[Path],
+        parent: Path,
+        *,
+        dest: Path | None = None,
+        link_dest: Path | None = None,
+        relay: AreaConfig | None = None,
+        context: str | None = None,
+        nbytes: int | None = None,
+    ) -> None:
+        if relay is not None:
+            # The relay has the same layout as the area, so transfer from its
+            # copy in the destination
+            parent = {
+                self.from_paths.store: self.to_paths.store,
+                self.from_paths.versions: self.to_paths.versions,
+                self.from_paths.images: self.to_paths.images,
+            }[parent]
+            paths = [parent / path.name for path in paths]
+        if dest is None:
+            dest = parent
+
+        options: list[str] = []
+        sources: list[str | Path] = [*paths]
+        target = f"{area.host}:{dest}"
+        if link_dest is not None:
+            # rsync looks up files in the basis by their relative path, so
+            # transfer the contents of the entry into a directory of its name
+            (path,) = paths
+            options.append(f"--link-dest={link_dest}")
+            sources = [f"{path}/"]
+            target = f"{area.host}:{dest / path.name}/"
+
+        args: list[str | Path] = [
             "rsync",
             "-a",
             "--rsh",
-            shlex.join(self.RSH),
+            shlex.join(self.RSH if relay else self.rsh),
             "--progress",
-            *paths,
-            f"{area.host}:{parent}",
-            context=context,
+            "--partial",
+            *options,
+            *(() if area.bwlimit is None else ("--bwlimit", area.bwlimit)),
+            *(
+                ()
+                if area.compress is None
+                else ("-z", f"--compress-choice={area.compress}")
+            ),
+            *sources,
+            target,
+        ]
+
+        start = time.monotonic()
+        if relay is None:
+            self._hosts.add(area.host)
+            await self._check_call(area, *args, context=context)
+        else:
+            await self._bash(
+                area,
+                shlex.join(map(str, args)),
+                host=relay.host,
+                context=f"{context} via {relay.name}",
+            )
+
+        if nbytes is not None:
+            elapsed = time.monotonic() - start
+            print(
+                f"{area.name} {context!r}> Transferred {len(paths)} entries "
+                f"({nbytes / 2**20:.1f} MiB) in {elapsed:.1f}s "
+                f"({nbytes / 2**20 / max(elapsed, 1e-3):.1f} MiB/s)"
+            )
+
+    async def _tar(
+        self,
+        area: AreaConfig,
+        paths: list[Path],
+        *,
+        relay: AreaConfig | None = None,
+        context: str | None = None,
+    ) -> None:
+        """Stream store entries to an area as a single tar archive
+
+        Entries are extracted to a hidden directory on the area and then
+        renamed into place, so that an interrupted transfer never leaves a
+        partial entry in the store.
+        """
+        store = shlex.quote(str(self.to_paths.store))
+        compress, decompress = _TAR_COMPRESSORS[area.compress or "zstd"]
+
+        # The archive follows the script on the remote shell's standard input.
+        # bash reads a script from a pipe no further than the command it runs,
+        # so everything is wrapped in a function that consumes the rest.
+        remote_script = f"""\
+set -euo pipefail
+receive() {{
+    tmp=$(mktemp -d {store}/.incoming-XXXXXX)
+    trap 'rm -rf "$tmp"' EXIT
+    {decompress} | tar -C "$tmp" -xf -
+    for entry in "$tmp"/*; do
+        dst={store}/"${{entry##*/}}"
+        [ -e "$dst" ] || mv -T "$entry" "$dst"
+    done
+}}
+receive
+"""
+
+        source = self.from_paths.store if relay is None else self.to_paths.store
+        script = (
+            "set -euo pipefail\n"
+            f"{{ printf %s {shlex.quote(remote_script)}\n"
+            f"tar -C {shlex.quote(str(source))} -cf - "
+            f"{shlex.join(path.name for path in paths)} | {compress}; }} | "
+            f"{shlex.join([*(self.RSH if relay else self.rsh), area.host, 'bash'])}\n"
         )
 
+        if relay is None:
+            self._hosts.add(area.host)
+            await self._check_call(area, "bash", input=script, context=context)
+        else:
+            await self._bash(
+                area, script, host=relay.host, context=f"{context} via {relay.name}"
+            )
+
     async def _check_call(
         self,
         area: AreaConfig,
@@ -132,11 +731,14 @@ class Sync:
         *args: str | Path,
         input: str | None = None,
         context: str | None = None,
-    ) -> None:
-        if self._dry_run:
-            print(f"{(program, *args)}", f"{input=}")
-            return
+        capture: bool = False,
+    ) -> str:
+        """Run a command, raising CalledProcessError on failure
 
+        Returns:
+            The standard output of the command if 'capture' is set, in which
+            case it is not echoed to the console. Otherwise an empty string.
+        """
         proc = await asyncio.create_subprocess_exec(
             program,
             *args,
@@ -154,11 +756,17 @@ class Sync:
         stdout = io.StringIO()
         stderr = io.StringIO()
 
+        async def read_stdout() -> None:
+            if not capture:
+                await redirect_output(
+                    f"{area.name} {repr(context)}", proc.stdout, sys.stdout, stdout
+                )
+            elif proc.stdout is not None:
+                _ = stdout.write((await proc.stdout.read()).decode(errors="replace"))
+
         await asyncio.gather(
             proc.wait(),
-            redirect_output(
-                f"{area.name} {repr(context)}", proc.stdout, sys.stdout, stdout
-            ),
+            read_stdout(),
             redirect_output(
                 f"{area.name} {repr(context)}", proc.stderr, sys.stderr, stderr
             ),
@@ -169,6 +777,63 @@ class Sync:
             raise subprocess.CalledProcessError(
                 returncode, (program, *args), stdout.getvalue(), stderr.getvalue()
             )
+        return stdout.getvalue() if capture else ""
+
+
+# Commands to compress and decompress tar archives for each 'compress' setting
+_TAR_COMPRESSORS: dict[str, tuple[str, str]] = {
+    "zstd": ("zstd -T0 -c", "zstd -dc"),
+    "lz4": ("lz4 -c", "lz4 -dc"),
+    "zlibx": ("gzip -c", "gzip -dc"),
+    "zlib": ("gzip -c", "gzip -dc"),
+    "none": ("cat", "cat"),
+}
+
+
+def _regular_files(path: Path) -> Iterator[tuple[str, os.stat_result]]:
+    """Regular files at or below 'path', not following symlinks
+
+    Yields:
+        The path of each file relative to 'path', and its status
+    """
+    stat = path.lstat()
+    if S_ISREG(stat.st_mode):
+        yield ".", stat
+        return
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            stat = os.lstat(os.path.join(dirpath, name))
+            if S_ISREG(stat.st_mode):
+                yield os.path.relpath(os.path.join(dirpath, name), path), stat
+
+
+def _balance(sizes: dict[Path, int], count: int) -> list[list[Path]]:
+    """Split paths into at most 'count' shards of roughly equal total size"""
+    shards: list[tuple[int, int, list[Path]]] = [(0, i, []) for i in range(count)]
+    for path in sorted(sizes, key=lambda x: -sizes[x]):
+        total, index, shard = heapq.heappop(shards)
+        shard.append(path)
+        heapq.heappush(shards, (total + sizes[path], index, shard))
+    return [shard for _, _, shard in sorted(shards, key=lambda x: x[1]) if shard]
+
+
+def assign_relays(areas: list[AreaConfig], seeds: int) -> list[AreaConfig]:
+    """Derive a fan-out topology by relaying areas through seed areas
+
+    The first 'seeds' areas that sync from this host become seeds. Every other
+    area without an explicit relay is assigned to a seed in round-robin order.
+    """
+    roots = [area.name for area in areas if area.relay is None][:seeds]
+    if not roots:
+        return areas
+
+    relays = cycle(roots)
+    return [
+        area
+        if area.relay is not None or area.name in roots
+        else area.model_copy(update={"relay": next(relays)})
+        for area in areas
+    ]
 
 
 async def sync_all(
@@ -176,22 +841,116 @@ async def sync_all(
     areas: list[AreaConfig],
     no_async: bool,
     dry_run: bool,
+    max_parallel: int | None = None,
+    resume: bool = False,
+    debug: bool = False,
 ) -> None:
-    syncer = Sync(ctx, dry_run=dry_run)
-
-    if no_async:
-        for area in areas:
-            await syncer.sync_to(area)
+    if dry_run:
+        async with Sync(ctx, debug=debug) as syncer:
+            await _plan_areas(syncer, areas)
         return
 
-    results = await asyncio.gather(
-        *(syncer.sync_to(area) for area in areas), return_exceptions=True
+    journal = SyncJournal(
+        ctx.packages[ctx.config.main_package].manifest,
+        ctx.staging_paths.cache / "sync-journal.json",
+        resume=resume,
+    )
+    async with Sync(ctx, journal=journal, debug=debug) as syncer:
+        await _sync_areas(syncer, areas, 1 if no_async else max_parallel)
+
+
+async def _plan_areas(syncer: Sync, areas: list[AreaConfig]) -> None:
+    by_name = {area.name: area for area in areas}
+    plans = await asyncio.gather(
+        *(
+            syncer.plan(area, None if area.relay is None else by_name[area.relay])
+            for area in areas
+        )
+    )
+
+    table = Table(
+        "Area", "Entries", "Files", "Size", "Throughput", "ETA", title="Sync plan"
     )
-    for index, result in enumerate(results):
-        if not isinstance(result, BaseException):
-            continue
-        print(f"During syncing to {areas[index].name}:")
-        raise result
+    for area, plan in zip(areas, plans):
+        table.add_row(
+            area.name,
+            str(plan.entries),
+            str(plan.files),
+            f"{plan.nbytes / 2**20:.1f} MiB",
+            f"{plan.throughput / 2**20:.1f} MiB/s" if plan.throughput else "-",
+            f"{plan.eta:.0f}s",
+        )
+    console.print(table)
+
+
+async def _sync_with_retries(
+    syncer: Sync, area: AreaConfig, relay: AreaConfig | None
+) -> None:
+    for attempt in range(area.retries + 1):
+        try:
+            await syncer.sync_to(area, relay, retry=attempt > 0)
+            return
+        except (subprocess.CalledProcessError, OSError) as exc:
+            if attempt == area.retries:
+                raise
+            delay = area.retry_delay * 2**attempt
+            print(
+                f"{area.name}> Attempt {attempt + 1} failed ({exc}), retrying in {delay}s"
+            )
+            await asyncio.sleep(delay)
+
+
+async def _sync_areas(
+    syncer: Sync,
+    areas: list[AreaConfig],
+    max_parallel: int | None,
+) -> None:
+    by_name = {area.name: area for area in areas}
+
+    def relay_of(area: AreaConfig) -> AreaConfig | None:
+        return None if area.relay is None else by_name[area.relay]
+
+    children: dict[str | None, list[AreaConfig]] = {}
+    for area in sorted(areas, key=lambda x: -x.priority):
+        children.setdefault(area.relay, []).append(area)
+
+    outcomes: dict[str, str] = {}
+    failures: list[tuple[AreaConfig, subprocess.CalledProcessError | OSError]] = []
+    semaphore = asyncio.Semaphore(max_parallel or len(areas) or 1)
+
+    def skip_tree(area: AreaConfig, reason: str) -> None:
+        for child in children.get(area.name, []):
+            outcomes[child.name] = reason
+            skip_tree(child, reason)
+
+    async def sync_tree(area: AreaConfig) -> None:
+        if syncer.journal.is_done(area, "symlinks"):
+            outcomes[area.name] = "[green]already synchronised"
+        else:
+            try:
+                async with semaphore:
+                    await _sync_with_retries(syncer, area, relay_of(area))
+            except (subprocess.CalledProcessError, OSError) as exc:
+                failures.append((area, exc))
+                outcomes[area.name] = f"[red]failed: {exc}"
+                skip_tree(area, f"[yellow]skipped: relay {area.name} failed")
+                return
+            outcomes[area.name] = "[green]ok"
+
+        await asyncio.gather(
+            *(sync_tree(child) for child in children.get(area.name, []))
+        )
+
+    await asyncio.gather(*(sync_tree(area) for area in children.get(None, [])))
+
+    table = Table("Area", "Host", "Outcome", title="Sync summary")
+    for area in areas:
+        table.add_row(area.name, area.host, outcomes[area.name])
+    console.print(table)
+
+    for area, exc in failures:
+        print(f"During syncing to {area.name}:")
+        raise exc
 
 
 @click.command("sync", help="Synchronise all locations")
@@ -206,19 +965,59 @@ async def sync_all(
 )
 @click.option(
     "--dry-run",
+    help="Only report what would be transferred to each area",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--max-parallel",
+    help="Maximum number of areas to synchronise at once",
+    type=click.IntRange(min=1),
+    metavar="N",
+    default=None,
+)
+@click.option(
+    "--resume",
+    help="Only redo the areas and phases that failed in the previous sync",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--fan-out",
+    help="Sync N areas from this host, and relay the rest through them",
+    type=click.IntRange(min=1),
+    metavar="N",
+    default=None,
+)
+@click.option(
+    "--debug",
+    help="Also transfer the debug info split off by 'split-debug'",
     is_flag=True,
     default=False,
 )
 def subcommand_sync(
-    config_file: Path, areas_file: Path, staging: Path, no_async: bool, dry_run: bool
+    config_file: Path,
+    areas_file: Path,
+    staging: Path,
+    no_async: bool,
+    dry_run: bool,
+    fan_out: int | None,
+    max_parallel: int | None,
+    resume: bool,
+    debug: bool,
 ) -> None:
     ctx = Context.from_config_file(config_file, staging=staging, engine="native")
     areas = load_areas(areas_file)
+    if fan_out is not None:
+        areas = assign_relays(areas, fan_out)
     asyncio.run(
         sync_all(
             ctx,
             areas=areas,
             no_async=no_async,
             dry_run=dry_run,
+            max_parallel=max_parallel,
+            resume=resume,
+            debug=debug,
         )
     )
@@ -1,22 +1,217 @@
 from __future__ import annotations
+import asyncio
+import contextlib
+from collections.abc import Sequence
+import heapq
+import io
+import json
+import os
+import statistics
 from pathlib import Path
 import sys
+from tempfile import TemporaryDirectory
+from typing import IO, Any
 import click
 
 from karsk.commands._common import argument_config_file, option_engine, option_staging
+from karsk.console import console
 from karsk.context import Context
 from karsk.engine import EngineName
 
 
+# Files in the staging cache directory
+DURATIONS_NAME = "test-durations.json"
+RESULTS_NAME = "test-results.json"
+
+
+def _load_json(path: Path) -> dict[str, Any]:
+    try:
+        data: dict[str, Any] = json.loads(path.read_text())
+        return data
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_results(cache: Path, results: dict[str, dict[str, Any]]) -> None:
+    """Record the duration of each test, and the inputs of those that passed"""
+    durations = _load_json(cache / DURATIONS_NAME)
+    passed = _load_json(cache / RESULTS_NAME)
+    for nodeid, result in results.items():
+        if result["outcome"] == "cached":
+            continue
+        durations[nodeid] = result["duration"]
+        if result["outcome"] == "passed" and result["key"] is not None:
+            passed[nodeid] = result["key"]
+        else:
+            _ = passed.pop(nodeid, None)
+
+    cache.mkdir(parents=True, exist_ok=True)
+    for name, data in ((DURATIONS_NAME, durations), (RESULTS_NAME, passed)):
+        _ = (cache / name).write_text(json.dumps(data, indent=2, sort_keys=True))
+
+
+def partition(
+    tests: list[str], durations: dict[str, float], jobs: int
+) -> list[list[str]]:
+    """Distribute tests across 'jobs' workers so that each takes about as long
+
+    Longest tests are assigned first, each to the worker with the least work.
+    Tests that haven't been timed before are assumed to take the median time.
+    """
+    default = statistics.median(durations.values()) if durations else 1.0
+    heap = [(0.0, i) for i in range(jobs)]
+    shares: list[list[str]] = [[] for _ in range(jobs)]
+    for test in sorted(tests, key=lambda x: -durations.get(x, default)):
+        total, i = heapq.heappop(heap)
+        shares[i].append(test)
+        heapq.heappush(heap, (total + durations.get(test, default), i))
+    return [share for share in shares if share]
+
+
+async def _run_workers(
+    shares: list[list[str]],
+    args: tuple[str, ...],
+    env: dict[str, str],
+    logs: Sequence[IO[bytes]],
+    tmp: Path,
+) -> list[int]:
+    async def run(index: int) -> int:
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "pytest",
+            "-p",
+            "karsk.testing",
+            "--karsk-report",
+            str(tmp / f"worker-{index}.json"),
+            *args,
+            *shares[index],
+            env={**os.environ, **env},
+            stdout=logs[index],
+            stderr=logs[index],
+        )
+        return await proc.wait()
+
+    return await asyncio.gather(*(run(i) for i in range(len(shares))))
+
+
+def _run_parallel(
+    ctx: Context,
+    config_file: Path,
+    staging: Path,
+    args: tuple[str, ...],
+    jobs: int,
+    tmp: Path,
+) -> int:
+    import pytest
+    from karsk.testing import CONFIG_ENV, STAGING_ENV
+
+    # Collect in this process to find out what to distribute
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        code = pytest.main(
+            [
+                str(ctx.config.tests),
+                "--collect-only",
+                "--karsk-report",
+                str(tmp / "collect.json"),
+                *args,
+            ],
+            plugins=["karsk.testing"],
+        )
+    if code != 0:
+        print(output.getvalue(), end="")
+        return code
+    collection = json.loads((tmp / "collect.json").read_text())
+    cached: set[str] = set(collection["cached"])
+    tests = [x for x in collection["collected"] if x not in cached]
+
+    durations = _load_json(ctx.staging_paths.cache / DURATIONS_NAME)
+    shares = partition(tests, durations, jobs)
+    console.print(
+        f"Running {len(tests)} tests on {len(shares)} workers"
+        + (f", {len(cached)} cached" if cached else ""),
+        style="bold",
+    )
+
+    # Each worker creates its own context from these
+    env = {
+        CONFIG_ENV: str(config_file.absolute()),
+        STAGING_ENV: str(staging.absolute()),
+        "KARSK_ENGINE": ctx.engine.name,
+    }
+    with contextlib.ExitStack() as stack:
+        logs = [
+            stack.enter_context(open(tmp / f"worker-{i}.log", "wb"))
+            for i in range(len(shares))
+        ]
+        codes = asyncio.run(_run_workers(shares, args, env, logs, tmp))
+
+    results: dict[str, dict[str, Any]] = {
+        nodeid: {"outcome": "cached", "duration": 0.0, "key": None} for nodeid in cached
+    }
+    for i, worker_code in enumerate(codes):
+        console.rule(f"Worker {i} (exit code {worker_code})")
+        print((tmp / f"worker-{i}.log").read_text(), end="")
+        with contextlib.suppress(OSError):
+            results.update(
+                json.loads((tmp / f"worker-{i}.json").read_text())["results"]
+            )
+    _save_results(ctx.staging_paths.cache, results)
+
+    outcomes: dict[str, int] = {}
+    for result in results.values():
+        outcomes[result["outcome"]] = outcomes.get(result["outcome"], 0) + 1
+    console.rule(
+        ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items()))
+        + f" on {len(shares)} workers"
+    )
+    return max(codes, default=0)
+
+
+def _find_manifest(ctx: Context, since: str) -> Path:
+    """Manifest of a version or alias in staging or the destination, or a file"""
+    candidates = [
+        Path(since),
+        Path(since, "manifest"),
+        ctx.staging_paths.versions / since / "manifest",
+        ctx.target_paths.versions / since / "manifest",
+    ]
+    for path in candidates:
+        if path.is_file():
+            return path.absolute()
+    sys.exit(f"No environment manifest found for '{since}'")
+
+
 @click.command("test", help="Run tests in ./karsk_tests using pytest")
 @argument_config_file
 @option_staging
 @option_engine
+@click.option(
+    "-j",
+    "--jobs",
+    help="Number of worker processes to distribute the tests across",
+    type=click.IntRange(min=1),
+    default=1,
+)
+@click.option(
+    "--no-cache",
+    help="Run tests even if they passed before with the same inputs",
+    is_flag=True,
+)
+@click.option(
+    "--changed-since",
+    help="Only run tests of packages that changed since this version, alias or manifest",
+    metavar="VERSION",
+)
 @click.argument("args", nargs=-1)
 def subcommand_test(
     config_file: Path,
     staging: Path,
     engine: EngineName | None,
+    jobs: int,
+    no_cache: bool,
+    changed_since: str | None,
     args: tuple[str, ...],
 ) -> None:
     import pytest
@@ -31,4 +226,22 @@ def subcommand_test(
     ctx.ensure_built()
 
     karsk.testing._CONTEXT = ctx
-    sys.exit(pytest.main([str(ctx.config.tests), *args], plugins=["karsk.testing"]))
+    if changed_since is not None:
+        manifest = _find_manifest(ctx, changed_since)
+        args = ("--karsk-changed-since", str(manifest), *args)
+    if not no_cache:
+        args = ("--karsk-cache", str(ctx.staging_paths.cache / RESULTS_NAME), *args)
+    with TemporaryDirectory(prefix="karsk-test-") as tmp:
+        if jobs > 1:
+            sys.exit(_run_parallel(ctx, config_file, staging, args, jobs, Path(tmp)))
+
+        report = Path(tmp, "report.json")
+        code = pytest.main(
+            [str(ctx.config.tests), "--karsk-report", str(report), *args],
+            plugins=["karsk.testing"],
+        )
+        with contextlib.suppress(OSError):
+            _save_results(
+                ctx.staging_paths.cache, json.loads(report.read_text())["results"]
+            )
+        sys.exit(code)
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import sys
+
+import click
+
+from karsk.commands._common import (
+    argument_areas_file,
+    argument_config_file,
+    option_staging,
+)
+from karsk.commands.sync import Sync
+from karsk.config import AreaConfig, load_areas
+from karsk.console import console
+from karsk.context import Context
+
+
+async def verify_all(ctx: Context, areas: list[AreaConfig]) -> bool:
+    """Verify the store on every area. Returns True if all are intact"""
+    async with Sync(ctx) as syncer:
+        results = await asyncio.gather(
+            *(syncer.verify(area) for area in areas), return_exceptions=True
+        )
+
+    ok = True
+    for area, result in zip(areas, results):
+        if isinstance(result, BaseException):
+            console.print(f"[red]{area.name}: verification failed: {result}")
+            ok = False
+        elif result:
+            console.print(f"[red]{area.name}: {len(result)} problem(s)")
+            for line in result:
+                console.print(f"  {line}", markup=False)
+            ok = False
+        else:
+            console.print(f"[green]{area.name}: ok")
+    return ok
+
+
+@click.command("verify", help="Verify store entries on all locations")
+@argument_config_file
+@argument_areas_file
+@option_staging
+def subcommand_verify(config_file: Path, areas_file: Path, staging: Path) -> None:
+    ctx = Context.from_config_file(config_file, staging=staging, engine="native")
+    areas = load_areas(areas_file)
+    if not asyncio.run(verify_all(ctx, areas)):
+        sys.exit(1)
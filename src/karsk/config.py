@@ -14,6 +14,10 @@ import pydantic
 import yaml
 
 
+# x86-64 microarchitecture levels that packages may additionally be built for
+CpuVariant = Literal["x86-64-v2", "x86-64-v3", "x86-64-v4"]
+
+
 class Config(BaseModel):
     """Main configuration model"""
 
@@ -41,6 +45,17 @@ class Config(BaseModel):
     links: dict[str, str] = Field(
         default_factory=dict, description="Symbolic links setup"
     )
+    variants: list[CpuVariant] = Field(
+        default_factory=list,
+        description=(
+            "x86-64 microarchitecture levels to additionally build every package "
+            "for with '-march'. The wrapper picks the best variant the host CPU "
+            "supports"
+        ),
+    )
+    benchmarks: BenchmarksConfig | None = Field(
+        None, description="Benchmarks for comparing versions with 'karsk bench'"
+    )
 
     @field_validator("destination")
     @classmethod
@@ -70,6 +85,16 @@ class Config(BaseModel):
         cwd = Path((info.context or {}).get("cwd", "."))
         return cwd / value
 
+    @model_validator(mode="after")
+    def _validate_benchmarks(self) -> Config:
+        for bench in self.benchmarks.commands if self.benchmarks else []:
+            if bench.command[0] not in self.entrypoints:
+                raise ValueError(
+                    f"Benchmark '{bench.name}' must run one of the entrypoints, "
+                    f"not '{bench.command[0]}'"
+                )
+        return self
+
 
 class PackageConfig(BaseModel):
     """The description of a package"""
@@ -84,6 +109,101 @@ class PackageConfig(BaseModel):
     build: str = Field(
         description="Build script, to be executed as a bash script inside of a container"
     )
+    pgo: PgoConfig | None = Field(
+        None, description="Build with profile-guided optimisation"
+    )
+    post_build: list[Literal["pin-libraries", "split-debug"]] = Field(
+        default_factory=list,
+        alias="post-build",
+        description=(
+            "Steps to run on the output after a successful build, in order. "
+            "'pin-libraries' puts the directories of the libraries of every "
+            "ELF file first in its search path, and requires patchelf in the "
+            "build image. 'split-debug' strips binaries and moves their debug info to "
+            "a sibling '.debug' store entry, and requires objcopy"
+        ),
+    )
+
+
+class PgoConfig(BaseModel):
+    """Profile-guided optimisation of a package
+
+    The package is first built with instrumentation, and 'train' is run with
+    the instrumented build to record a profile. The package is then rebuilt
+    using the profile. In the flags, '{profile}' is replaced by the path to the
+    profile directory. The defaults are for GCC.
+    """
+
+    train: str = Field(
+        description=(
+            "Training script, to be executed as a bash script inside of a "
+            "container with the instrumented build in $out"
+        )
+    )
+    generate_flags: str = Field(
+        "-fprofile-generate={profile} -fprofile-update=atomic",
+        alias="generate-flags",
+        description="Compiler and linker flags for the instrumented build",
+    )
+    use_flags: str = Field(
+        "-fprofile-use={profile} -fprofile-correction -Wno-missing-profile "
+        "-Wno-error=coverage-mismatch",
+        alias="use-flags",
+        description="Compiler and linker flags for the optimised build",
+    )
+
+
+class BenchmarksConfig(BaseModel):
+    """Commands that are timed in each version by 'karsk bench'"""
+
+    repeat: int = Field(
+        5, ge=1, description="Number of timed runs of each benchmark in each version"
+    )
+    warmup: int = Field(
+        1, ge=0, description="Number of untimed runs before the timed runs"
+    )
+    threshold: float = Field(
+        0.05,
+        ge=0,
+        description=(
+            "Largest allowed increase of the median wall time relative to the "
+            "first version, as a fraction (eg: 0.05 for 5%)"
+        ),
+    )
+    cpus: str | None = Field(
+        None,
+        description="CPUs to pin the benchmarks to, as a list of ranges (eg: '0-3,8')",
+    )
+    commands: list[BenchmarkConfig] = Field(description="Benchmarks to run")
+
+
+class BenchmarkConfig(BaseModel):
+    """A command to time in each version"""
+
+    name: str = Field(description="Benchmark name")
+    command: list[str] = Field(
+        min_length=1,
+        description="Entrypoint to run and its arguments",
+        examples=["['pflotran', '-input_prefix', 'small']"],
+    )
+    inputs: Path | None = Field(
+        None,
+        description=(
+            "Directory with input data, relative to config file. It is copied "
+            "into an empty working directory for every run"
+        ),
+    )
+
+    @field_validator("inputs", mode="before")
+    @classmethod
+    def _resolve_paths(
+        cls, value: str | None, info: pydantic.ValidationInfo
+    ) -> Path | None:
+        if value is None:
+            return None
+
+        cwd = Path((info.context or {}).get("cwd", "."))
+        return cwd / value
 
 
 class GitConfig(BaseModel):
@@ -130,6 +250,38 @@ class FileConfig(BaseModel):
 class AreaConfig(BaseModel):
     name: str = Field(description="Display name")
     host: str = Field(description="Hostname or IP-address")
+    relay: str | None = Field(
+        None,
+        description="Name of another area to sync from, instead of from the local host",
+    )
+    bwlimit: str | None = Field(
+        None,
+        description="Bandwidth limit passed to rsync's --bwlimit (eg: '20M'). Not supported by the tar transport",
+    )
+    compress: Literal["zstd", "lz4", "zlibx", "zlib", "none"] | None = Field(
+        None,
+        description="Compression algorithm passed to rsync's --compress-choice, or used for the archive of the tar transport (zstd by default)",
+    )
+    transport: Literal["rsync", "tar"] = Field(
+        "rsync",
+        description="Transport for new store entries. 'tar' streams them as a single compressed archive, which is faster for entries with many small files",
+    )
+    streams: int = Field(
+        1,
+        ge=1,
+        description="Number of concurrent rsync processes to split store entries over",
+    )
+    retries: int = Field(
+        0, ge=0, description="Number of times to retry a failed sync to this area"
+    )
+    retry_delay: float = Field(
+        5.0,
+        ge=0,
+        description="Seconds to wait before the first retry, doubling for each subsequent retry",
+    )
+    priority: int = Field(
+        0, description="Areas with a higher priority are synchronised first"
+    )
 
 
 def load_config(path: Path) -> Config:
@@ -142,4 +294,26 @@ def load_config(path: Path) -> Config:
 def load_areas(path: Path) -> list[AreaConfig]:
     with open(path) as f:
         data = yaml.safe_load(f.read())
-    return [AreaConfig.model_validate(item) for item in data["areas"]]
+    areas = [AreaConfig.model_validate(item) for item in data["areas"]]
+
+    relays = {area.name: area.relay for area in areas}
+    for area in areas:
+        if area.transport == "tar" and area.bwlimit is not None:
+            raise ValueError(
+                f"Area '{area.name}' sets a bwlimit, which the tar transport "
+                "doesn't support"
+            )
+
+        seen = {area.name}
+        relay = area.relay
+        while relay is not None:
+            if relay not in relays:
+                raise ValueError(
+                    f"Area '{area.name}' relays through unknown area '{relay}'"
+                )
+            if relay in seen:
+                raise ValueError(f"Area '{area.name}' has a cyclic relay chain")
+            seen.add(relay)
+            relay = relays[relay]
+
+    return areas
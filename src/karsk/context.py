@@ -4,7 +4,7 @@ import sys
 from typing import IO, Any, Self
 
 from asyncio.subprocess import Process
-from karsk.config import Config, load_config
+from karsk.config import Config, CpuVariant, load_config
 from karsk.engine import (
     CpuArchName,
     CpuArchNameNative,
@@ -17,6 +17,7 @@ from karsk.package import Package
 from karsk.package_list import PackageList
 from karsk.console import console
 from karsk.paths import Paths
+from karsk.session import EnvironmentSession
 
 
 TARGET_TRIPLETS: dict[CpuArchName, str] = {
@@ -48,6 +49,16 @@ class Context:
             self.target_paths,
             check_existence=False,
         )
+        self.variants: dict[CpuVariant, PackageList] = {
+            variant: PackageList(
+                config,
+                self.staging_paths,
+                self.target_paths,
+                check_existence=False,
+                variant=variant,
+            )
+            for variant in config.variants
+        }
 
     @property
     def destination(self) -> Path:
@@ -62,6 +73,15 @@ class Context:
     def packages(self) -> dict[str, Package]:
         return self.plist.packages
 
+    @property
+    def all_packages(self) -> list[Package]:
+        """Packages of the generic build followed by those of every variant"""
+        return [
+            pkg
+            for plist in [self.plist, *self.variants.values()]
+            for pkg in plist.packages.values()
+        ]
+
     def out(self, package: Package | str, *, staging: bool = True) -> Path:
         """Helper for obtaining the output path for a given package. Mainly for use in tests"""
         if isinstance(package, str):
@@ -122,6 +142,23 @@ class Context:
             )
             sys.exit(1)
 
+    def _package_volumes(
+        self, packages: list[str], *, whole_store: bool
+    ) -> list[VolumeBind]:
+        """Read-only binds of bin/, versions/ and the packages in the store"""
+        volumes: list[VolumeBind] = []
+        if whole_store:
+            volumes.append((self.staging_paths.store, self.target_paths.store, "ro"))
+        else:
+            volumes.extend(self.plist.volumes(packages))
+        if self.staging_paths.bin.is_dir():
+            volumes.append((self.staging_paths.bin, self.target_paths.bin, "ro"))
+        if self.staging_paths.versions.is_dir():
+            volumes.append(
+                (self.staging_paths.versions, self.target_paths.versions, "ro")
+            )
+        return volumes
+
     async def run(
         self,
         program: str | Path,
@@ -135,15 +172,20 @@ class Context:
         network: bool = True,
         stdout: IO[Any] | int | None = None,
         stderr: IO[Any] | int | None = None,
+        whole_store: bool = False,
     ) -> Process:
+        """Run a program in the build image with packages available
+
+        The given packages and their dependencies are bind-mounted read-only,
+        one each. If 'whole_store' is set, store/ is instead bind-mounted once,
+        so that the number of mounts doesn't grow with the number of packages.
+        """
         image: Path
 
         if cwd is None:
             cwd = "/"
         if env is None:
             env = {}
-        if volumes is None:
-            volumes = []
 
         if build:
             assert isinstance(package, str), (
@@ -162,18 +204,17 @@ class Context:
 
             self.ensure_built(package)
 
-        if self.staging_paths.bin.is_dir():
-            volumes.append((self.staging_paths.bin, self.target_paths.bin, "ro"))
-        if self.staging_paths.versions.is_dir():
-            volumes.append(
-                (self.staging_paths.versions, self.target_paths.versions, "ro")
-            )
+        # Beneath any writable binds into the store
+        volumes = [
+            *self._package_volumes(package, whole_store=whole_store),
+            *(volumes or []),
+        ]
 
         return await self.engine(
             image,
             program,
             *args,
-            volumes=volumes + self.plist.volumes(package),
+            volumes=volumes,
             cwd=cwd,
             env=env,
             terminal=terminal,
@@ -181,3 +222,23 @@ class Context:
             stdout=stdout,
             stderr=stderr,
         )
+
+    async def start_session(
+        self,
+        *,
+        volumes: list[VolumeBind] | None = None,
+        env: dict[str, str] | None = None,
+        network: bool = True,
+    ) -> EnvironmentSession:
+        """Start a container with every package available, in which programs
+        can be run much faster than with 'run'. Close the session to stop it."""
+        self.ensure_built()
+        container = await self.engine.start(
+            self.config.build_image,
+            volumes=[
+                *self._package_volumes([], whole_store=True),
+                *(volumes or []),
+            ],
+            network=network,
+        )
+        return EnvironmentSession(self.engine, container, env=env)
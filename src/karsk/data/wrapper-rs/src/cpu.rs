@@ -0,0 +1,53 @@
+/// Microarchitecture variants that the host CPU supports, best first. These
+/// are the x86-64 levels of the psABI that Karsk can build variants for.
+#[cfg(target_arch = "x86_64")]
+pub fn supported_variants() -> Vec<&'static str> {
+    let v2 = is_x86_feature_detected!("cmpxchg16b")
+        && is_x86_feature_detected!("popcnt")
+        && is_x86_feature_detected!("sse3")
+        && is_x86_feature_detected!("ssse3")
+        && is_x86_feature_detected!("sse4.1")
+        && is_x86_feature_detected!("sse4.2");
+    let v3 = v2
+        && is_x86_feature_detected!("avx")
+        && is_x86_feature_detected!("avx2")
+        && is_x86_feature_detected!("bmi1")
+        && is_x86_feature_detected!("bmi2")
+        && is_x86_feature_detected!("f16c")
+        && is_x86_feature_detected!("fma")
+        && is_x86_feature_detected!("lzcnt")
+        && is_x86_feature_detected!("movbe")
+        && is_x86_feature_detected!("xsave");
+    let v4 = v3
+        && is_x86_feature_detected!("avx512f")
+        && is_x86_feature_detected!("avx512bw")
+        && is_x86_feature_detected!("avx512cd")
+        && is_x86_feature_detected!("avx512dq")
+        && is_x86_feature_detected!("avx512vl");
+
+    [("x86-64-v4", v4), ("x86-64-v3", v3), ("x86-64-v2", v2)]
+        .into_iter()
+        .filter_map(|(name, supported)| supported.then_some(name))
+        .collect()
+}
+
+#[cfg(not(target_arch = "x86_64"))]
+pub fn supported_variants() -> Vec<&'static str> {
+    Vec::new()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_supported_variants_are_ordered() {
+        let variants = supported_variants();
+        let order = ["x86-64-v4", "x86-64-v3", "x86-64-v2"];
+        let positions: Vec<usize> = variants
+            .iter()
+            .map(|v| order.iter().position(|o| o == v).unwrap())
+            .collect();
+        assert!(positions.windows(2).all(|w| w[0] < w[1]));
+    }
+}
@@ -0,0 +1,169 @@
+use std::ffi::OsStr;
+use std::fs;
+use std::path::Path;
+use std::time::UNIX_EPOCH;
+
+pub const INDEX_NAME: &str = ".versions-index";
+
+/// Precomputed index of the versions directory, written by Karsk
+pub struct Index {
+    /// Version directories, newest first
+    pub versions: Vec<String>,
+    /// Alias names and the version directories they resolve to
+    pub aliases: Vec<(String, String)>,
+    /// Microarchitecture variants and the version directories built for them
+    pub variants: Vec<(String, String)>,
+}
+
+impl Index {
+    /// Reads the index at 'path'. Returns None if it can't be read, or if
+    /// 'versions_dir' or any of its variant directories has been modified
+    /// since the index was written.
+    pub fn load(path: impl AsRef<Path>, versions_dir: impl AsRef<Path>) -> Option<Index> {
+        let versions_dir = versions_dir.as_ref();
+        let content = fs::read_to_string(path).ok()?;
+        let mut lines = content.lines();
+
+        if lines.next()? != "karsk-versions\t2" {
+            return None;
+        }
+
+        let mtime: u128 = lines.next()?.strip_prefix("mtime\t")?.parse().ok()?;
+        if mtime != mtime_of(versions_dir)? {
+            return None;
+        }
+
+        let mut index = Index {
+            versions: Vec::new(),
+            aliases: Vec::new(),
+            variants: Vec::new(),
+        };
+        for line in lines {
+            if let Some(name) = line.strip_prefix("version\t") {
+                index.versions.push(name.to_owned());
+            } else if let Some((name, target)) = line
+                .strip_prefix("alias\t")
+                .and_then(|rest| rest.split_once('\t'))
+            {
+                index.aliases.push((name.to_owned(), target.to_owned()));
+            } else if let Some((variant, name)) = line
+                .strip_prefix("variant\t")
+                .and_then(|rest| rest.split_once('\t'))
+            {
+                index.variants.push((variant.to_owned(), name.to_owned()));
+            } else if let Some((variant, mtime)) = line
+                .strip_prefix("variant-mtime\t")
+                .and_then(|rest| rest.split_once('\t'))
+            {
+                // New versions of a variant only modify its own directory
+                let mtime: u128 = mtime.parse().ok()?;
+                if mtime != mtime_of(&versions_dir.join(variant))? {
+                    return None;
+                }
+            }
+        }
+        Some(index)
+    }
+
+    /// Resolves a version or alias name to a version directory name
+    pub fn resolve(&self, name: &OsStr) -> Option<&str> {
+        let name = name.to_str()?;
+        if let Some(version) = self.versions.iter().find(|v| *v == name) {
+            return Some(version);
+        }
+        self.aliases
+            .iter()
+            .find(|(alias, _)| alias == name)
+            .map(|(_, target)| target.as_str())
+    }
+
+    /// Whether 'version' has been built for 'variant'
+    pub fn has_variant(&self, variant: &str, version: &OsStr) -> bool {
+        self.variants
+            .iter()
+            .any(|(v, name)| v == variant && OsStr::new(name) == version)
+    }
+}
+
+/// Modification time of 'path' in nanoseconds since the epoch
+fn mtime_of(path: &Path) -> Option<u128> {
+    Some(
+        fs::metadata(path)
+            .and_then(|m| m.modified())
+            .ok()?
+            .duration_since(UNIX_EPOCH)
+            .ok()?
+            .as_nanos(),
+    )
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::fs::{create_dir, write};
+    use testdir::testdir;
+
+    fn write_index(dir: &Path, body: &str) {
+        let mtime = mtime_of(&dir.join("versions")).unwrap();
+        write(
+            dir.join(INDEX_NAME),
+            format!("karsk-versions\t2\nmtime\t{}\n{}", mtime, body),
+        )
+        .unwrap();
+    }
+
+    #[test]
+    fn test_index_resolve() {
+        let tmp = testdir!();
+        create_dir(tmp.join("versions")).unwrap();
+        write_index(
+            &tmp,
+            "version\t1.2.3+4\nalias\tstable\t1.2.3+4\nalias\tlatest\t1.2.3+4\n\
+             variant\tx86-64-v3\t1.2.3+4\n",
+        );
+
+        let index = Index::load(tmp.join(INDEX_NAME), tmp.join("versions")).unwrap();
+        assert_eq!(index.resolve(OsStr::new("stable")), Some("1.2.3+4"));
+        assert_eq!(index.resolve(OsStr::new("1.2.3+4")), Some("1.2.3+4"));
+        assert_eq!(index.resolve(OsStr::new("other")), None);
+        assert!(index.has_variant("x86-64-v3", OsStr::new("1.2.3+4")));
+        assert!(!index.has_variant("x86-64-v4", OsStr::new("1.2.3+4")));
+    }
+
+    #[test]
+    fn test_index_stale() {
+        let tmp = testdir!();
+        create_dir(tmp.join("versions")).unwrap();
+        write(
+            tmp.join(INDEX_NAME),
+            "karsk-versions\t2\nmtime\t0\nversion\t1.2.3+4\n",
+        )
+        .unwrap();
+
+        assert!(Index::load(tmp.join(INDEX_NAME), tmp.join("versions")).is_none());
+    }
+
+    #[test]
+    fn test_index_stale_variant() {
+        let tmp = testdir!();
+        create_dir(tmp.join("versions")).unwrap();
+        create_dir(tmp.join("versions/x86-64-v3")).unwrap();
+        let mtime = mtime_of(&tmp.join("versions/x86-64-v3")).unwrap();
+        write_index(
+            &tmp,
+            &format!("variant-mtime\tx86-64-v3\t{}\nversion\t1.2.3+4\n", mtime),
+        );
+        assert!(Index::load(tmp.join(INDEX_NAME), tmp.join("versions")).is_some());
+
+        write_index(&tmp, "variant-mtime\tx86-64-v3\t0\nversion\t1.2.3+4\n");
+        assert!(Index::load(tmp.join(INDEX_NAME), tmp.join("versions")).is_none());
+    }
+
+    #[test]
+    fn test_index_missing() {
+        let tmp = testdir!();
+        create_dir(tmp.join("versions")).unwrap();
+
+        assert!(Index::load(tmp.join(INDEX_NAME), tmp.join("versions")).is_none());
+    }
+}
@@ -1,17 +1,23 @@
+mod cpu;
+mod index;
 mod util;
 mod versions;
 
-use std::env::{args_os, current_exe};
-use std::ffi::OsString;
+use std::env::{args_os, current_exe, var_os};
+use std::ffi::{OsStr, OsString};
 use std::io::stdout;
 use std::os::unix::process::CommandExt;
-use std::path::PathBuf;
+use std::path::{Path, PathBuf};
 use std::process::Command;
 
+use crate::cpu::supported_variants;
+use crate::index::{INDEX_NAME, Index};
 use crate::util::exit;
-use crate::versions::print_versions_to;
+use crate::versions::{print_index_to, print_versions_to};
 
 const DEFAULT_VERSION: &str = "stable";
+const LOCAL_VERSIONS_ENV: &str = "KARSK_LOCAL_VERSIONS";
+const VARIANT_ENV: &str = "KARSK_VARIANT";
 
 fn main() {
     let mut args = args_os();
@@ -29,6 +35,12 @@ fn main() {
         .map(|p| p.join("versions"))
         .expect("Couldn't determine 'versions' directory");
 
+    // Use the precomputed index if it's up-to-date, to avoid resolving
+    // symlinks on a shared file system
+    let index = executable
+        .parent()
+        .and_then(|bin| Index::load(bin.join(INDEX_NAME), &versions_dir));
+
     let mut help_arg: Option<OsString> = None;
     let mut version = OsString::from(DEFAULT_VERSION);
 
@@ -37,7 +49,10 @@ fn main() {
         if arg1 == "-h" || arg1 == "--help" {
             help_arg = Some(arg1);
         } else if arg1 == "--print-versions" {
-            print_versions_to(versions_dir, &mut stdout());
+            match &index {
+                Some(index) => print_index_to(index, &mut stdout()),
+                None => print_versions_to(versions_dir, &mut stdout()),
+            }
             return;
         } else if (arg1 == "-v" || arg1 == "--version")
             && let Some(arg2) = args.next()
@@ -48,11 +63,21 @@ fn main() {
         }
     }
 
-    if !versions_dir.join(&version).exists() {
-        exit!("No such version: {:?}", version);
-    }
+    let version = match index.as_ref().and_then(|index| index.resolve(&version)) {
+        Some(resolved) => OsString::from(resolved),
+        None if versions_dir.join(&version).exists() => version,
+        None => exit!("No such version: {:?}", version),
+    };
 
-    let program = versions_dir.join(version).join("bin").join(exename);
+    // A local copy of the variant is preferred, then one of the generic build
+    let variant_dir = select_variant(&versions_dir, &version, index.as_ref());
+    let env_dir = versions_dir.join(&version);
+    let local = variant_dir
+        .iter()
+        .chain([&env_dir])
+        .find_map(|dir| local_program(&versions_dir, dir, &exename));
+    let program =
+        local.unwrap_or_else(|| variant_dir.unwrap_or(env_dir).join("bin").join(&exename));
     let mut command = Command::new(program);
     if let Some(arg1) = help_arg {
         usage();
@@ -68,6 +93,54 @@ fn main() {
     exit!("Couldn't start program: {}", err);
 }
 
+/// Finds the program in a copy of the environment 'env_dir' made by 'karsk
+/// stage-local' or mounted from an image, if the directory containing such
+/// copies is given by $KARSK_LOCAL_VERSIONS. Copies of variants are in a
+/// subdirectory named after the variant, as in 'versions_dir'.
+fn local_program(versions_dir: &Path, env_dir: &Path, exename: &OsStr) -> Option<PathBuf> {
+    let local_dir = PathBuf::from(var_os(LOCAL_VERSIONS_ENV)?);
+    let resolved = env_dir.canonicalize().ok()?;
+    let relpath = resolved
+        .strip_prefix(versions_dir.canonicalize().ok()?)
+        .ok()?;
+    let program = local_dir.join(relpath).join("bin").join(exename);
+    program.is_file().then_some(program)
+}
+
+/// Finds the environment of the best variant of 'version' for the host CPU,
+/// or of the one given by $KARSK_VARIANT. Returns None to use the generic build.
+fn select_variant(versions_dir: &Path, version: &OsStr, index: Option<&Index>) -> Option<PathBuf> {
+    // Without an index, 'version' may still be an alias
+    let resolved = match index {
+        Some(_) => None,
+        None => versions_dir.join(version).canonicalize().ok(),
+    };
+    let name = resolved
+        .as_ref()
+        .and_then(|path| path.file_name())
+        .unwrap_or(version);
+    let exists = |variant: &str| match index {
+        Some(index) => index.has_variant(variant, name),
+        None => versions_dir.join(variant).join(name).is_dir(),
+    };
+
+    if let Some(variant) = var_os(VARIANT_ENV) {
+        let variant = variant.to_string_lossy().into_owned();
+        if variant == "generic" {
+            return None;
+        }
+        if !exists(&variant) {
+            exit!("No variant {} of version {:?}", variant, version);
+        }
+        return Some(versions_dir.join(variant).join(name));
+    }
+
+    supported_variants()
+        .into_iter()
+        .find(|variant| exists(variant))
+        .map(|variant| versions_dir.join(variant).join(name))
+}
+
 fn usage() {
     let project_name = current_exe()
         .ok()
@@ -95,4 +168,7 @@ fn usage() {
     println!("    --version, -v [NAME]  - Use a different version");
     println!("    --print-versions      - List available versions");
     println!();
+    println!("Set KARSK_VARIANT to a microarchitecture variant (eg. x86-64-v3) or to");
+    println!("'generic' to override the variant picked for this CPU.");
+    println!();
 }
@@ -5,6 +5,7 @@ use std::fs;
 use std::iter::zip;
 use std::path::Path;
 
+use crate::index::Index;
 use crate::util::exit;
 
 pub fn print_versions_to(path: impl AsRef<Path>, writer: &mut impl std::io::Write) {
@@ -52,6 +53,33 @@ pub fn print_versions_to(path: impl AsRef<Path>, writer: &mut impl std::io::Writ
         };
     }
 
+    print_sorted_to(versions, aliases, writer);
+}
+
+/// Prints the versions from a precomputed index, in the same format as
+/// 'print_versions_to'
+pub fn print_index_to(index: &Index, writer: &mut impl std::io::Write) {
+    let versions: Vec<Version> = index
+        .versions
+        .iter()
+        .filter_map(|name| Version::parse(name).ok())
+        .collect();
+
+    let mut aliases: BTreeMap<Version, Vec<String>> = BTreeMap::new();
+    for (name, target) in &index.aliases {
+        if let Ok(version) = Version::parse(target) {
+            aliases.entry(version).or_default().push(name.clone());
+        }
+    }
+
+    print_sorted_to(versions, aliases, writer);
+}
+
+fn print_sorted_to(
+    mut versions: Vec<Version>,
+    mut aliases: BTreeMap<Version, Vec<String>>,
+    writer: &mut impl std::io::Write,
+) {
     // Sort everything
     versions.sort_by(|a, b| b.cmp(a));
     aliases.values_mut().for_each(|x| x.sort());
@@ -0,0 +1,364 @@
+"""Reading of ELF files, for post-build processing of store entries"""
+
+from __future__ import annotations
+
+import os
+import shlex
+import struct
+from collections import Counter
+from collections.abc import Collection
+from pathlib import Path
+
+_MAGIC = b"\x7fELF"
+
+_ET_EXEC = 2
+_ET_DYN = 3
+
+_PT_LOAD = 1
+_PT_DYNAMIC = 2
+_PT_NOTE = 4
+
+_NT_GNU_BUILD_ID = 3
+
+_DT_NULL = 0
+_DT_NEEDED = 1
+_DT_STRTAB = 5
+_DT_RPATH = 15
+_DT_RUNPATH = 29
+
+# Directories searched by the dynamic loader after the RPATH and RUNPATH
+SYSTEM_LIBRARY_DIRS = (
+    "/lib",
+    "/lib64",
+    "/usr/lib",
+    "/usr/lib64",
+    "/lib/x86_64-linux-gnu",
+    "/usr/lib/x86_64-linux-gnu",
+    "/lib/aarch64-linux-gnu",
+    "/usr/lib/aarch64-linux-gnu",
+)
+
+
+class _ElfFile:
+    """Header and program headers of an ELF file"""
+
+    def __init__(self, data: bytes) -> None:
+        self.data: bytes = data
+        self.end: str = "<" if data[5] == 1 else ">"
+        self.word: str = "I" if data[4] == 1 else "Q"
+        self.type: int
+        self.phoff: int
+        (self.type,) = struct.unpack_from(f"{self.end}H", data, 16)
+        if data[4] == 1:
+            (self.phoff,) = struct.unpack_from(f"{self.end}I", data, 28)
+            self.phentsize, self.phnum = struct.unpack_from(f"{self.end}HH", data, 42)
+        else:
+            (self.phoff,) = struct.unpack_from(f"{self.end}Q", data, 32)
+            self.phentsize, self.phnum = struct.unpack_from(f"{self.end}HH", data, 54)
+
+    @classmethod
+    def read(cls, path: Path) -> _ElfFile | None:
+        with open(path, "rb") as f:
+            if f.read(4) != _MAGIC:
+                return None
+            data = _MAGIC + f.read()
+        if data[4] not in (1, 2) or data[5] not in (1, 2):
+            return None
+        return cls(data)
+
+    def segments(self, p_type: int) -> list[tuple[int, int, int]]:
+        """Offset, virtual address and size in the file of segments of a type"""
+        segments: list[tuple[int, int, int]] = []
+        for i in range(self.phnum):
+            offset = self.phoff + i * self.phentsize
+            if self.word == "I":
+                kind, p_offset, p_vaddr, _, p_filesz = struct.unpack_from(
+                    f"{self.end}5I", self.data, offset
+                )
+            else:
+                kind, _, p_offset, p_vaddr, _, p_filesz = struct.unpack_from(
+                    f"{self.end}IIQQQQ", self.data, offset
+                )
+            if kind == p_type:
+                segments.append((p_offset, p_vaddr, p_filesz))
+        return segments
+
+
+def is_binary(path: Path) -> bool:
+    """Whether 'path' is an ELF executable or shared library"""
+    try:
+        elf = _ElfFile.read(path)
+    except (OSError, struct.error):
+        return False
+    return elf is not None and elf.type in (_ET_EXEC, _ET_DYN)
+
+
+def read_build_id(path: Path) -> str | None:
+    """Hexadecimal GNU build ID of an ELF file, if it has one"""
+    if (elf := _ElfFile.read(path)) is None:
+        return None
+    for offset, _, size in elf.segments(_PT_NOTE):
+        end = offset + size
+        while offset + 12 <= end:
+            namesz, descsz, kind = struct.unpack_from(f"{elf.end}3I", elf.data, offset)
+            name_start = offset + 12
+            desc_start = name_start + (namesz + 3) // 4 * 4
+            if (
+                kind == _NT_GNU_BUILD_ID
+                and elf.data[name_start:desc_start].rstrip(b"\0") == b"GNU"
+            ):
+                return elf.data[desc_start : desc_start + descsz].hex()
+            offset = desc_start + (descsz + 3) // 4 * 4
+    return None
+
+
+class DynamicSection:
+    """Library dependencies and search paths of a dynamically linked ELF file"""
+
+    def __init__(self, needed: list[str], rpath: list[str], runpath: list[str]):
+        self.needed: list[str] = needed
+        self.rpath: list[str] = rpath
+        self.runpath: list[str] = runpath
+
+    @property
+    def search_path(self) -> list[str]:
+        """Directories searched for the libraries of the file, as written
+
+        The loader ignores the RPATH of files that have a RUNPATH.
+        """
+        return self.runpath or self.rpath
+
+    @classmethod
+    def read(cls, path: Path) -> DynamicSection | None:
+        """Parse the dynamic section of 'path'
+
+        Returns:
+            None if 'path' isn't an ELF file or isn't dynamically linked
+        """
+        if (elf := _ElfFile.read(path)) is None:
+            return None
+        data, end, word = elf.data, elf.end, elf.word
+
+        dynamic = next(iter(elf.segments(_PT_DYNAMIC)), None)
+        if dynamic is None:
+            return None
+
+        entries: list[tuple[int, int]] = []
+        entsize = struct.calcsize(f"{end}{word}{word}")
+        for offset in range(dynamic[0], dynamic[0] + dynamic[2], entsize):
+            tag, value = struct.unpack_from(f"{end}{word}{word}", data, offset)
+            if tag == _DT_NULL:
+                break
+            entries.append((tag, value))
+
+        # DT_STRTAB is a virtual address, so find its offset in the file
+        strtab = next((value for tag, value in entries if tag == _DT_STRTAB), None)
+        if strtab is None:
+            return None
+        for offset, vaddr, size in elf.segments(_PT_LOAD):
+            if vaddr <= strtab < vaddr + size:
+                strtab = strtab - vaddr + offset
+                break
+        else:
+            return None
+
+        def string(index: int) -> str:
+            start = strtab + index
+            return data[start : data.index(b"\0", start)].decode()
+
+        def paths(tag: int) -> list[str]:
+            return [
+                path
+                for value in (value for t, value in entries if t == tag)
+                for path in string(value).split(":")
+                if path
+            ]
+
+        return cls(
+            needed=[string(value) for tag, value in entries if tag == _DT_NEEDED],
+            rpath=paths(_DT_RPATH),
+            runpath=paths(_DT_RUNPATH),
+        )
+
+
+class PinPlan:
+    """New search paths for the ELF files of a store entry"""
+
+    def __init__(self) -> None:
+        # Search path for every file that needs one, in the target layout
+        self.rpaths: dict[Path, str] = {}
+        # Files whose search path is an RPATH rather than a RUNPATH
+        self.force_rpath: set[Path] = set()
+        # Libraries that couldn't be found, per file in the target layout
+        self.unresolved: dict[Path, list[str]] = {}
+
+    def script(self) -> str:
+        """Bash script that sets the search paths using patchelf
+
+        Files keep the kind of search path they had. Unlike a RUNPATH, an
+        RPATH is also searched for the dependencies of the file's libraries,
+        which they may rely on.
+        """
+        return "".join(
+            "patchelf "
+            + ("--force-rpath " if path in self.force_rpath else "")
+            + f"--set-rpath {shlex.quote(rpath)} {shlex.quote(str(path))}\n"
+            for path, rpath in self.rpaths.items()
+        )
+
+
+class LibrarySearch:
+    """Libraries needed by the ELF files of a store entry and the directories
+    each of them may be found in
+
+    The directories can only be checked where the store entry is built, so
+    'probe_script' lists the candidate libraries that exist there and 'plan'
+    turns that list into search paths.
+    """
+
+    def __init__(self, out: Path, target: Path, library_dirs: list[Path]) -> None:
+        """Read the dynamic sections of the files in 'out'
+
+        Args:
+            out: Store entry to plan for
+            target: Path of 'out' in the deployment, which the search paths
+                refer to
+            library_dirs: Library directories of the package and its
+                dependencies in the deployment, searched after the existing
+                search paths
+        """
+        # Dynamic section of every file in the target layout, and its
+        # candidate directories as written in the search path and with $ORIGIN
+        # expanded
+        self.files: dict[Path, tuple[DynamicSection, list[tuple[str, str]]]] = {}
+        for dirpath, _, filenames in os.walk(out):
+            for name in filenames:
+                path = Path(dirpath, name)
+                if path.is_symlink() or not path.is_file():
+                    continue
+                try:
+                    dynamic = DynamicSection.read(path)
+                except (OSError, struct.error, ValueError, UnicodeDecodeError):
+                    continue
+                if dynamic is None or not dynamic.needed:
+                    continue
+
+                target_path = target / path.relative_to(out)
+                origin = str(target_path.parent)
+                candidates = [
+                    (
+                        entry,
+                        os.path.normpath(
+                            entry.replace("${ORIGIN}", origin).replace(
+                                "$ORIGIN", origin
+                            )
+                        ),
+                    )
+                    for entry in dynamic.search_path
+                ]
+                candidates.extend((str(x), str(x)) for x in library_dirs)
+                self.files[target_path] = (dynamic, candidates)
+
+    def probe_script(self) -> str:
+        """Bash script that prints the paths of the candidate libraries that
+        exist, one per line"""
+        paths = {
+            f"{directory}/{lib}": None
+            for dynamic, candidates in self.files.values()
+            for lib in dynamic.needed
+            if "/" not in lib
+            for directory in (
+                *(x for _, x in candidates),
+                *SYSTEM_LIBRARY_DIRS,
+            )
+            if "$" not in directory
+        }
+        if not paths:
+            return ""
+        return (
+            "for path in \\\n"
+            + "".join(f"  {shlex.quote(x)} \\\n" for x in paths)
+            + '; do [ -e "$path" ] && printf \'%s\\n\' "$path"; done; true\n'
+        )
+
+    def plan(self, found: Collection[str]) -> PinPlan:
+        """Order the search path of every file by where its libraries are found
+
+        The directories that the libraries of a file are found in come first,
+        ordered by how many libraries each provides, so the loader finds each
+        library without probing unrelated directories. The rest of the search
+        path is kept after those, as it may be needed for the dependencies of
+        those libraries or for modules loaded with dlopen.
+
+        Args:
+            found: Paths of the candidate libraries that exist, as printed by
+                the probe script
+        """
+        plan = PinPlan()
+        for target_path, (dynamic, candidates) in self.files.items():
+            counts: Counter[str] = Counter()
+            for lib in dynamic.needed:
+                if "/" in lib:
+                    continue
+                found_dir = next(
+                    (entry for entry, x in candidates if f"{x}/{lib}" in found), None
+                )
+                if found_dir is not None:
+                    counts[found_dir] += 1
+                elif not any(f"{x}/{lib}" in found for x in SYSTEM_LIBRARY_DIRS):
+                    plan.unresolved.setdefault(target_path, []).append(lib)
+
+            entries = dict.fromkeys(
+                [*(x for x, _ in counts.most_common()), *dynamic.search_path]
+            )
+            rpath = ":".join(entries)
+            if rpath != ":".join(dynamic.search_path):
+                plan.rpaths[target_path] = rpath
+                if dynamic.rpath and not dynamic.runpath:
+                    plan.force_rpath.add(target_path)
+
+        return plan
+
+
+def split_debug_script(out: Path, target: Path, debug: Path) -> tuple[str, int]:
+    """Bash script that moves the debug info of the binaries in 'out' to 'debug'
+
+    Debug info is placed at '.build-id/xx/yyyy.debug' in 'debug' where the
+    binary has a build ID, so that gdb finds it when 'debug' is its debug file
+    directory, and at the binary's relative path with a '.debug' suffix
+    otherwise. Every binary is stripped and gets a debuglink to its debug info.
+
+    Args:
+        out: Store entry to strip
+        target: Path of 'out' in the build environment
+        debug: Path of the debug entry in the build environment
+
+    Returns:
+        The script and the number of binaries it strips
+    """
+    lines: list[str] = []
+    seen: set[tuple[int, int]] = set()
+    for dirpath, _, filenames in os.walk(out):
+        for name in sorted(filenames):
+            path = Path(dirpath, name)
+            if path.is_symlink() or not is_binary(path):
+                continue
+            stat = path.stat()
+            if (stat.st_dev, stat.st_ino) in seen:
+                continue
+            seen.add((stat.st_dev, stat.st_ino))
+
+            relpath = path.relative_to(out)
+            if (build_id := read_build_id(path)) is not None:
+                debugfile = debug / ".build-id" / build_id[:2] / f"{build_id[2:]}.debug"
+            else:
+                debugfile = debug / f"{relpath}.debug"
+            binary = shlex.quote(str(target / relpath))
+            debugfile_ = shlex.quote(str(debugfile))
+            lines.append(
+                f"mkdir -p {shlex.quote(str(debugfile.parent))}\n"
+                f"objcopy --only-keep-debug {binary} {debugfile_}\n"
+                "objcopy --strip-debug --strip-unneeded "
+                f"--add-gnu-debuglink={debugfile_} {binary}\n"
+            )
+    return "".join(lines), len(lines)
@@ -60,6 +60,36 @@ class Engine(Protocol):
         network: bool = True,
     ) -> Process: ...
 
+    async def start(
+        self,
+        image: str | Path,
+        *,
+        volumes: list[VolumeBind] | None = None,
+        network: bool = True,
+    ) -> str:
+        """Start a container that keeps running until 'stop' is called
+
+        Returns:
+            ID of the container, for use with 'exec' and 'stop'
+        """
+        ...
+
+    async def exec(
+        self,
+        container: str,
+        program: str | Path,
+        *args: str | Path,
+        env: dict[str, str] | None = None,
+        cwd: str | Path | None = None,
+        stdin: int | IO[Any] | None = None,
+        stdout: int | IO[Any] | None = None,
+        stderr: int | IO[Any] | None = None,
+    ) -> Process:
+        """Run a program in a container started with 'start'"""
+        ...
+
+    async def stop(self, container: str) -> None: ...
+
 
 class _Engine:
     def __init__(self, engine: EngineName, arch: CpuArchName) -> None:
@@ -142,28 +172,10 @@ class _Engine:
             if isinstance(input, str):
                 input = input.encode("utf-8")
 
-        extra_args: list[str] = []
-        if self.name == "podman":
-            extra_args.extend(["--security-opt", "label=disable"])
-
-            # Ensure that whatever the host user's IDs are, the container user is
-            # 1000:1000 (ie. the first regular user account)
-            extra_args.append("--userns=keep-id:uid=1000,gid=1000")
-
+        extra_args = self._container_args(volumes, env, network)
         if terminal:
             extra_args.append("-t")
 
-        if not network:
-            extra_args.append("--network=none")
-
-        volume_args: list[str] = []
-        for src, dst, kind in volumes:
-            volume_args.append(f"-v{src}:{dst}:{kind}")
-
-        if self.arch != "amd64":
-            console.log(
-                f"[orange]Warning. Using CPU Architecture '{self.arch}' instead of target 'amd64'"
-            )
         console.log(f"Running {str(program)} {shlex.join(map(str, args))}")
         proc = await asyncio.create_subprocess_exec(
             self.name,
@@ -172,8 +184,6 @@ class _Engine:
             f"linux/{self.arch}",
             "--rm",
             "-i",
-            *(f"-e{key}={val}" for key, val in (env or {}).items()),
-            *volume_args,
             f"--workdir={cwd}",
             *extra_args,
             image_id,
@@ -191,6 +201,90 @@ class _Engine:
 
         return proc
 
+    def _container_args(
+        self, volumes: list[VolumeBind], env: dict[str, str] | None, network: bool
+    ) -> list[str]:
+        args = [f"-e{key}={val}" for key, val in (env or {}).items()]
+        args.extend(f"-v{src}:{dst}:{kind}" for src, dst, kind in volumes)
+
+        if self.name == "podman":
+            args.extend(["--security-opt", "label=disable"])
+
+            # Ensure that whatever the host user's IDs are, the container user is
+            # 1000:1000 (ie. the first regular user account)
+            args.append("--userns=keep-id:uid=1000,gid=1000")
+
+        if not network:
+            args.append("--network=none")
+
+        if self.arch != "amd64":
+            console.log(
+                f"[orange]Warning. Using CPU Architecture '{self.arch}' instead of target 'amd64'"
+            )
+        return args
+
+    async def start(
+        self,
+        image: str | Path,
+        *,
+        volumes: list[VolumeBind] | None = None,
+        network: bool = True,
+    ) -> str:
+        image_id = image if isinstance(image, str) else await self._ensure_image(image)
+        proc = await asyncio.create_subprocess_exec(
+            self.name,
+            "run",
+            "--platform",
+            f"linux/{self.arch}",
+            "--rm",
+            "--detach",
+            *self._container_args(volumes or [], None, network),
+            image_id,
+            "sleep",
+            "infinity",
+            stdout=PIPE,
+        )
+        stdout, _ = await proc.communicate()
+        if proc.returncode != os.EX_OK:
+            raise RuntimeError(f"Could not start a container from '{image}'")
+        return stdout.decode().strip()
+
+    async def exec(
+        self,
+        container: str,
+        program: str | Path,
+        *args: str | Path,
+        env: dict[str, str] | None = None,
+        cwd: str | Path | None = None,
+        stdin: int | IO[Any] | None = None,
+        stdout: int | IO[Any] | None = None,
+        stderr: int | IO[Any] | None = None,
+    ) -> Process:
+        return await asyncio.create_subprocess_exec(
+            self.name,
+            "exec",
+            "-i",
+            *(f"-e{key}={val}" for key, val in (env or {}).items()),
+            *([f"--workdir={cwd}"] if cwd is not None else []),
+            container,
+            program,
+            *args,
+            stdin=stdin,
+            stdout=stdout,
+            stderr=stderr,
+        )
+
+    async def stop(self, container: str) -> None:
+        # The container was started with --rm, so this removes it too
+        proc = await asyncio.create_subprocess_exec(
+            self.name,
+            "kill",
+            container,
+            stdout=DEVNULL,
+            stderr=DEVNULL,
+        )
+        _ = await proc.wait()
+
 
 class _Native:
     arch: CpuArchName = _normalized_cpu_arch()
@@ -216,12 +310,7 @@ class _Native:
         if not network:
             warn("Native OCI engine doesn't support running without network")
 
-        for src, dst, _ in volumes or []:
-            if src == dst:
-                continue
-            raise RuntimeError(
-                f"When using Native engine, volume src and dst must be the same. {src=} {dst=}"
-            )
+        self._check_volumes(volumes)
 
         if input is not None:
             stdin = PIPE
@@ -245,6 +334,51 @@ class _Native:
 
         return proc
 
+    @staticmethod
+    def _check_volumes(volumes: list[VolumeBind] | None) -> None:
+        for src, dst, _ in volumes or []:
+            if src == dst:
+                continue
+            raise RuntimeError(
+                f"When using Native engine, volume src and dst must be the same. {src=} {dst=}"
+            )
+
+    async def start(
+        self,
+        image: str | Path,
+        *,
+        volumes: list[VolumeBind] | None = None,
+        network: bool = True,
+    ) -> str:
+        _ = image, network
+        self._check_volumes(volumes)
+        return ""
+
+    async def exec(
+        self,
+        container: str,
+        program: str | Path,
+        *args: str | Path,
+        env: dict[str, str] | None = None,
+        cwd: str | Path | None = None,
+        stdin: int | IO[Any] | None = None,
+        stdout: int | IO[Any] | None = None,
+        stderr: int | IO[Any] | None = None,
+    ) -> Process:
+        _ = container
+        return await asyncio.create_subprocess_exec(
+            program,
+            *args,
+            env={**os.environ, **(env or {})},
+            cwd=cwd,
+            stdin=stdin,
+            stdout=stdout,
+            stderr=stderr,
+        )
+
+    async def stop(self, container: str) -> None:
+        _ = container
+
 
 def get_engine(
     preference: EngineNameNative | None = None, arch: CpuArchNameNative | None = None
@@ -2,6 +2,7 @@ from __future__ import annotations
 import asyncio
 import os
 from pathlib import Path
+import shutil
 from aiofiles.tempfile import NamedTemporaryFile
 import httpx
 
@@ -37,10 +38,25 @@ async def fetch_git(config: GitConfig, path: Path) -> None:
 
 
 async def fetch_archive(config: ArchiveConfig, path: Path) -> None:
-    try:
-        path.mkdir(parents=True)
-    except FileExistsError:
-        return
+    """Download and extract an archive, and copy it to 'path'
+
+    The extracted archive is kept next to 'path', so that every build starts
+    from a clean copy of it rather than from the previous build's tree, like
+    the checkout that 'fetch_git' cleans.
+    """
+    pristine = path.with_name(f"{path.name}.orig")
+    if not pristine.is_dir():
+        await _extract_archive(config, pristine)
+
+    shutil.rmtree(path, ignore_errors=True)
+    _ = shutil.copytree(pristine, path, symlinks=True)
+
+
+async def _extract_archive(config: ArchiveConfig, path: Path) -> None:
+    # Extract next to 'path' so that an interrupted download is started over
+    partial = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir(parents=True)
 
     async with NamedTemporaryFile(delete=False) as file:
         assert isinstance(file.name, (str, Path)), f"{type(file.name)=}"
@@ -57,17 +73,17 @@ async def fetch_archive(config: ArchiveConfig, path: Path) -> None:
 
         # Extract using tar
         console.log("Extracting", file.name, "to", path)
-        proc = await asyncio.create_subprocess_exec("tar", "xf", file.name, cwd=path)
+        proc = await asyncio.create_subprocess_exec("tar", "xf", file.name, cwd=partial)
         if await proc.wait() != 0:
             raise RuntimeError("Couldn't extract archive")
 
     # If the extracted archive only contains a directory at the root level, move it one up.
-    files = list(path.glob("*"))
+    files = list(partial.glob("*"))
     if len(files) == 1 and files[0].is_dir():
-        temp = Path.cwd() / ".src"
-        files[0].rename(temp)
-        path.rmdir()
-        temp.rename(path)
+        files[0].rename(path)
+        partial.rmdir()
+    else:
+        partial.rename(path)
 
 
 async def fetch_single(ctx: Context, pkg: Package) -> None:
@@ -4,8 +4,18 @@ import os
 import sys
 
 from pathlib import Path
+from typing import get_args
+
 from semver import Version
 
+from karsk.config import CpuVariant
+
+
+# Name of the index file read by the wrapper, relative to bin/
+INDEX_NAME = ".versions-index"
+
+_VARIANTS: tuple[str, ...] = get_args(CpuVariant)
+
 
 def _version_key(version: Version) -> tuple[int, int, int, str, int]:
     """Sortable key that includes build metadata, which semver ignores by default."""
@@ -18,41 +28,130 @@ def _version_key(version: Version) -> tuple[int, int, int, str, int]:
     )
 
 
-def get_latest(basepath: Path) -> str:
-    latest: tuple[Version, str] | None = None
-
-    for name in os.listdir(basepath):
-        if name[0] == ".":
-            continue
-
-        path = basepath / name
-        if path.is_symlink():
-            continue
+class VersionIndex:
+    """In-memory index of a versions directory, built from a single scan"""
+
+    def __init__(self, base: Path) -> None:
+        self.base: Path = base
+        self.versions: dict[str, Version] = {}
+        self.links: dict[str, str] = {}
+        # Environments of each microarchitecture variant (eg. x86-64-v3/1.0.2+2)
+        self.variants: dict[str, list[str]] = {}
+        # Modification time of each variant directory, taken before scanning it
+        self.variant_mtimes: dict[str, int] = {}
+
+        if not base.is_dir():
+            return
+
+        with os.scandir(base) as entries:
+            for entry in entries:
+                if entry.name[0] == ".":
+                    continue
+
+                if entry.is_symlink():
+                    self.links[entry.name] = os.readlink(entry.path)
+                    continue
+
+                if entry.name in _VARIANTS and entry.is_dir():
+                    self.variant_mtimes[entry.name] = entry.stat().st_mtime_ns
+                    with os.scandir(entry.path) as envs:
+                        self.variants[entry.name] = sorted(
+                            env.name for env in envs if env.name[0] != "."
+                        )
+                    continue
+
+                try:
+                    self.versions[entry.name] = Version.parse(entry.name)
+                except ValueError:
+                    continue
+
+    def latest(self) -> str:
+        assert self.versions
+        return max(self.versions, key=lambda name: _version_key(self.versions[name]))
+
+    def auto_aliases(self) -> dict[str, str]:
+        entries: dict[tuple[int, ...], str] = {}
+        for name, version in self.versions.items():
+            build = int(version.build) if version.build else 0
+            entries[(version.major, version.minor, version.patch, build)] = name
+
+        aliases: dict[str, str] = {}
+        _reduce_aliases(entries, aliases)
+
+        return aliases
+
+    def _follow(self, name: str) -> str:
+        seen: set[str] = set()
+        while name in self.links and name not in seen:
+            seen.add(name)
+            name = self.links[name]
+        return name
+
+    def resolve(self, name: str) -> Path:
+        """Follow links within the index, falling back to the file system for
+        targets outside of it"""
+        name = self._follow(name)
+        if name in self.versions:
+            return self.base / name
+        return (self.base / name).resolve()
+
+    def write(self, path: Path) -> None:
+        """Write the index read by the wrapper
+
+        The index records the modification time of the versions directory and
+        of each variant directory in it, so that the wrapper can detect when
+        it is stale.
+        """
+        if not self.base.is_dir():
+            return
+
+        lines = [
+            "karsk-versions\t2",
+            f"mtime\t{self.base.stat().st_mtime_ns}",
+            *(
+                f"variant-mtime\t{variant}\t{self.variant_mtimes[variant]}"
+                for variant in sorted(self.variants)
+            ),
+            *(
+                f"version\t{name}"
+                for name in sorted(
+                    self.versions,
+                    key=lambda x: _version_key(self.versions[x]),
+                    reverse=True,
+                )
+            ),
+            *(
+                f"alias\t{name}\t{target}"
+                for name in sorted(self.links)
+                if (target := self._follow(name)) in self.versions
+            ),
+            *(
+                f"variant\t{variant}\t{name}"
+                for variant in sorted(self.variants)
+                for name in self.variants[variant]
+            ),
+        ]
+
+        tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+        _ = tmp.write_text("".join(f"{line}\n" for line in lines))
+        os.replace(tmp, path)
+
+    def validate(self) -> None:
+        for name in self.links:
+            target = self.resolve(name)
+            if target.name not in self.versions and not target.is_dir():
+                print(
+                    f"'{name}' links to '{target}' which doesn't exist!",
+                    file=sys.stderr,
+                )
 
-        try:
-            version = Version.parse(name)
-        except ValueError:
-            continue
 
-        if latest is None or _version_key(version) > _version_key(latest[0]):
-            latest = (version, name)
-
-    assert latest is not None
-    return latest[1]
+def get_latest(basepath: Path) -> str:
+    return VersionIndex(basepath).latest()
 
 
 def validate(base: Path) -> None:
-    for name in os.listdir(base):
-        if name[0] == ".":
-            continue
-
-        path = base / name
-        if not path.is_symlink():
-            continue
-
-        target = path.resolve()
-        if not target.is_dir():
-            print(f"'{name}' links to '{target}' which doesn't exist!", file=sys.stderr)
+    VersionIndex(base).validate()
 
 
 def _reduce_aliases(
@@ -78,44 +177,29 @@ def _reduce_aliases(
     _reduce_aliases(next_entries, aliases)
 
 
-def _get_auto_version_aliases(destination: Path) -> dict[str, str]:
-    if not destination.is_dir():
-        return {}
-
-    entries: dict[tuple[int, ...], str] = {}
-    for name in os.listdir(destination):
-        if name[0] == ".":
-            continue
-        if (destination / name).is_symlink():
-            continue
-        try:
-            version = Version.parse(name)
-        except ValueError:
-            continue
-        build = int(version.build) if version.build else 0
-        entries[(version.major, version.minor, version.patch, build)] = name
-
-    aliases: dict[str, str] = {}
-    _reduce_aliases(entries, aliases)
-
-    return aliases
+def atomic_symlink(target: str, path: Path) -> None:
+    """Point 'path' to 'target' without a window in which 'path' doesn't exist"""
+    tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    tmp.unlink(missing_ok=True)
+    tmp.symlink_to(target)
+    os.replace(tmp, path)
 
 
 def make_links(
     links: dict[str, str],
     destination: Path,
 ) -> None:
-    auto_aliases = _get_auto_version_aliases(destination)
-    merged = {**auto_aliases, **links}
+    index = VersionIndex(destination)
+    merged = {**index.auto_aliases(), **links}
 
     for source, target in merged.items():
         path = destination / source
 
         if target == "^":
-            target = get_latest(destination)
+            target = index.latest()
 
-        path.unlink(missing_ok=True)
-        path.symlink_to(target)
+        atomic_symlink(target, path)
+        index.links[source] = target
         print(f"Created symlink: {path} -> {target}")
 
-    validate(destination)
+    index.validate()
@@ -4,7 +4,13 @@ import hashlib
 from functools import cached_property
 from pathlib import Path
 
-from karsk.config import ArchiveConfig, PackageConfig, FileConfig, GitConfig
+from karsk.config import (
+    ArchiveConfig,
+    CpuVariant,
+    PackageConfig,
+    FileConfig,
+    GitConfig,
+)
 
 
 SCRIPTS = Path(__file__).parent / "scripts"
@@ -17,11 +23,13 @@ class Package:
         depends: list[Package],
         build_image: Path,
         initial_hash: bytes,
+        variant: CpuVariant | None = None,
     ) -> None:
         self.config = config
         self.depends = depends
         self.build_image: Path = build_image
         self.initial_hash = initial_hash
+        self.variant: CpuVariant | None = variant
 
     @property
     def fullname(self) -> str:
@@ -52,7 +60,13 @@ class Package:
         h = hashlib.sha1(usedforsecurity=False)
 
         h.update(self.initial_hash)
-        h.update(self.config.model_dump_json().encode("utf-8"))
+        h.update(
+            self.config.model_dump_json(exclude={"post_build", "pgo"}).encode("utf-8")
+        )
+        if self.config.post_build:
+            h.update(",".join(self.config.post_build).encode("utf-8"))
+        if self.config.pgo is not None:
+            h.update(self.config.pgo.model_dump_json().encode("utf-8"))
 
         if (
             isinstance(self.config.src, FileConfig)
@@ -66,6 +80,29 @@ class Package:
 
         return h.hexdigest()
 
+    @cached_property
+    def profile_hash(self) -> str:
+        """Hash of the inputs that a PGO profile depends on
+
+        Unlike the buildhash, this excludes the dependencies, the build image
+        and the post-build steps, so that a profile is reused when only those
+        change.
+        """
+        h = hashlib.sha1(usedforsecurity=False)
+
+        h.update(self.config.model_dump_json(exclude={"post_build"}).encode("utf-8"))
+        if self.variant is not None:
+            h.update(self.variant.encode("utf-8"))
+
+        if (
+            isinstance(self.config.src, FileConfig)
+            and self.src_relpath is not None
+            and self.src_relpath.is_absolute()
+        ):
+            h.update(self.src_relpath.read_bytes())
+
+        return h.hexdigest()
+
     @cached_property
     def manifest(self) -> str:
         return "".join(sorted(f"{x.out_relpath}\n" for x in [*self.depends, self]))
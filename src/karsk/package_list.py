@@ -5,7 +5,7 @@ from itertools import chain
 import sys
 import networkx as nx
 
-from karsk.config import Config
+from karsk.config import Config, CpuVariant
 from karsk.engine import VolumeBind
 from karsk.package import Package
 from karsk.paths import Paths
@@ -19,10 +19,12 @@ class PackageList:
         target_paths: Paths,
         *,
         check_existence: bool = True,
+        variant: CpuVariant | None = None,
     ) -> None:
         self.staging_paths: Paths = staging_paths
         self.target_paths: Paths = target_paths
         self.config: Config = config
+        self.variant: CpuVariant | None = variant
         buildmap = {x.name: x for x in config.packages}
 
         self.staging_paths.store.mkdir(parents=True, exist_ok=True)
@@ -50,6 +52,7 @@ class PackageList:
                 node_depends,
                 config.build_image,
                 initial_hash,
+                variant,
             )
             transitive_depends[new_package] = node_depends
             self.packages[node] = new_package
@@ -62,20 +65,36 @@ class PackageList:
 
         h.update(self.config.destination.as_posix().encode())
         h.update(self.config.build_image.read_bytes())
+        if self.variant is not None:
+            h.update(self.variant.encode())
 
         return h.digest()
 
     def volumes(self, package_names: list[str]) -> list[VolumeBind]:
-        pnames = set(package_names)
+        # 'depends' is already the transitive closure of each package
+        packages: dict[Package, None] = {}
         for pname in package_names:
             pkg = self.packages[pname]
-            pnames |= set(p.config.name for p in pkg.depends)
+            packages.update(dict.fromkeys([pkg, *pkg.depends]))
 
         return [
             (self.staging_paths.out(pkg), self.target_paths.out(pkg), "ro")
-            for pkg in (self.packages[pname] for pname in pnames)
+            for pkg in packages
         ]
 
+    def changed_since(self, manifest: str) -> set[str]:
+        """Names of the packages that aren't in the manifest of an environment
+
+        A buildhash includes the buildhashes of the dependencies, so every
+        package that depends on a changed package has changed as well.
+        """
+        entries = set(manifest.split())
+        return {
+            name
+            for name, pkg in self.packages.items()
+            if str(pkg.out_relpath) not in entries
+        }
+
     def _check_existence(self) -> None:
         for pkg in self.packages.values():
             out = self.staging_paths.out(pkg)
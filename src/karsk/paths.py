@@ -13,6 +13,7 @@ class Paths:
         self.bin: Path = base / "bin"
         self.versions: Path = base / "versions"
         self.store: Path = base / "store"
+        self.images: Path = base / "images"
 
     @property
     def cache(self) -> Path:
@@ -22,6 +23,10 @@ class Paths:
     def out(self, pkg: Package) -> Path:
         return self.store / pkg.out_relpath
 
+    def debug(self, pkg: Package) -> Path:
+        """Path for the debug info split off the output of 'pkg'"""
+        return self.store / f"{pkg.out_relpath}.debug"
+
     def src(self, pkg: Package) -> Path | None:
         if (p := pkg.src_relpath) is None:
             return None
@@ -0,0 +1,93 @@
+"""Running many programs in a single long-lived container"""
+
+from __future__ import annotations
+import asyncio
+from asyncio.subprocess import DEVNULL, PIPE
+from collections.abc import Iterable, Sequence
+import os
+from pathlib import Path
+from subprocess import CompletedProcess
+from typing import Self
+
+from karsk.engine import Engine
+
+
+class EnvironmentSession:
+    """A running container in which programs are run using 'exec'
+
+    Starting a container takes much longer than running a small program, so
+    this is much faster than Context.run when running many short commands.
+    Sessions are created by Context.start_session.
+    """
+
+    def __init__(
+        self, engine: Engine, container: str, *, env: dict[str, str] | None = None
+    ) -> None:
+        self.engine: Engine = engine
+        self.container: str = container
+        self.env: dict[str, str] = env or {}
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    async def run(
+        self,
+        program: str | Path,
+        *args: str | Path,
+        env: dict[str, str] | None = None,
+        cwd: str | Path | None = None,
+        input: str | bytes | None = None,
+    ) -> CompletedProcess[bytes]:
+        """Run a program in the container and wait for it to finish
+
+        Returns:
+            The exit code and the captured output of the program
+        """
+        proc = await self.engine.exec(
+            self.container,
+            program,
+            *args,
+            env={**self.env, **(env or {})},
+            cwd=cwd,
+            stdin=DEVNULL if input is None else PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+        )
+        if isinstance(input, str):
+            input = input.encode("utf-8")
+        stdout, stderr = await proc.communicate(input)
+        assert proc.returncode is not None
+        return CompletedProcess([program, *args], proc.returncode, stdout, stderr)
+
+    async def run_many(
+        self,
+        commands: Iterable[Sequence[str | Path]],
+        *,
+        jobs: int | None = None,
+        env: dict[str, str] | None = None,
+        cwd: str | Path | None = None,
+    ) -> list[CompletedProcess[bytes]]:
+        """Run programs in the container, up to 'jobs' of them at a time
+
+        Args:
+            commands: Program and arguments of each command
+            jobs: Number of commands to run at a time. Defaults to the number
+                of CPUs
+
+        Returns:
+            The results of the commands, in the same order
+        """
+        semaphore = asyncio.Semaphore(jobs or os.cpu_count() or 1)
+
+        async def run(command: Sequence[str | Path]) -> CompletedProcess[bytes]:
+            async with semaphore:
+                return await self.run(*command, env=env, cwd=cwd)
+
+        return await asyncio.gather(*(run(command) for command in commands))
+
+    async def close(self) -> None:
+        """Stop the container"""
+        await self.engine.stop(self.container)
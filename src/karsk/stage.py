@@ -0,0 +1,253 @@
+"""Staging of deployed versions onto node-local storage and into images"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Literal
+
+from karsk.checksums import CHECKSUMS, file_hash, read_checksums
+from karsk.console import console
+from karsk.elf import DynamicSection, is_binary
+from karsk.links import VersionIndex
+from karsk.paths import Paths
+
+ImageFormat = Literal["squashfs", "erofs"]
+
+
+def stage_local(
+    paths: Paths,
+    version: str,
+    to: Path,
+    *,
+    variant: str | None = None,
+    squashfs: bool = False,
+) -> Path:
+    """Copy a version environment to 'to' with all symlinks flattened
+
+    Files that resolve to the same store file are hardlinked instead of copied
+    again. Every file is verified against the checksums of its store entry.
+
+    Args:
+        paths: Paths of the deployment to stage from
+        version: Version or alias to stage
+        to: Directory in which to place the staged version
+        variant: Stage the build of the version for this variant instead of
+            the generic build. It is placed in a subdirectory of 'to' named
+            after the variant, where the wrapper scripts look for it.
+        squashfs: Pack the staged version into a SquashFS image
+
+    Returns:
+        Path to the staged version directory, or to the image if 'squashfs'
+        is set.
+    """
+    env = VersionIndex(paths.versions).resolve(version)
+    if not (env / "manifest").is_file():
+        sys.exit(f"No such version: {version}")
+    if variant is not None:
+        env = paths.versions / variant / env.name
+        to = to / variant
+        if not (env / "manifest").is_file():
+            sys.exit(f"No build of {env.name} for variant {variant}")
+
+    dest = to / env.name
+    tmp = to / f".{env.name}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    console.log(f"Staging {env.name} to {dest}")
+    count = _materialise(paths, env, tmp)
+    shutil.rmtree(dest, ignore_errors=True)
+    tmp.rename(dest)
+    console.log(f"Staged {count} files")
+
+    if not squashfs:
+        return dest
+
+    image = to / f"{env.name}.squashfs"
+    _pack(dest, image, "squashfs")
+    shutil.rmtree(dest)
+    return image
+
+
+def make_image(paths: Paths, env: Path, image_format: ImageFormat) -> Path:
+    """Pack a version environment into a compressed read-only image
+
+    The image contains the environment with all symlinks flattened, so that it
+    can be mounted in place of the symlink farm and the store entries it
+    refers to. Existing images are kept as they are.
+
+    Args:
+        paths: Paths of the deployment containing the environment
+        env: Path to the environment (eg. versions/1.0.2+2, or
+            versions/x86-64-v3/1.0.2+2 for a variant)
+        image_format: File system of the image
+
+    Returns:
+        Path to the image in 'images/', in a subdirectory named after the
+        variant if 'env' is one
+    """
+    image = paths.images / f"{env.relative_to(paths.versions)}.{image_format}"
+    if image.exists():
+        print(f"Image already exists at {image}", file=sys.stderr)
+        return image
+
+    image.parent.mkdir(parents=True, exist_ok=True)
+    with TemporaryDirectory(prefix="karsk-image-") as tmp:
+        root = Path(tmp, env.name)
+        _ = _materialise(paths, env, root)
+
+        partial = image.with_name(f".{image.name}.tmp-{os.getpid()}")
+        _pack(root, partial, image_format)
+        os.replace(partial, image)
+
+    console.log(f"Created image {image}")
+    return image
+
+
+def _materialise(paths: Paths, env: Path, dest: Path) -> int:
+    """Copy the files of 'env' to 'dest', following all symlinks
+
+    Files from the store are verified against the checksums of their entry.
+    Those that have none, because the entry has no checksum manifest or
+    doesn't list the file, are reported in a warning.
+
+    Returns:
+        Number of distinct files copied
+    """
+    store = paths.store.resolve()
+    entries = set(env.joinpath("manifest").read_text().split())
+    if missing := [x for x in entries if not (store / x).is_dir()]:
+        sys.exit(f"Store entries of {env.name} are missing: {', '.join(missing)}")
+
+    copies: dict[Path, list[Path]] = {}
+    checksums: dict[str, dict[str, str]] = {}
+    # Number of files without a checksum, by store entry
+    unverified: dict[str, int] = {}
+    for dirpath, _, filenames in os.walk(env, followlinks=True):
+        dstdir = dest / Path(dirpath).relative_to(env)
+        dstdir.mkdir(parents=True, exist_ok=True)
+        for name in filenames:
+            src = Path(dirpath, name).resolve()
+            dst = dstdir / name
+            if src in copies:
+                os.link(copies[src][0], dst)
+                copies[src].append(dst)
+                continue
+
+            _ = shutil.copy2(src, dst)
+            copies[src] = [dst]
+
+            if not src.is_relative_to(store):
+                continue
+            entry, *rest = src.relative_to(store).parts
+            # The manifest doesn't list itself
+            if rest == [CHECKSUMS]:
+                continue
+            if entry not in checksums:
+                checksums[entry] = read_checksums(store / entry)
+            expected = checksums[entry].get("/".join(rest))
+            if expected is None:
+                unverified[entry] = unverified.get(entry, 0) + 1
+            elif file_hash(dst) != expected:
+                shutil.rmtree(dest)
+                sys.exit(f"Checksum mismatch for {dst.relative_to(dest)} from {entry}")
+
+    if unverified:
+        console.log(
+            f"[yellow]{sum(unverified.values())} files of {env.name} have no "
+            f"checksums and are unverified, from: {', '.join(sorted(unverified))}"
+        )
+
+    for src, dsts in copies.items():
+        if src.is_relative_to(store) and is_binary(dsts[0]):
+            _relocate_libraries(store, src, dsts, copies)
+    return len(copies)
+
+
+def _relocate_libraries(
+    store: Path, src: Path, dsts: list[Path], copies: dict[Path, list[Path]]
+) -> None:
+    """Point the search paths of the copies of an ELF file to the copies of its
+    libraries, relative to $ORIGIN, instead of to the store
+
+    Copies in different directories need different search paths, so they stop
+    being hardlinks of each other.
+    """
+    if (dynamic := DynamicSection.read(dsts[0])) is None:
+        return
+    # The loader ignores the RPATH of files that have a RUNPATH
+    entries = dynamic.runpath or dynamic.rpath
+    if not entries:
+        return
+
+    origin = str(src.parent)
+    expanded = [
+        os.path.normpath(x.replace("${ORIGIN}", origin).replace("$ORIGIN", origin))
+        for x in entries
+    ]
+    # Copy of each library, by the index of the entry the loader finds it in
+    found: dict[int, list[Path]] = {}
+    for lib in dynamic.needed:
+        if "/" in lib:
+            continue
+        for i, directory in enumerate(expanded):
+            if "$" in directory or not (path := Path(directory, lib)).exists():
+                continue
+            if (libcopies := copies.get(path.resolve())) is not None:
+                copy = next((x for x in libcopies if x.name == lib), libcopies[0])
+                found.setdefault(i, []).append(copy.parent)
+            break
+
+    groups: dict[str, list[Path]] = {}
+    for dst in dsts:
+        parts: list[str] = []
+        for i, (entry, directory) in enumerate(zip(entries, expanded)):
+            if "$" in directory:
+                parts.append(entry)
+            elif i in found:
+                parts.extend(
+                    "$ORIGIN" if rel == "." else f"$ORIGIN/{rel}"
+                    for rel in (os.path.relpath(x, dst.parent) for x in found[i])
+                )
+            else:
+                parts.append(directory)
+        groups.setdefault(":".join(dict.fromkeys(parts)), []).append(dst)
+
+    if list(groups) == [":".join(entries)]:
+        return
+    if shutil.which("patchelf") is None:
+        sys.exit(f"'patchelf' was not found in $PATH, which is needed for {src}")
+
+    for group in list(groups.values())[1:]:
+        for dst in group:
+            dst.unlink()
+        _ = shutil.copy2(dsts[0], group[0])
+        for dst in group[1:]:
+            os.link(group[0], dst)
+    for rpath, group in groups.items():
+        _ = subprocess.run(
+            [
+                "patchelf",
+                *(["--force-rpath"] if not dynamic.runpath else []),
+                "--set-rpath",
+                rpath,
+                group[0],
+            ],
+            check=True,
+        )
+
+
+def _pack(src: Path, image: Path, image_format: ImageFormat) -> None:
+    args: list[str | Path]
+    if image_format == "squashfs":
+        args = ["mksquashfs", src, image, "-noappend", "-quiet"]
+    else:
+        args = ["mkfs.erofs", "-zlz4hc", image, src]
+
+    if shutil.which(str(args[0])) is None:
+        sys.exit(f"'{args[0]}' was not found in $PATH")
+    _ = subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
@@ -1,15 +1,254 @@
 """Utilities for testing Karsk packages using pytest"""
 
 from __future__ import annotations
+import asyncio
+from collections.abc import Iterator
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, cast
+
 import pytest
 
 from karsk.context import Context
+from karsk.engine import EngineNameNative
+from karsk.session import EnvironmentSession
 
 
 _CONTEXT: Context | None = None
 
+# Set by 'karsk test' for the worker processes it spawns, each of which
+# creates its own context
+CONFIG_ENV = "KARSK_TEST_CONFIG"
+STAGING_ENV = "KARSK_TEST_STAGING"
+
+
+def _get_context() -> Context:
+    global _CONTEXT
+    if _CONTEXT is None:
+        _CONTEXT = Context.from_config_file(
+            Path(os.environ[CONFIG_ENV]),
+            staging=Path(os.environ[STAGING_ENV]),
+            engine=cast(EngineNameNative | None, os.environ.get("KARSK_ENGINE")),
+        )
+    return _CONTEXT
+
 
 @pytest.fixture
 def karsk() -> Context:
-    assert _CONTEXT is not None
-    return _CONTEXT
+    return _get_context()
+
+
+@pytest.fixture(scope="session")
+def karsk_session() -> Iterator[EnvironmentSession]:
+    """A single container for the whole test session, with every package
+
+    The container is started and stopped outside of any event loop, so that
+    the session can be used from async tests regardless of their loop scope.
+    """
+    session = asyncio.run(_get_context().start_session())
+    yield session
+    asyncio.run(session.close())
+
+
+def node_key(config: pytest.Config, nodeid: str) -> str:
+    """Node ID that doesn't depend on the rootdir of the pytest session"""
+    return f"{config.rootpath}/{nodeid}"
+
+
+def declared_packages(item: pytest.Item) -> list[str] | None:
+    """Packages that a test exercises according to its 'packages' markers
+
+    Returns:
+        None if the test doesn't declare any, in which case it is assumed to
+        exercise all of them
+    """
+    markers = list(item.iter_markers("packages"))
+    if not markers:
+        return None
+    return [name for marker in markers for name in marker.args]
+
+
+def _directory_hash(directory: Path) -> str:
+    """Hash of the names and contents of the files under 'directory', skipping
+    hidden directories and bytecode caches"""
+    h = hashlib.sha1(usedforsecurity=False)
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(
+            x for x in dirnames if not x.startswith(".") and x != "__pycache__"
+        )
+        for name in sorted(filenames):
+            path = Path(dirpath, name)
+            if path.is_file():
+                h.update(f"{path.relative_to(directory)}\0".encode())
+                h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def _inputs_hash(
+    ctx: Context,
+    path: Path,
+    packages: list[str] | None,
+    directories: dict[Path, str],
+) -> str:
+    """Hash of everything that a test in the file at 'path' depends on
+
+    This is the buildhash of the packages it exercises and their dependencies,
+    which covers the Containerfile too, every file in the directory of the
+    test file and below it, such as data files and helper modules, and any
+    conftest.py above it.
+
+    Args:
+        directories: Hashes of the directories of test files, shared between
+            the calls for a session
+    """
+    h = hashlib.sha1(usedforsecurity=False)
+    h.update(ctx.config.build_image.read_bytes())
+    for name, pkg in sorted(ctx.plist.packages.items()):
+        if packages is not None and not any(
+            name == x or pkg in ctx.plist.packages[x].depends for x in packages
+        ):
+            continue
+        h.update(f"{name}\0{pkg.buildhash}\0".encode())
+    if path.parent not in directories:
+        directories[path.parent] = _directory_hash(path.parent)
+    h.update(directories[path.parent].encode())
+    for parent in path.parents:
+        if (conftest := parent / "conftest.py").is_file():
+            h.update(conftest.read_bytes())
+        if ctx.config.tests is not None and parent == ctx.config.tests:
+            break
+    return h.hexdigest()
+
+
+class _Report:
+    """Records the tests collected and the outcome and duration of each
+
+    Tests that passed last time with the same inputs, according to the cache
+    file, are skipped and reported as cached.
+    """
+
+    def __init__(self, config: pytest.Config, path: Path, cache: Path | None) -> None:
+        self.config: pytest.Config = config
+        self.path: Path = path
+        self.collected: list[str] = []
+        self.results: dict[str, dict[str, Any]] = {}
+        self.keys: dict[str, str] = {}
+        self.cached: set[str] = set()
+
+        self.previous: dict[str, str] = {}
+        if cache is not None and cache.is_file():
+            self.previous = json.loads(cache.read_text())
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, items: list[pytest.Item]) -> None:
+        ctx = _get_context()
+        hashes: dict[tuple[Path, tuple[str, ...] | None], str] = {}
+        directories: dict[Path, str] = {}
+        for item in items:
+            packages = declared_packages(item)
+            inputs = (item.path, None if packages is None else tuple(packages))
+            if inputs not in hashes:
+                hashes[inputs] = _inputs_hash(ctx, item.path, packages, directories)
+            nodeid = node_key(self.config, item.nodeid)
+            self.keys[nodeid] = hashes[inputs]
+            if self.previous.get(nodeid) == hashes[inputs]:
+                self.cached.add(nodeid)
+                item.add_marker(pytest.mark.skip(reason="cached"))
+
+    def pytest_collection_finish(self, session: pytest.Session) -> None:
+        self.collected = [node_key(self.config, item.nodeid) for item in session.items]
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        nodeid = node_key(self.config, report.nodeid)
+        result = self.results.setdefault(
+            nodeid,
+            {"outcome": "passed", "duration": 0.0, "key": self.keys.get(nodeid)},
+        )
+        result["duration"] += report.duration
+        if nodeid in self.cached:
+            result["outcome"] = "cached"
+        elif report.failed:
+            result["outcome"] = "failed"
+        elif report.skipped and result["outcome"] == "passed":
+            result["outcome"] = "skipped"
+
+    def pytest_terminal_summary(
+        self, terminalreporter: pytest.TerminalReporter
+    ) -> None:
+        if self.cached:
+            terminalreporter.write_line(
+                f"karsk: {len(self.cached)} tests skipped because they passed "
+                "before with the same packages and test files (--no-cache to run them)"
+            )
+
+    def pytest_sessionfinish(self) -> None:
+        self.path.write_text(
+            json.dumps(
+                {
+                    "collected": self.collected,
+                    "cached": sorted(self.cached),
+                    "results": self.results,
+                }
+            )
+        )
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--karsk-report",
+        type=Path,
+        help="Write the collected tests and their outcomes to this JSON file",
+    )
+    parser.addoption(
+        "--karsk-changed-since",
+        type=Path,
+        help="Only run tests of packages that aren't in this environment manifest",
+    )
+    parser.addoption(
+        "--karsk-cache",
+        type=Path,
+        help="Skip tests that passed with the same inputs according to this file",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line(
+        "markers",
+        "packages(*names): the Karsk packages that the test exercises, used to "
+        "select tests with 'karsk test --changed-since'",
+    )
+    if (path := config.getoption("karsk_report")) is not None:
+        config.pluginmanager.register(
+            _Report(config, path, config.getoption("karsk_cache")), "karsk-report"
+        )
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    declared = {item: declared_packages(item) for item in items}
+    if not any(declared.values()):
+        return
+
+    plist = _get_context().plist
+    for item, packages in declared.items():
+        if unknown := [x for x in packages or [] if x not in plist.packages]:
+            raise pytest.UsageError(
+                f"{item.nodeid} is marked with unknown packages: {', '.join(unknown)}"
+            )
+
+    if (manifest := config.getoption("karsk_changed_since")) is None:
+        return
+
+    # Tests that don't declare their packages are always run
+    changed = plist.changed_since(manifest.read_text())
+    deselected = {
+        item
+        for item, packages in declared.items()
+        if packages is not None and not changed.intersection(packages)
+    }
+    if deselected:
+        config.hook.pytest_deselected(items=[x for x in items if x in deselected])
+        items[:] = [x for x in items if x not in deselected]
@@ -1,5 +1,7 @@
 from __future__ import annotations
 import asyncio
+import os
+from pathlib import Path
 import re
 from traceback import print_exception
 from typing import Any
@@ -29,3 +31,14 @@ async def redirect_output(
     except Exception as exc:
         for fd in fds:
             print_exception(exc, file=fd)
+
+
+def directory_size(path: Path) -> int:
+    """Total size in bytes of all files below 'path', not following symlinks"""
+    if not path.is_dir():
+        return path.lstat().st_size
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in (*dirnames, *filenames):
+            total += os.lstat(os.path.join(dirpath, name)).st_size
+    return total
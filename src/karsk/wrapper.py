@@ -9,6 +9,7 @@ from typing import overload
 from karsk.console import console
 from karsk.context import Context
 from karsk.engine import Engine
+from karsk.links import INDEX_NAME, VersionIndex
 from karsk.paths import Paths
 
 
@@ -79,3 +80,5 @@ async def install_wrapper(ctx: Context, paths: Paths) -> None:
     for entry in ctx.config.entrypoints:
         console.log(f"- [blue]bin/{entry}")
         (paths.bin / entry).symlink_to(".wrapper")
+
+    VersionIndex(paths.versions).write(paths.bin / INDEX_NAME)
@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+import yaml
+from click.testing import CliRunner
+
+from karsk.bench import parse_cpus, regressions, run_benchmarks
+from karsk.cli import cli
+from karsk.config import BenchmarksConfig
+from karsk.paths import Paths
+
+
+WRAPPER = """\
+#!/bin/sh
+[ "$1" = --version ] || exit 2
+exec "$(dirname "$0")/../versions/$2/bin/$(basename "$0")" "$@"
+"""
+
+
+@pytest.fixture
+def deployment(tmp_path):
+    """Deployment with a version that is slower than the other"""
+    base = tmp_path / "dest"
+    for version, delay in [("1.0.0+1", "0"), ("1.0.0+2", "0.2")]:
+        (base / f"versions/{version}/bin").mkdir(parents=True)
+        program = base / f"versions/{version}/bin/prog"
+        program.write_text(f"#!/bin/sh\nsleep {delay}\ncat data.txt\n")
+        program.chmod(0o755)
+    (base / "bin").mkdir()
+    (base / "bin/prog").write_text(WRAPPER)
+    (base / "bin/prog").chmod(0o755)
+
+    (tmp_path / "inputs").mkdir()
+    (tmp_path / "inputs/data.txt").write_text("data\n")
+    return base
+
+
+def test_parse_cpus():
+    assert parse_cpus("0-2,5") == {0, 1, 2, 5}
+    assert parse_cpus("3") == {3}
+
+
+def test_run_benchmarks(deployment, tmp_path):
+    config = BenchmarksConfig.model_validate(
+        {
+            "repeat": 2,
+            "warmup": 0,
+            "commands": [{"name": "small", "command": ["prog"], "inputs": "inputs"}],
+        },
+        context={"cwd": tmp_path},
+    )
+    results = run_benchmarks(Paths(deployment), config, ["1.0.0+1", "1.0.0+2"])
+
+    assert [(x.benchmark, x.version, len(x.runs)) for x in results] == [
+        ("small", "1.0.0+1", 2),
+        ("small", "1.0.0+2", 2),
+    ]
+    assert results[1].wall > results[0].wall + 0.15
+    assert results[0].maxrss > 0
+
+    assert len(regressions(results, 0.1)) == 1
+    assert regressions(results[::-1], 0.1) == []
+
+
+@pytest.mark.parametrize(
+    "versions,exit_code", [(["1.0.0+2", "1.0.0+1"], 0), (["1.0.0+1", "1.0.0+2"], 1)]
+)
+def test_bench_command(deployment, tmp_path, versions, exit_code):
+    config = {
+        "destination": str(deployment),
+        "main-package": "A",
+        "entrypoints": ["prog"],
+        "build-image": os.path.join(os.path.dirname(__file__), "test_build_image"),
+        "packages": [],
+        "benchmarks": {
+            "repeat": 1,
+            "commands": [{"name": "small", "command": ["prog"], "inputs": "inputs"}],
+        },
+    }
+    (tmp_path / "config.yaml").write_text(yaml.dump(config))
+
+    result = CliRunner().invoke(
+        cli,
+        [
+            "bench",
+            str(tmp_path / "config.yaml"),
+            *versions,
+            "--json",
+            str(tmp_path / "bench.json"),
+        ],
+    )
+    assert result.exit_code == exit_code, result.output
+
+    data = json.loads((tmp_path / "bench.json").read_text())
+    assert [x["version"] for x in data["results"]] == versions
+    assert len(data["regressions"]) == exit_code
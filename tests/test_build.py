@@ -336,3 +336,137 @@ async def test_install_appends_build_id_when_manifest_differs(
     manifest1 = (destination / "versions/1.0.0+1" / "manifest").read_text()
     manifest2 = (destination / "versions/1.0.0+2" / "manifest").read_text()
     assert manifest1 != manifest2
+
+
+async def test_build_variants(tmp_path, base_config):
+    base_config["destination"] = str(tmp_path)
+    base_config["main-package"] = "test"
+    base_config["variants"] = ["x86-64-v3"]
+    base_config["packages"].append(
+        {"name": "test", "version": "1.0.0", "build": "echo $CFLAGS > $out/cflags"}
+    )
+    ctx = Context.from_config(
+        base_config, cwd=tmp_path, staging=tmp_path, engine="native"
+    )
+    if ctx.engine.arch != "amd64":
+        pytest.skip("Variants are only built for amd64")
+
+    await build_all(ctx)
+
+    variant = ctx.variants["x86-64-v3"].packages["test"]
+    assert variant.buildhash != ctx["test"].buildhash
+    assert (ctx.out("test") / "cflags").read_text() == "-O3\n"
+    assert (ctx.out(variant) / "cflags").read_text() == "-O3 -march=x86-64-v3\n"
+
+    env = tmp_path / "versions" / "x86-64-v3" / "1.0.0+1"
+    assert (env / "cflags").resolve() == (ctx.out(variant) / "cflags").resolve()
+    assert (env / "manifest").read_text() == variant.manifest
+    assert "variant\tx86-64-v3\t1.0.0+1" in (
+        (tmp_path / "bin" / ".versions-index").read_text().splitlines()
+    )
+
+
+async def test_build_variants_from_clean_source(tmp_path, base_config):
+    base_config["destination"] = str(tmp_path)
+    base_config["main-package"] = "test"
+    base_config["variants"] = ["x86-64-v3"]
+    base_config["packages"].append(
+        {
+            "name": "test",
+            "version": "1.0.0",
+            "src": {"type": "archive", "url": "https://example.com/test.tar.gz"},
+            "build": "[ -e built ] && touch $out/reused\n"
+            "echo $CFLAGS > built\n"
+            "cp built configure $out\n",
+        }
+    )
+    ctx = Context.from_config(
+        base_config, cwd=tmp_path, staging=tmp_path, engine="native"
+    )
+    if ctx.engine.arch != "amd64":
+        pytest.skip("Variants are only built for amd64")
+
+    # An already extracted archive is not downloaded again
+    pristine = tmp_path / "cache" / "test-1.0.0.orig"
+    pristine.mkdir(parents=True)
+    (pristine / "configure").write_text("#!/bin/sh\n")
+
+    await build_all(ctx)
+
+    variant = ctx.variants["x86-64-v3"].packages["test"]
+    assert not (ctx.out("test") / "reused").exists()
+    assert not (ctx.out(variant) / "reused").exists()
+    assert (ctx.out(variant) / "built").read_text() == "-O3 -march=x86-64-v3\n"
+    assert (ctx.out(variant) / "configure").read_text() == "#!/bin/sh\n"
+    assert not (pristine / "built").exists()
+
+
+def _git_repo(repo: Path, files: dict[str, str]) -> str:
+    """Create a git repository with a single commit, returning its hash"""
+    repo.mkdir()
+    for name, content in files.items():
+        (repo / name).write_text(content)
+    git = ["git", "-C", repo, "-c", "user.name=karsk", "-c", "user.email=karsk@"]
+    subprocess.run([*git, "init", "-q"], check=True)
+    subprocess.run([*git, "add", *files], check=True)
+    subprocess.run([*git, "commit", "-qm", "initial"], check=True)
+    return subprocess.check_output([*git, "rev-parse", "HEAD"], text=True).strip()
+
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="No GCC")
+async def test_build_pgo(tmp_path, base_config):
+    repo = tmp_path / "repo"
+    ref = _git_repo(repo, {"main.c": "int main(int c, char **v) { return c > 2; }\n"})
+
+    base_config["destination"] = str(tmp_path)
+    base_config["main-package"] = "app"
+    base_config["packages"] = [
+        {"name": "dep", "version": "1.0.0", "build": "true"},
+        {
+            "name": "app",
+            "version": "1.0.0",
+            "depends": ["dep"],
+            "src": {"type": "git", "url": str(repo), "ref": ref},
+            "build": "mkdir -p $out/bin\n"
+            "gcc $CFLAGS -c main.c -o main.o\n"
+            "gcc $LDFLAGS -o $out/bin/app main.o\n",
+            "pgo": {"train": "$out/bin/app\n"},
+        },
+    ]
+    ctx = Context.from_config(
+        base_config, cwd=tmp_path, staging=tmp_path, engine="native"
+    )
+    await build_all(ctx)
+
+    app = ctx["app"]
+    profile = tmp_path / "cache" / "pgo" / f"{app.profile_hash}-{app.fullname}"
+    assert (profile / ".complete").read_text() == f"{app.buildhash}\n"
+    assert list(profile.glob("*.gcda"))
+    assert b"__gcov" not in (ctx.out(app) / "bin" / "app").read_bytes()
+    log = (ctx.out(app) / "build.log").read_text()
+    assert "INSTRUMENTED BUILD LOG" in log
+    assert "-fprofile-use" in log.split("OPTIMISED BUILD LOG")[1]
+
+    # Changing a dependency reuses the profile
+    base_config["packages"][0]["build"] = "echo changed"
+    ctx = Context.from_config(
+        base_config, cwd=tmp_path, staging=tmp_path, engine="native"
+    )
+    assert ctx["app"].buildhash != app.buildhash
+    assert ctx["app"].profile_hash == app.profile_hash
+
+    # So does adding a post-build step, which runs after the optimised build
+    base_config["packages"][1]["post-build"] = ["split-debug"]
+    ctx = Context.from_config(
+        base_config, cwd=tmp_path, staging=tmp_path, engine="native"
+    )
+    assert ctx["app"].profile_hash == app.profile_hash
+    base_config["packages"][1]["post-build"] = []
+    ctx = Context.from_config(
+        base_config, cwd=tmp_path, staging=tmp_path, engine="native"
+    )
+    await build_all(ctx)
+
+    log = (ctx.out("app") / "build.log").read_text()
+    assert "Reusing PGO profile" in log
+    assert "INSTRUMENTED BUILD LOG" not in log
@@ -1,3 +1,4 @@
+import json
 from pathlib import Path
 from unittest.mock import AsyncMock, patch
 
@@ -7,6 +8,8 @@ from click import BadParameter
 from click.testing import CliRunner
 
 from karsk.cli import cli
+from karsk.commands.test import partition
+from karsk.context import Context
 from karsk.commands.enter import VolumeBindType
 
 
@@ -44,6 +47,11 @@ def test_cli_help(runner):
     assert result.exit_code == 0
 
 
+def test_bench_help(runner):
+    result = runner.invoke(cli, ["bench", "--help"])
+    assert result.exit_code == 0
+
+
 def test_build_help(runner):
     result = runner.invoke(cli, ["build", "--help"])
     assert result.exit_code == 0
@@ -59,6 +67,21 @@ def test_sync_help(runner):
     assert result.exit_code == 0
 
 
+def test_stage_local_help(runner):
+    result = runner.invoke(cli, ["stage-local", "--help"])
+    assert result.exit_code == 0
+
+
+def test_status_help(runner):
+    result = runner.invoke(cli, ["status", "--help"])
+    assert result.exit_code == 0
+
+
+def test_verify_help(runner):
+    result = runner.invoke(cli, ["verify", "--help"])
+    assert result.exit_code == 0
+
+
 def test_test_help(runner):
     result = runner.invoke(cli, ["test", "--help"])
     assert result.exit_code == 0
@@ -152,6 +175,130 @@ def test_init_fails_if_directory_exists(runner, tmp_path, monkeypatch):
     assert "Project directory isn't empty" in result.output
 
 
+def test_partition_balances_durations():
+    durations = {"a": 5.0, "b": 4.0, "c": 3.0, "d": 3.0, "e": 1.0}
+    shares = partition(list(durations), durations, 2)
+    assert sorted(sum(durations[x] for x in share) for share in shares) == [8.0, 8.0]
+    assert partition(["a", "b"], {}, 4) == [["a"], ["b"]]
+
+
+# Tests are collected in this process, where modules of the same name would
+# otherwise clash
+PYTEST_ARGS = ["--import-mode=importlib"]
+
+
+@pytest.fixture
+def tests_config(tmp_path):
+    (tmp_path / "karsk_tests").mkdir()
+    for i in range(3):
+        (tmp_path / f"karsk_tests/test_{i}.py").write_text(
+            "def test_context(karsk):\n"
+            "    assert karsk.config.tests is not None\n"
+            "def test_outcome():\n"
+            f"    assert {i} != 1\n"
+        )
+    config = {
+        "destination": str(tmp_path / "dest"),
+        "main-package": "",
+        "entrypoints": [],
+        "build-image": str(tmp_path / "Containerfile"),
+        "tests": "./karsk_tests",
+        "packages": [],
+    }
+    (tmp_path / "Containerfile").write_text("FROM scratch\n")
+    (tmp_path / "config.yaml").write_text(yaml.dump(config))
+    return [
+        str(tmp_path / "config.yaml"),
+        "--staging",
+        str(tmp_path / "staging"),
+        "--engine",
+        "native",
+    ]
+
+
+def test_test_parallel(runner, tmp_path, tests_config):
+    result = runner.invoke(
+        cli, ["test", *tests_config, "-j", "2", "--no-cache", "--", *PYTEST_ARGS]
+    )
+    assert result.exit_code == 1, result.output
+    assert "FAILED" in result.output and "test_1.py::test_outcome" in result.output
+
+    durations = json.loads((tmp_path / "staging/cache/test-durations.json").read_text())
+    assert len(durations) == 6
+
+
+def test_test_cache(runner, tmp_path, tests_config):
+    result = runner.invoke(cli, ["test", *tests_config, "--", "-rs", *PYTEST_ARGS])
+    assert result.exit_code == 1, result.output
+    assert "5 passed" in result.output
+
+    result = runner.invoke(cli, ["test", *tests_config, "--", "-rs", *PYTEST_ARGS])
+    assert result.exit_code == 1, result.output
+    assert "1 failed, 5 skipped" in result.output
+    assert "karsk: 5 tests skipped" in result.output
+
+    # Other files next to the tests, such as data files, are inputs too
+    (tmp_path / "karsk_tests/data.txt").write_text("data\n")
+    result = runner.invoke(cli, ["test", *tests_config, "--", *PYTEST_ARGS])
+    assert "1 failed, 5 passed" in result.output
+
+    (tmp_path / "karsk_tests/conftest.py").write_text("# Invalidates every test\n")
+    result = runner.invoke(cli, ["test", *tests_config, "-j", "2", "--", *PYTEST_ARGS])
+    assert result.exit_code == 1, result.output
+    assert "Running 6 tests on 2 workers" in result.output
+
+    result = runner.invoke(
+        cli, ["test", *tests_config, "--no-cache", "--", *PYTEST_ARGS]
+    )
+    assert "1 failed, 5 passed" in result.output
+
+
+def test_test_changed_since(runner, tmp_path, tests_config):
+    config = yaml.safe_load((tmp_path / "config.yaml").read_text())
+    config["packages"] = [
+        {"name": "A", "version": "1.0", "build": ""},
+        {"name": "B", "version": "1.0", "depends": ["A"], "build": ""},
+        {"name": "C", "version": "1.0", "build": ""},
+    ]
+    (tmp_path / "config.yaml").write_text(yaml.dump(config))
+    ctx = Context.from_config(
+        config, cwd=tmp_path, staging=tmp_path / "staging", engine="native"
+    )
+    for pkg in ctx.packages.values():
+        ctx.staging_paths.out(pkg).mkdir(parents=True)
+
+    (tmp_path / "karsk_tests/test_packages.py").write_text(
+        "import pytest\n"
+        "@pytest.mark.packages('B')\n"
+        "def test_b():\n"
+        "    pass\n"
+        "@pytest.mark.packages('C')\n"
+        "def test_c():\n"
+        "    pass\n"
+    )
+    # Only C is the same as in the old environment
+    (tmp_path / "manifest").write_text(
+        f"0000-A-1.0\n0000-B-1.0\n{ctx.packages['C'].out_relpath}\n"
+    )
+
+    result = runner.invoke(
+        cli,
+        [
+            "test",
+            *tests_config,
+            "--no-cache",
+            "--changed-since",
+            str(tmp_path / "manifest"),
+            "--",
+            "-v",
+            *PYTEST_ARGS,
+        ],
+    )
+    assert "test_packages.py::test_b PASSED" in result.output
+    assert "test_packages.py::test_c" not in result.output
+    assert "1 failed, 6 passed, 1 deselected" in result.output
+
+
 @pytest.fixture
 def volume_type():
     return VolumeBindType()
@@ -1,6 +1,8 @@
+import asyncio
 import os
 from karsk.context import Context
 import pytest
+from unittest.mock import AsyncMock
 
 
 @pytest.fixture
@@ -60,3 +62,47 @@ def test_single_package(tmp_path, base_config, config_update, script_content, sn
     assert len(ctx.packages) == 1
     assert "A" in ctx.packages
     snapshot.assert_match(ctx.packages["A"].buildhash, "expected_hash")
+
+
+@pytest.mark.parametrize("whole_store", [False, True])
+def test_run_volumes(tmp_path, base_config, whole_store):
+    base_config["packages"] = [
+        {"name": "A", "version": "0.0", "depends": [], "build": ""},
+        {"name": "B", "version": "0.0", "depends": ["A"], "build": ""},
+        {"name": "C", "version": "0.0", "depends": ["B"], "build": ""},
+    ]
+    ctx = Context.from_config(
+        base_config, cwd=tmp_path, staging=tmp_path, engine="native"
+    )
+    for pkg in ctx.packages.values():
+        ctx.staging_paths.out(pkg).mkdir(parents=True)
+    ctx.engine = AsyncMock()
+
+    asyncio.run(ctx.run("C", "true", whole_store=whole_store))
+
+    volumes = ctx.engine.call_args.kwargs["volumes"]
+    if whole_store:
+        assert volumes == [(ctx.staging_paths.store, ctx.target_paths.store, "ro")]
+    else:
+        assert sorted(dst for _, dst, _ in volumes) == sorted(
+            ctx.target_paths.out(pkg) for pkg in ctx.packages.values()
+        )
+
+
+async def test_session(tmp_path, base_config):
+    base_config["destination"] = str(tmp_path)
+    ctx = Context.from_config(
+        base_config, cwd=tmp_path, staging=tmp_path, engine="native"
+    )
+
+    async with await ctx.start_session(env={"GREETING": "hello"}) as session:
+        results = await session.run_many(
+            [["sh", "-c", f'echo "$GREETING {i}"'] for i in range(10)], jobs=4
+        )
+        assert [x.stdout for x in results] == [
+            f"hello {i}\n".encode() for i in range(10)
+        ]
+
+        result = await session.run("cat", input="input")
+        assert result.returncode == 0
+        assert result.stdout == b"input"
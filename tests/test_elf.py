@@ -0,0 +1,244 @@
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from karsk.elf import DynamicSection, LibrarySearch, PinPlan, read_build_id
+
+pytestmark = pytest.mark.skipif(shutil.which("cc") is None, reason="No C compiler")
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Store with an application that finds its library through a RUNPATH with
+    several unrelated directories"""
+    lib = tmp_path / "store" / "aaa-foo-1" / "lib"
+    app = tmp_path / "store" / "bbb-app-1" / "bin"
+    lib.mkdir(parents=True)
+    app.mkdir(parents=True)
+    noise = [tmp_path / f"noise{i}" for i in range(5)]
+    for path in noise:
+        path.mkdir()
+
+    (tmp_path / "foo.c").write_text("int foo(void) { return 42; }\n")
+    (tmp_path / "main.c").write_text(
+        "int foo(void);\nint main(void) { return foo() == 42 ? 0 : 1; }\n"
+    )
+    runpath = ":".join(str(x) for x in [*noise, lib])
+    subprocess.run(
+        ["cc", "-shared", "-fPIC", "-o", lib / "libfoo.so", tmp_path / "foo.c"],
+        check=True,
+    )
+    subprocess.run(
+        ["cc", "-o", app / "app", tmp_path / "main.c", f"-L{lib}", "-lfoo"]
+        + [f"-Wl,--enable-new-dtags,-rpath,{runpath}"],
+        check=True,
+    )
+    return tmp_path / "store"
+
+
+def plan_rpaths(out: Path) -> PinPlan:
+    """Plan the search paths of 'out', looking up its libraries on this host"""
+    search = LibrarySearch(out, out, [])
+    proc = subprocess.run(
+        ["bash", "-s"],
+        input=search.probe_script(),
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return search.plan(set(proc.stdout.splitlines()))
+
+
+def test_read_dynamic_section(store):
+    dynamic = DynamicSection.read(store / "bbb-app-1" / "bin" / "app")
+    assert dynamic is not None
+    assert dynamic.needed[0] == "libfoo.so"
+    assert dynamic.rpath == []
+    assert dynamic.runpath[-1] == str(store / "aaa-foo-1" / "lib")
+
+    assert DynamicSection.read(store.parent / "main.c") is None
+
+
+def test_plan_rpaths(store):
+    app = store / "bbb-app-1"
+    noise = [str(store.parent / f"noise{i}") for i in range(5)]
+    plan = plan_rpaths(app)
+    assert plan.rpaths == {
+        app / "bin" / "app": ":".join([str(store / "aaa-foo-1" / "lib"), *noise])
+    }
+    assert plan.force_rpath == set()
+    assert plan.unresolved == {}
+
+    (store / "aaa-foo-1" / "lib" / "libfoo.so").unlink()
+    plan = plan_rpaths(app)
+    assert plan.unresolved == {app / "bin" / "app": ["libfoo.so"]}
+
+
+def test_plan_keeps_unchecked_search_paths(store):
+    """Directories with tokens that only the loader can expand are kept"""
+    app = store / "bbb-app-1"
+    search = LibrarySearch(app, app, [])
+    dynamic, candidates = search.files[app / "bin" / "app"]
+    dynamic.runpath.insert(0, "/opt/$LIB")
+    candidates.insert(0, ("/opt/$LIB", "/opt/$LIB"))
+
+    assert "$LIB" not in search.probe_script()
+    lib = str(store / "aaa-foo-1" / "lib")
+    plan = search.plan({f"{lib}/libfoo.so"})
+    assert plan.rpaths[app / "bin" / "app"].startswith(f"{lib}:/opt/$LIB:")
+
+
+@pytest.mark.skipif(shutil.which("patchelf") is None, reason="No patchelf")
+def test_pinned_rpath_reduces_loader_probes(store):
+    """Counts the files the loader tries before and after pinning"""
+    app = store / "bbb-app-1"
+    program = app / "bin" / "app"
+
+    def probes() -> int:
+        env = {**os.environ, "LD_DEBUG": "libs"}
+        proc = subprocess.run(
+            [program], env=env, check=True, capture_output=True, text=True
+        )
+        return proc.stderr.count("trying file=")
+
+    before = probes()
+    subprocess.run(["bash", "-c", plan_rpaths(app).script()], check=True)
+    after = probes()
+
+    assert after < before
+    dynamic = DynamicSection.read(program)
+    assert dynamic.runpath[0] == str(store / "aaa-foo-1" / "lib")
+    assert len(dynamic.runpath) == 6
+    assert dynamic.rpath == []
+
+
+@pytest.mark.skipif(shutil.which("patchelf") is None, reason="No patchelf")
+def test_pinning_keeps_rpath_for_indirect_libraries(tmp_path):
+    """An application whose library finds its own library only through the
+    application's RPATH keeps working after pinning"""
+    outer = tmp_path / "store" / "aaa-outer-1" / "lib"
+    inner = tmp_path / "store" / "bbb-inner-1" / "lib"
+    app = tmp_path / "store" / "ccc-app-1"
+    for path in (outer, inner, app / "bin"):
+        path.mkdir(parents=True)
+
+    (tmp_path / "inner.c").write_text("int inner(void) { return 42; }\n")
+    (tmp_path / "outer.c").write_text(
+        "int inner(void);\nint outer(void) { return inner(); }\n"
+    )
+    (tmp_path / "main.c").write_text(
+        "int outer(void);\nint main(void) { return outer() == 42 ? 0 : 1; }\n"
+    )
+    subprocess.run(
+        ["cc", "-shared", "-fPIC", "-o", inner / "libinner.so", tmp_path / "inner.c"],
+        check=True,
+    )
+    subprocess.run(
+        ["cc", "-shared", "-fPIC", "-o", outer / "libouter.so", tmp_path / "outer.c"]
+        + [f"-L{inner}", "-linner"],
+        check=True,
+    )
+    program = app / "bin" / "app"
+    subprocess.run(
+        ["cc", "-o", program, tmp_path / "main.c", f"-L{outer}", "-louter"]
+        + [f"-Wl,--disable-new-dtags,-rpath,{inner}:{outer}"],
+        check=True,
+    )
+    subprocess.run([program], check=True)
+
+    plan = plan_rpaths(app)
+    assert plan.rpaths == {program: f"{outer}:{inner}"}
+    subprocess.run(["bash", "-c", plan.script()], check=True)
+
+    dynamic = DynamicSection.read(program)
+    assert dynamic.rpath == [str(outer), str(inner)]
+    assert dynamic.runpath == []
+    subprocess.run([program], check=True)
+
+
+@pytest.mark.skipif(shutil.which("patchelf") is None, reason="No patchelf")
+async def test_build_pins_libraries(tmp_path, mocker):
+    from karsk.builder import build_all
+    from karsk.config import Config
+    from karsk.context import Context
+
+    mocker.patch("karsk.wrapper.build_wrapper", return_value=Path("/usr/bin/true"))
+    config = Config.model_validate(
+        {
+            "destination": str(tmp_path),
+            "main-package": "app",
+            "build-image": "test_build_image",
+            "entrypoints": [],
+            "packages": [
+                {
+                    "name": "foo",
+                    "version": "1.0.0",
+                    "build": "mkdir $out/lib\n"
+                    "echo 'int foo(void) { return 42; }' > foo.c\n"
+                    "cc -shared -fPIC -o $out/lib/libfoo.so foo.c\n",
+                },
+                {
+                    "name": "app",
+                    "version": "1.0.0",
+                    "depends": ["foo"],
+                    "post-build": ["pin-libraries"],
+                    "build": "mkdir $out/bin\n"
+                    "echo 'int foo(void); int main(void) { return foo() != 42; }' > main.c\n"
+                    "cc -o $out/bin/app main.c -L$foo/lib -lfoo\n",
+                },
+            ],
+        },
+        context={"cwd": os.path.dirname(__file__)},
+    )
+    ctx = Context(config, staging=tmp_path, engine="native")
+    await build_all(ctx)
+
+    program = ctx.out("app") / "bin" / "app"
+    dynamic = DynamicSection.read(program)
+    assert dynamic.runpath == [str(ctx.out("foo") / "lib")]
+    assert dynamic.rpath == []
+    subprocess.run([program], check=True)
+
+
+@pytest.mark.skipif(shutil.which("objcopy") is None, reason="No objcopy")
+async def test_build_splits_debug_info(tmp_path, mocker):
+    from karsk.builder import build_all
+    from karsk.config import Config
+    from karsk.context import Context
+
+    mocker.patch("karsk.wrapper.build_wrapper", return_value=Path("/usr/bin/true"))
+    config = Config.model_validate(
+        {
+            "destination": str(tmp_path),
+            "main-package": "app",
+            "build-image": "test_build_image",
+            "entrypoints": [],
+            "packages": [
+                {
+                    "name": "app",
+                    "version": "1.0.0",
+                    "post-build": ["split-debug"],
+                    "build": "mkdir $out/bin\n"
+                    "echo 'int main(void) { return 0; }' > main.c\n"
+                    "cc -g -Wl,--build-id -o $out/bin/app main.c\n",
+                },
+            ],
+        },
+        context={"cwd": os.path.dirname(__file__)},
+    )
+    ctx = Context(config, staging=tmp_path, engine="native")
+    await build_all(ctx)
+
+    program = ctx.out("app") / "bin" / "app"
+    build_id = read_build_id(program)
+    assert build_id is not None
+    debug = ctx.staging_paths.debug(ctx["app"])
+    assert (debug / ".build-id" / build_id[:2] / f"{build_id[2:]}.debug").is_file()
+    assert (debug / ".karsk-checksums").is_file()
+    assert b".debug_info" not in program.read_bytes()
+    assert b".gnu_debuglink" in program.read_bytes()
+    assert "Stripped 1 binaries" in (ctx.out("app") / "build.log").read_text()
+    subprocess.run([program], check=True)
@@ -2,7 +2,7 @@ import os
 import pytest
 from pathlib import Path
 
-from karsk.links import make_links
+from karsk.links import INDEX_NAME, VersionIndex, make_links
 
 
 @pytest.fixture
@@ -107,3 +107,58 @@ def test_auto_version_aliases_multiple_majors(tmp_path):
     assert os.readlink(destination / "2.0") == "2.0.0"
     assert os.readlink(destination / "2.1") == "2.1.0"
     assert os.readlink(destination / "2") == "2.1"
+
+
+def test_make_links_replaces_existing_links_atomically(tmp_path, mocker):
+    destination = tmp_path / "location"
+    (destination / "1.0.0+1").mkdir(parents=True)
+    (destination / "1.0.1+1").mkdir(parents=True)
+    (destination / "latest").symlink_to("1.0.0+1")
+
+    unlink = mocker.spy(Path, "unlink")
+    scandir = mocker.spy(os, "scandir")
+    make_links({"latest": "^", "stable": "latest"}, destination=destination)
+
+    assert os.readlink(destination / "latest") == "1.0.1+1"
+    assert os.readlink(destination / "stable") == "latest"
+    assert not [p for p in destination.iterdir() if p.name.startswith(".")]
+    assert all(call.args[0].name.startswith(".") for call in unlink.call_args_list)
+    assert scandir.call_count == 1
+
+
+def test_version_index_write(tmp_path):
+    destination = tmp_path / "versions"
+    (destination / "1.0.0+1").mkdir(parents=True)
+    (destination / "1.0.0+2").mkdir(parents=True)
+    (destination / "broken").symlink_to("2.0.0+1")
+    make_links({"stable": "1.0.0+1"}, destination=destination)
+
+    VersionIndex(destination).write(tmp_path / INDEX_NAME)
+
+    assert (tmp_path / INDEX_NAME).read_text().splitlines() == [
+        "karsk-versions\t2",
+        f"mtime\t{destination.stat().st_mtime_ns}",
+        "version\t1.0.0+2",
+        "version\t1.0.0+1",
+        "alias\t1\t1.0.0+2",
+        "alias\t1.0\t1.0.0+2",
+        "alias\t1.0.0\t1.0.0+2",
+        "alias\tstable\t1.0.0+1",
+    ]
+
+
+def test_version_index_write_variants(tmp_path):
+    destination = tmp_path / "versions"
+    (destination / "1.0.0+1").mkdir(parents=True)
+    (destination / "x86-64-v3" / "1.0.0+1").mkdir(parents=True)
+    variant = destination / "x86-64-v3"
+
+    VersionIndex(destination).write(tmp_path / INDEX_NAME)
+
+    assert (tmp_path / INDEX_NAME).read_text().splitlines() == [
+        "karsk-versions\t2",
+        f"mtime\t{destination.stat().st_mtime_ns}",
+        f"variant-mtime\tx86-64-v3\t{variant.stat().st_mtime_ns}",
+        "version\t1.0.0+1",
+        "variant\tx86-64-v3\t1.0.0+1",
+    ]
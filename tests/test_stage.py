@@ -0,0 +1,214 @@
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from karsk.builder import build_all
+from karsk.config import Config
+from karsk.context import Context
+from karsk.elf import DynamicSection
+from karsk.stage import stage_local
+
+
+@pytest.fixture(autouse=True)
+def stub_build_wrapper(mocker):
+    mocker.patch("karsk.wrapper.build_wrapper", return_value=Path("/usr/bin/true"))
+
+
+@pytest.fixture
+async def ctx(tmp_path):
+    config = Config.model_validate(
+        {
+            "destination": str(tmp_path),
+            "main-package": "A",
+            "build-image": "test_build_image",
+            "entrypoints": [],
+            "packages": [
+                {
+                    "name": "A",
+                    "version": "1.0.0",
+                    "build": "mkdir $out/bin && echo hello > $out/bin/a && ln $out/bin/a $out/bin/b",
+                },
+            ],
+        },
+        context={"cwd": os.path.dirname(__file__)},
+    )
+    context = Context(config, staging=tmp_path, engine="native")
+    await build_all(context)
+    return context
+
+
+def test_stage_local_flattens_symlinks(ctx, tmp_path):
+    path = stage_local(ctx.staging_paths, "latest", tmp_path / "local")
+
+    assert path == tmp_path / "local" / "1.0.0+1"
+    assert not (path / "bin").is_symlink()
+    assert not (path / "bin" / "a").is_symlink()
+    assert (path / "bin" / "a").read_text() == "hello\n"
+    assert (path / "manifest").is_file()
+
+
+def test_stage_local_detects_corruption(ctx, tmp_path):
+    (ctx.out("A") / "bin" / "a").write_text("corrupt\n")
+
+    with pytest.raises(SystemExit, match="Checksum mismatch"):
+        _ = stage_local(ctx.staging_paths, "latest", tmp_path / "local")
+    assert not (tmp_path / "local" / "1.0.0+1").exists()
+
+
+def test_stage_local_reports_unverified_files(ctx, tmp_path, capsys):
+    _ = stage_local(ctx.staging_paths, "latest", tmp_path / "verified")
+    assert "unverified" not in capsys.readouterr().out
+
+    (ctx.out("A") / ".karsk-checksums").write_text("")
+
+    path = stage_local(ctx.staging_paths, "latest", tmp_path / "local")
+    assert (path / "bin" / "a").read_text() == "hello\n"
+    out = capsys.readouterr().out
+    assert "unverified" in out
+    assert ctx.out("A").name in out
+
+
+def test_stage_local_unknown_version(ctx, tmp_path):
+    with pytest.raises(SystemExit, match="No such version"):
+        _ = stage_local(ctx.staging_paths, "2.0.0", tmp_path / "local")
+
+
+@pytest.fixture
+def fake_mksquashfs(mocker):
+    def run(args, **kwargs):
+        _, src, image, *_ = args
+        assert (src / "bin" / "a").read_text() == "hello\n"
+        image.write_text("image")
+
+    mocker.patch("karsk.stage.shutil.which", return_value="/usr/bin/mksquashfs")
+    return mocker.patch("karsk.stage.subprocess.run", side_effect=run)
+
+
+async def test_build_env_image(ctx, fake_mksquashfs):
+    await build_all(ctx, image="squashfs")
+
+    image = ctx.staging_paths.images / "1.0.0+1.squashfs"
+    assert image.read_text() == "image"
+    assert list(ctx.staging_paths.images.iterdir()) == [image]
+
+    # Existing images are kept
+    await build_all(ctx, image="squashfs")
+    fake_mksquashfs.assert_called_once()
+
+
+async def test_build_variant_images(tmp_path, fake_mksquashfs):
+    config = Config.model_validate(
+        {
+            "destination": str(tmp_path),
+            "main-package": "A",
+            "build-image": "test_build_image",
+            "entrypoints": [],
+            "variants": ["x86-64-v3"],
+            "packages": [
+                {
+                    "name": "A",
+                    "version": "1.0.0",
+                    "build": "mkdir $out/bin && echo hello > $out/bin/a",
+                },
+            ],
+        },
+        context={"cwd": os.path.dirname(__file__)},
+    )
+    ctx = Context(config, staging=tmp_path, engine="native")
+    if ctx.engine.arch != "amd64":
+        pytest.skip("Variants are only built for amd64")
+
+    await build_all(ctx, image="squashfs")
+
+    images = ctx.staging_paths.images
+    assert (images / "1.0.0+1.squashfs").read_text() == "image"
+    assert (images / "x86-64-v3" / "1.0.0+1.squashfs").read_text() == "image"
+
+
+async def test_stage_local_variant(tmp_path):
+    config = Config.model_validate(
+        {
+            "destination": str(tmp_path),
+            "main-package": "A",
+            "build-image": "test_build_image",
+            "entrypoints": [],
+            "variants": ["x86-64-v3"],
+            "packages": [
+                {
+                    "name": "A",
+                    "version": "1.0.0",
+                    "build": "echo $CFLAGS > $out/cflags",
+                },
+            ],
+        },
+        context={"cwd": os.path.dirname(__file__)},
+    )
+    ctx = Context(config, staging=tmp_path, engine="native")
+    if ctx.engine.arch != "amd64":
+        pytest.skip("Variants are only built for amd64")
+    await build_all(ctx)
+
+    path = stage_local(
+        ctx.staging_paths, "latest", tmp_path / "local", variant="x86-64-v3"
+    )
+    assert path == tmp_path / "local" / "x86-64-v3" / "1.0.0+1"
+    assert (path / "cflags").read_text() == "-O3 -march=x86-64-v3\n"
+
+    with pytest.raises(SystemExit, match="No build of 1.0.0\\+1 for variant"):
+        _ = stage_local(
+            ctx.staging_paths, "latest", tmp_path / "local", variant="x86-64-v4"
+        )
+
+
+@pytest.mark.skipif(
+    shutil.which("cc") is None or shutil.which("patchelf") is None,
+    reason="No C compiler or patchelf",
+)
+async def test_stage_local_resolves_libraries_locally(tmp_path):
+    config = Config.model_validate(
+        {
+            "destination": str(tmp_path),
+            "main-package": "app",
+            "build-image": "test_build_image",
+            "entrypoints": [],
+            "packages": [
+                {
+                    "name": "foo",
+                    "version": "1.0.0",
+                    "build": "mkdir $out/lib\n"
+                    "echo 'int foo(void) { return 42; }' > foo.c\n"
+                    "cc -shared -fPIC -o $out/lib/libfoo.so foo.c\n",
+                },
+                {
+                    "name": "app",
+                    "version": "1.0.0",
+                    "depends": ["foo"],
+                    "build": "mkdir $out/bin\n"
+                    "echo 'int foo(void); int main(void) { return foo() != 42; }' > main.c\n"
+                    "cc -o $out/bin/app main.c -L$foo/lib -lfoo -Wl,-rpath,$foo/lib\n",
+                },
+            ],
+        },
+        context={"cwd": os.path.dirname(__file__)},
+    )
+    ctx = Context(config, staging=tmp_path, engine="native")
+    await build_all(ctx)
+
+    path = stage_local(ctx.staging_paths, "latest", tmp_path / "local")
+    dynamic = DynamicSection.read(path / "bin" / "app")
+    assert dynamic.runpath == ["$ORIGIN/../lib"]
+
+    # The staged copy doesn't need the store
+    ctx.staging_paths.store.rename(tmp_path / "moved")
+    proc = subprocess.run(
+        [path / "bin" / "app"],
+        env={**os.environ, "LD_DEBUG": "libs"},
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert f"{path}/bin/../lib/libfoo.so" in proc.stderr
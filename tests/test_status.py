@@ -0,0 +1,74 @@
+import io
+import os
+from pathlib import Path
+
+import pytest
+from rich.console import Console
+
+from karsk.builder import build_all
+from karsk.commands.status import Inventory, gather_status, status_table
+from karsk.commands.sync import Sync
+from karsk.config import AreaConfig, Config
+from karsk.context import Context
+
+
+@pytest.fixture(autouse=True)
+def stub_build_wrapper(mocker):
+    mocker.patch("karsk.wrapper.build_wrapper", return_value=Path("/usr/bin/true"))
+
+
+@pytest.fixture(autouse=True)
+def fake_ssh(monkeypatch):
+    monkeypatch.setattr(
+        Sync, "RSH", ["/bin/sh", "-c", 'shift; exec /bin/sh -c "$*"', "fake_ssh"]
+    )
+    monkeypatch.setattr(Sync, "MULTIPLEX", False)
+
+
+@pytest.fixture
+async def ctx(tmp_path):
+    config = Config.model_validate(
+        {
+            "destination": str(tmp_path),
+            "main-package": "A",
+            "build-image": "test_build_image",
+            "entrypoints": [],
+            "packages": [
+                {"name": "A", "version": "1.0.0", "build": "mkdir $out/bin"},
+            ],
+        },
+        context={"cwd": os.path.dirname(__file__)},
+    )
+    context = Context(config, staging=tmp_path, engine="native")
+    await build_all(context)
+    return context
+
+
+async def test_gather_status(ctx):
+    inventories = await gather_status(ctx, [AreaConfig(name="remote", host="remote")])
+
+    assert list(inventories) == ["staging", "destination", "remote"]
+    remote = inventories["remote"]
+    assert isinstance(remote, Inventory)
+    assert remote.store == {ctx.out("A").name}
+    assert list(remote.versions) == ["1.0.0+1"]
+    assert remote.links["latest"] == "1.0.0+1"
+
+
+async def test_status_table(ctx):
+    inventories = await gather_status(ctx, [])
+    inventories["outdated"] = Inventory("store other\nlink stable 0.9.0+1\n")
+    inventories["broken"] = RuntimeError("unreachable")
+
+    output = io.StringIO()
+    Console(file=output, width=200).print(status_table(ctx, inventories))
+    lines = output.getvalue().splitlines()
+
+    def cells(item: str) -> list[str]:
+        line = next(line for line in lines if f" {item} " in line)
+        return [x.strip() for x in line.split("│")[2:-1]]
+
+    assert cells("store A-1.0.0") == ["✓", "✓", "✗", "error"]
+    assert cells("environment") == ["1.0.0+1", "1.0.0+1", "✗", "error"]
+    assert cells("link stable") == ["✓", "✓", "~ 0.9.0+1", "error"]
+    assert cells("extra") == ["0", "0", "1", "error"]
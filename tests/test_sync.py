@@ -1,13 +1,20 @@
+import asyncio
+import json
 import os
+import platform
+import shutil
 from subprocess import CalledProcessError
 
 from pathlib import Path
 from karsk.builder import build_all
 import pytest
+import yaml
 
-from karsk.config import AreaConfig, Config
-from karsk.commands.sync import Sync, sync_all
+from karsk.checksums import CHECKSUMS
+from karsk.config import AreaConfig, Config, load_areas
+from karsk.commands.sync import Sync, SyncJournal, assign_relays, sync_all
 from karsk.context import Context
+from karsk.paths import Paths
 
 BUILD_SCRIPT = """\
 mkdir $out/bin
@@ -29,10 +36,16 @@ def fake_ssh(monkeypatch: pytest.MonkeyPatch) -> None:
 
     # We replace RSH with an inline sh script. Both rsync and our `Sync._bash`
     # set the first argument to be the destination hostname. The remainder is
-    # the command to execute on the "remote server". We simply execute it
-    # locally. Then, sh sets the next argument ("fake_ssh") to be the program
-    # name ($0), which is why we specify it.
-    monkeypatch.setattr(Sync, "RSH", ["/bin/sh", "-c", 'shift; exec "$@"', "fake_ssh"])
+    # the command to execute on the "remote server". Like SSH, we join it with
+    # spaces and let a shell execute it locally. Then, sh sets the next
+    # argument ("fake_ssh") to be the program name ($0), which is why we
+    # specify it.
+    monkeypatch.setattr(
+        Sync, "RSH", ["/bin/sh", "-c", 'shift; exec /bin/sh -c "$*"', "fake_ssh"]
+    )
+
+    # SSH options for connection sharing can't be passed to our fake SSH
+    monkeypatch.setattr(Sync, "MULTIPLEX", False)
 
 
 @pytest.fixture
@@ -120,3 +133,424 @@ async def test_sync_with_non_local_prefix(tmp_path, base_config, areas):
 
     assert installed_file_path.exists()
     assert (tmp_path / "versions/latest").is_symlink()
+
+
+async def test_sync_skips_present_store_entries(tmp_path, base_config, areas, mocker):
+    ctx = await _deploy_config(base_config, tmp_path)
+
+    async def fake_rsync(self, area, paths, parent, *, dest=None, **kwargs):
+        for path in paths if dest is not None else []:
+            shutil.copytree(parent / path.name, dest / path.name)
+
+    rsync = mocker.patch.object(Sync, "_rsync", autospec=True, side_effect=fake_rsync)
+
+    await Sync(ctx).sync_to(areas[0])
+    assert [call.kwargs["context"] for call in rsync.call_args_list] == ["versions"]
+
+    rsync.reset_mock()
+    syncer = Sync(ctx)
+    syncer.from_paths = Paths(tmp_path / "source")
+    syncer.from_paths.store.mkdir(parents=True)
+    ctx.out("A").rename(syncer.from_paths.out(ctx["A"]))
+
+    await syncer.sync_to(areas[0])
+    assert [call.kwargs["context"] for call in rsync.call_args_list] == [
+        "store",
+        "versions",
+    ]
+    assert rsync.call_args_list[0].args[2] == [ctx.out("A")]
+
+
+def test_assign_relays():
+    areas = [AreaConfig(name=x, host=f"{x}.example.com") for x in "abcde"]
+
+    assert [area.relay for area in assign_relays(areas, 2)] == [
+        None,
+        None,
+        "a",
+        "b",
+        "a",
+    ]
+
+
+@pytest.mark.parametrize("no_async", [False, True])
+async def test_sync_relays_after_seed(tmp_path, base_config, no_async, mocker):
+    ctx = await _deploy_config(base_config, tmp_path)
+    synced: list[tuple[str, str | None]] = []
+
+    async def sync_to(self, area, relay=None, **kwargs):
+        synced.append((area.name, relay and relay.name))
+
+    mocker.patch.object(Sync, "sync_to", sync_to)
+    areas = [
+        AreaConfig(name="peer", host="peer.example.com", relay="seed"),
+        AreaConfig(name="seed", host="seed.example.com"),
+    ]
+
+    await sync_all(ctx, areas=areas, no_async=no_async, dry_run=False)
+
+    assert synced == [("seed", None), ("peer", "seed")]
+
+
+@pytest.mark.parametrize(
+    "relays,match",
+    [
+        ({"a": "c"}, "unknown area 'c'"),
+        ({"a": "b", "b": "a"}, "cyclic"),
+    ],
+)
+def test_load_areas_invalid_relay(tmp_path, relays, match):
+    path = tmp_path / "areas.yml"
+    path.write_text(
+        yaml.dump(
+            {
+                "areas": [
+                    {"name": name, "host": name, "relay": relays.get(name)}
+                    for name in "ab"
+                ]
+            }
+        )
+    )
+
+    with pytest.raises(ValueError, match=match):
+        load_areas(path)
+
+
+def test_load_areas_rejects_tar_bwlimit(tmp_path):
+    path = tmp_path / "areas.yml"
+    path.write_text(
+        yaml.dump(
+            {
+                "areas": [
+                    {"name": "a", "host": "a", "transport": "tar", "bwlimit": "20M"}
+                ]
+            }
+        )
+    )
+
+    with pytest.raises(ValueError, match="bwlimit"):
+        load_areas(path)
+
+
+async def test_sync_max_parallel_and_priority(tmp_path, base_config, mocker):
+    ctx = await _deploy_config(base_config, tmp_path)
+    started: list[str] = []
+    running = 0
+    max_running = 0
+
+    async def sync_to(self, area, relay=None, **kwargs):
+        nonlocal running, max_running
+        started.append(area.name)
+        running += 1
+        max_running = max(running, max_running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    mocker.patch.object(Sync, "sync_to", sync_to)
+    areas = [
+        AreaConfig(name=name, host=name, priority=priority)
+        for name, priority in [("a", 0), ("b", 2), ("c", 1), ("d", 0)]
+    ]
+
+    await sync_all(ctx, areas=areas, no_async=False, dry_run=False, max_parallel=2)
+
+    assert max_running == 2
+    assert started == ["b", "c", "a", "d"]
+
+
+async def test_sync_area_rsync_options(tmp_path, base_config, mocker):
+    ctx = await _deploy_config(base_config, tmp_path)
+    check_call = mocker.patch.object(Sync, "_check_call", return_value="")
+    area = AreaConfig(name="a", host="a", bwlimit="20M", compress="zstd")
+
+    await Sync(ctx)._rsync(area, [tmp_path], tmp_path)
+
+    args = check_call.call_args.args
+    assert args[args.index("--bwlimit") + 1] == "20M"
+    assert "--compress-choice=zstd" in args
+
+
+async def test_sync_multiplexes_ssh(tmp_path, base_config, monkeypatch):
+    ctx = await _deploy_config(base_config, tmp_path)
+    monkeypatch.setattr(Sync, "MULTIPLEX", True)
+
+    async with Sync(ctx) as syncer:
+        assert syncer.rsh[: len(Sync.RSH)] == Sync.RSH
+        assert "-oControlMaster=auto" in syncer.rsh
+
+    assert syncer.rsh == Sync.RSH
+
+
+@pytest.mark.parametrize("compress", [None, "zlib", "none"])
+async def test_sync_tar_transport(tmp_path, base_config, mocker, compress):
+    ctx = await _deploy_config(base_config, tmp_path)
+    mocker.patch.object(Sync, "_rsync")
+    area = AreaConfig(name="a", host="a", transport="tar", compress=compress)
+
+    # Move the built package out of the "remote" store and into our source
+    syncer = Sync(ctx)
+    syncer.from_paths = Paths(tmp_path / "source")
+    syncer.from_paths.store.mkdir(parents=True)
+    ctx.out("A").rename(syncer.from_paths.out(ctx["A"]))
+
+    await syncer.sync_to(area)
+
+    assert (ctx.out("A") / "bin/a_file").read_text() == "hello world\n"
+    assert not list(ctx.out("A").parent.glob(".incoming-*"))
+
+
+async def test_sync_tar_transport_retries_with_rsync(tmp_path, base_config, mocker):
+    ctx = await _deploy_config(base_config, tmp_path)
+    tar = mocker.patch.object(Sync, "_tar")
+    rsync = mocker.patch.object(Sync, "_rsync")
+    mocker.patch.object(Sync, "_bash", return_value="")
+    area = AreaConfig(name="a", host="a", transport="tar")
+
+    await Sync(ctx).sync_to(area, retry=True)
+
+    tar.assert_not_called()
+    assert rsync.call_args_list[0].kwargs["context"] == "store"
+
+
+async def test_sync_link_dest_streams(tmp_path, base_config, mocker):
+    ctx = await _deploy_config(base_config, tmp_path)
+    running = 0
+    max_running = 0
+
+    async def rsync_stream(self, area, paths, parent, **kwargs):
+        nonlocal running, max_running
+        assert kwargs["link_dest"] == self.to_paths.store / "basis"
+        running += 1
+        max_running = max(running, max_running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    mocker.patch.object(Sync, "_rsync_stream", rsync_stream)
+    area = AreaConfig(name="a", host="a", streams=2)
+    bases = {tmp_path / name: "basis" for name in "abcde"}
+
+    await Sync(ctx)._rsync_linked(area, bases)
+
+    assert max_running == 2
+
+
+def test_balance_store_entries():
+    from karsk.commands.sync import _balance
+
+    sizes = {Path(name): size for name, size in zip("abcde", [8, 5, 4, 3, 1])}
+
+    shards = _balance(sizes, 2)
+    assert sorted(sum(sizes[p] for p in shard) for shard in shards) == [10, 11]
+    assert _balance(sizes, 10) == [[Path(x)] for x in "abcde"]
+
+
+async def test_sync_retries_and_isolates_failures(
+    tmp_path, base_config, mocker, capsys
+):
+    ctx = await _deploy_config(base_config, tmp_path)
+    attempts: list[str] = []
+
+    async def sync_to(self, area, relay=None, **kwargs):
+        attempts.append(area.name)
+        if area.name == "broken" or attempts.count(area.name) == 1:
+            raise CalledProcessError(255, "ssh")
+
+    mocker.patch.object(Sync, "sync_to", sync_to)
+    areas = [
+        AreaConfig(name="broken", host="a"),
+        AreaConfig(name="flaky", host="b", retries=1, retry_delay=0),
+        AreaConfig(name="peer", host="c", relay="broken"),
+    ]
+
+    with pytest.raises(CalledProcessError):
+        await sync_all(ctx, areas=areas, no_async=False, dry_run=False)
+
+    assert attempts == ["broken", "flaky", "flaky"]
+    out = capsys.readouterr().out
+    assert "failed" in out
+    assert "ok" in out
+    assert "skipped: relay broken failed" in out
+
+
+def test_sync_journal_resume(tmp_path):
+    path = tmp_path / "journal.json"
+    area = AreaConfig(name="a", host="a")
+
+    journal = SyncJournal("manifest", path)
+    journal.mark_done(area, "store")
+
+    assert SyncJournal("manifest", path, resume=True).is_done(area, "store")
+    assert not SyncJournal("manifest", path).is_done(area, "store")
+    assert SyncJournal("manifest", path, resume=True).resumed
+    assert not SyncJournal("other", path, resume=True).is_done(area, "store")
+    assert not SyncJournal("other", path, resume=True).resumed
+
+
+async def test_sync_records_each_phase_once(tmp_path, base_config, areas, mocker):
+    ctx = await _deploy_config(base_config, tmp_path)
+    mocker.patch.object(Sync, "_rsync")
+    path = tmp_path / "journal.json"
+    journal = SyncJournal(ctx["A"].manifest, path)
+    journal.mark_done(areas[0], "store")
+
+    await Sync(ctx, journal=journal).sync_to(areas[0])
+
+    data = json.loads(path.read_text())
+    assert data["areas"][areas[0].name] == ["store", "versions", "symlinks"]
+
+
+async def test_verify(tmp_path, base_config, areas):
+    ctx = await _deploy_config(base_config, tmp_path)
+
+    assert await Sync(ctx).verify(areas[0]) == []
+
+    (ctx.out("A") / "bin/a_file").write_text("corrupted")
+
+    problems = await Sync(ctx).verify(areas[0])
+    name = ctx.out("A").name
+    assert problems[0] == f"{name}: corrupt"
+    assert f"{name}: ./bin/a_file: FAILED" in problems
+
+
+async def test_verify_without_checksums(tmp_path, base_config, areas, capsys):
+    ctx = await _deploy_config(base_config, tmp_path)
+    (ctx.out("A") / CHECKSUMS).unlink()
+
+    assert await Sync(ctx).verify(areas[0]) == []
+    assert "unverified" in capsys.readouterr().out
+
+
+async def test_sync_transfers_images(tmp_path, base_config, areas, mocker):
+    ctx = await _deploy_config(base_config, tmp_path)
+    image = ctx.staging_paths.images / "0.0.0+1.squashfs"
+    image.parent.mkdir()
+    image.write_text("image")
+
+    rsync = mocker.patch.object(Sync, "_rsync", autospec=True)
+
+    await Sync(ctx).sync_to(areas[0])
+    assert [call.kwargs["context"] for call in rsync.call_args_list] == [
+        "versions",
+        "images",
+    ]
+    assert rsync.call_args_list[1].args[2:4] == ([image], ctx.staging_paths.images)
+
+
+@pytest.mark.skipif(
+    platform.machine() != "x86_64", reason="Variants are only built for amd64"
+)
+async def test_sync_transfers_variant_images(tmp_path, base_config, areas, mocker):
+    base_config.variants = ["x86-64-v3"]
+    ctx = await _deploy_config(base_config, tmp_path)
+    images = ctx.staging_paths.images / "x86-64-v3"
+    images.mkdir(parents=True)
+    (images / "0.0.0+1.squashfs").write_text("image")
+
+    rsync = mocker.patch.object(Sync, "_rsync", autospec=True)
+
+    await Sync(ctx).sync_to(areas[0])
+    assert rsync.call_args_list[1].args[2:4] == ([images], ctx.staging_paths.images)
+
+
+async def test_sync_debug_entries_on_request(tmp_path, base_config):
+    ctx = await _deploy_config(base_config, tmp_path)
+    debug = ctx.staging_paths.debug(ctx["A"])
+    debug.mkdir()
+
+    assert debug not in Sync(ctx)._store_paths
+    assert debug in Sync(ctx, debug=True)._store_paths
+
+
+async def test_sync_plan(tmp_path, base_config, areas, monkeypatch):
+    ctx = await _deploy_config(base_config, tmp_path)
+    monkeypatch.setattr(Sync, "PROBE_BYTES", 1024)
+
+    plan = await Sync(ctx).plan(areas[0])
+    assert (plan.entries, plan.files, plan.nbytes, plan.eta) == (0, 0, 0, 0.0)
+
+    syncer = Sync(ctx)
+    syncer.from_paths = Paths(tmp_path / "source")
+    syncer.from_paths.store.mkdir(parents=True)
+    ctx.out("A").rename(syncer.from_paths.out(ctx["A"]))
+
+    plan = await syncer.plan(areas[0])
+    assert plan.entries == 1
+    assert plan.files == 3  # build.log, .karsk-checksums and bin/a_file
+    assert plan.nbytes > 0
+    assert plan.throughput > 0
+
+
+async def test_sync_plan_leaves_out_linked_files(tmp_path, base_config, areas):
+    ctx = await _deploy_config(base_config, tmp_path)
+    syncer = Sync(ctx)
+    syncer.from_paths = Paths(tmp_path / "source")
+    syncer.from_paths.store.mkdir(parents=True)
+    entry = syncer.from_paths.out(ctx["A"])
+    ctx.out("A").rename(entry)
+
+    # An older build on the area that only differs in its build log
+    basis = ctx.staging_paths.store / "0000-A-0.0.0"
+    _ = shutil.copytree(entry, basis)
+    (basis / "build.log").write_text("old\n")
+
+    plan = await syncer.plan(areas[0])
+    assert (plan.entries, plan.files) == (1, 1)
+    assert plan.nbytes == (entry / "build.log").stat().st_size
+
+    # Without rsync, tar transfers every file
+    tar = areas[0].model_copy(update={"transport": "tar"})
+    assert (await syncer.plan(tar)).files == 3
+
+
+async def test_sync_plan_counts_missing_variant_environments(
+    tmp_path, base_config, areas
+):
+    ctx = await _deploy_config(base_config, tmp_path)
+    syncer = Sync(ctx)
+    syncer.from_paths = Paths(tmp_path / "source")
+    variant = syncer.from_paths.versions / "x86-64-v3"
+    for name in ("0.0.0+1", "0.0.0+2"):
+        (variant / name).mkdir(parents=True)
+        (variant / name / "manifest").write_text(name)
+    (ctx.staging_paths.versions / "x86-64-v3" / "0.0.0+1").mkdir(parents=True)
+    syncer._variants = ["x86-64-v3"]
+    syncer._env_paths = [variant]
+
+    plan = await syncer.plan(areas[0])
+    assert (plan.entries, plan.files, plan.nbytes) == (1, 1, len("0.0.0+2"))
+
+
+async def test_sync_plan_probes_one_area_at_a_time(tmp_path, base_config, mocker):
+    ctx = await _deploy_config(base_config, tmp_path)
+    running = 0
+    max_running = 0
+
+    async def check_call(self, area, *args, context=None, **kwargs):
+        nonlocal running, max_running
+        assert context == "probe"
+        running += 1
+        max_running = max(running, max_running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return ""
+
+    mocker.patch.object(Sync, "_bash", return_value="")
+    mocker.patch.object(Sync, "_check_call", check_call)
+    areas = [AreaConfig(name=name, host=name) for name in "abc"]
+
+    syncer = Sync(ctx)
+    plans = await asyncio.gather(*(syncer.plan(area) for area in areas))
+
+    assert all(plan.throughput > 0 for plan in plans)
+    assert max_running == 1
+
+
+async def test_sync_finds_link_dest_basis(tmp_path, base_config):
+    ctx = await _deploy_config(base_config, tmp_path)
+    syncer = Sync(ctx)
+    path = ctx.out("A", staging=False)
+
+    assert syncer._find_bases([path], []) == {}
+    assert syncer._find_bases(
+        [path], ["ffff-B-1.0.0", "eeee-A-0.0.0", "dddd-A-0.0.0"]
+    ) == {path: "eeee-A-0.0.0"}
@@ -90,3 +90,13 @@ async def test_carriage_return(capsys: pytest.CaptureFixture):
 
     # Nothing left to read
     assert capsys.readouterr() == ("", "")
+
+
+def test_directory_size(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub/a").write_bytes(b"x" * 100)
+    (tmp_path / "b").write_bytes(b"x" * 20)
+    (tmp_path / "link").symlink_to("sub/a")
+
+    size = utils.directory_size(tmp_path)
+    assert size == 120 + (tmp_path / "sub").lstat().st_size + len("sub/a")